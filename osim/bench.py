@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+## osim-rl benchmark suite
+# Measures import time and, for every bundled environment and model and
+# every integrator accuracy: model construction, first reset, reset and
+# steps per second. Results are written as JSON and two result files can
+# be compared to catch performance regressions.
+#
+#     osim-bench run -o before.json
+#     osim-bench run -o after.json --accuracies 5e-5,1e-3
+#     osim-bench compare before.json after.json --threshold 0.1
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+
+def _prosthetics(model, prosthetic):
+    def make(accuracy):
+        from osim.env import ProstheticsEnv
+        # The constructor loads the model of the class attributes, so that
+        # only the variant is loaded (not 3D_pros, then the variant)
+        variant = type("ProstheticsEnv", (ProstheticsEnv,), {"model": model, "prosthetic": prosthetic})
+        return variant(visualize = False, integrator_accuracy = accuracy)
+    return make
+
+def _env(name):
+    def make(accuracy):
+        import osim.env
+        return getattr(osim.env, name)(visualize = False, integrator_accuracy = accuracy)
+    return make
+
+def _legacy_run(accuracy):
+    from osim.env.legacy.run import RunEnv
+    return RunEnv(visualize = False)
+
+ENVS = {
+    "L2RunEnv": _env("L2RunEnv"),
+    "ProstheticsEnv-3D_pros": _prosthetics("3D", True),
+    "ProstheticsEnv-3D": _prosthetics("3D", False),
+    "ProstheticsEnv-2D_pros": _prosthetics("2D", True),
+    "ProstheticsEnv-2D": _prosthetics("2D", False),
+    "Arm2DEnv": _env("Arm2DEnv"),
+    "RunEnv": _legacy_run, # legacy, the integrator accuracy is not configurable
+}
+
+def list_cases():
+    cases = ["env:" + name for name in sorted(ENVS)]
+    cases += ["model:" + os.path.basename(path) for path in sorted(glob.glob(os.path.join(MODELS_DIR, '*.osim')))]
+    return cases
+
+def measure_import_time():
+    code = "import time; start = time.time(); import osim.env; print(time.time() - start)"
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return float(output.decode('utf-8').strip().split("\n")[-1])
+
+class ModelRunner(object):
+    """
+    Runs a bare OsimModel with random excitations, for models
+    which are not wrapped in an environment.
+    """
+    def __init__(self, path, accuracy):
+        from osim.env import OsimModel
+        self.model = OsimModel(path, False, integrator_accuracy = accuracy)
+
+    def reset(self):
+        self.model.reset()
+
+    def step(self, action):
+        self.model.actuate(action)
+        self.model.integrate()
+        return None, 0, False, {}
+
+    def action_size(self):
+        return self.model.get_action_space_size()
+
+def _make(case, accuracy):
+    kind, name = case.split(":", 1)
+    if kind == "env":
+        env = ENVS[name](accuracy)
+        return env, env.action_space.shape[0]
+    runner = ModelRunner(os.path.join(MODELS_DIR, name), accuracy)
+    return runner, runner.action_size()
+
+def run_case(case, accuracy, nsteps, nresets, seed = 0):
+    res = {"case": case, "accuracy": accuracy}
+    try:
+        start = time.time()
+        env, action_size = _make(case, accuracy)
+        res["construction"] = time.time() - start
+
+        start = time.time()
+        env.reset()
+        res["first_reset"] = time.time() - start
+
+        start = time.time()
+        for i in range(nresets):
+            env.reset()
+        res["reset"] = (time.time() - start) / nresets
+
+        random = np.random.RandomState(seed)
+        actions = random.uniform(size = (nsteps, action_size))
+        env.reset()
+        start = time.time()
+        for action in actions:
+            observation, reward, done, info = env.step(action)
+            if done:
+                env.reset()
+        res["steps_per_second"] = nsteps / (time.time() - start)
+    except Exception as e:
+        res["error"] = "{}: {}".format(type(e).__name__, e)
+    return res
+
+def run(cases, accuracies, nsteps, nresets, verbose = True):
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "steps": nsteps,
+            "resets": nresets,
+        },
+        "import_time": measure_import_time(),
+        "results": [],
+    }
+    for case in cases:
+        for accuracy in accuracies:
+            res = run_case(case, accuracy, nsteps, nresets)
+            results["results"].append(res)
+            if verbose:
+                print(format_result(res))
+                sys.stdout.flush()
+    return results
+
+def format_result(res):
+    if "error" in res:
+        return "%-44s %8.0e  ERROR %s" % (res["case"], res["accuracy"], res["error"])
+    return "%-44s %8.0e  construction %7.3f s  first reset %7.4f s  reset %7.4f s  %8.1f steps/s" % (
+        res["case"], res["accuracy"], res["construction"], res["first_reset"], res["reset"], res["steps_per_second"])
+
+# Metrics, and whether higher is better
+METRICS = [("construction", False), ("first_reset", False), ("reset", False), ("steps_per_second", True)]
+
+"""
+Compare two result files. Returns the list of regressions, i.e. metrics
+(and the import time) which got worse by more than `threshold` (relative
+change), cases which fail in `after` but not in `before`, and cases of
+`before` which are missing from `after`. A regression is a tuple
+(case, accuracy, metric, change), with metric "error" or "missing" and
+change None for failing and missing cases.
+"""
+def compare(before, after, threshold = 0.1, verbose = True):
+    regressions = []
+
+    def check(case, accuracy, metric, old, new, higher_is_better):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            regressions.append((case, accuracy, metric, change))
+            flag = "  REGRESSION"
+        if verbose:
+            print("%-44s %8s  %-16s %12.4g -> %12.4g  %+7.1f%%%s" % (
+                case, "" if accuracy is None else "%.0e" % accuracy, metric, old, new, change * 100, flag))
+
+    if "import_time" in before and "import_time" in after:
+        check("import", None, "import_time", before["import_time"], after["import_time"], False)
+
+    index = dict(((res["case"], res["accuracy"]), res) for res in after["results"])
+    for old in before["results"]:
+        if (old["case"], old["accuracy"]) not in index:
+            regressions.append((old["case"], old["accuracy"], "missing", None))
+            if verbose:
+                print("%-44s %8.0e  MISSING  REGRESSION" % (old["case"], old["accuracy"]))
+
+    index = dict(((res["case"], res["accuracy"]), res) for res in before["results"])
+    for res in after["results"]:
+        old = index.get((res["case"], res["accuracy"]))
+        if "error" in res:
+            if old is None or "error" not in old:
+                regressions.append((res["case"], res["accuracy"], "error", None))
+                if verbose:
+                    print("%-44s %8.0e  ERROR %s  REGRESSION" % (res["case"], res["accuracy"], res["error"]))
+            continue
+        if old is None or "error" in old:
+            continue
+        for metric, higher_is_better in METRICS:
+            check(res["case"], res["accuracy"], metric, old[metric], res[metric], higher_is_better)
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'osim-rl benchmark suite')
+    subparsers = parser.add_subparsers(dest = 'command')
+
+    run_parser = subparsers.add_parser('run', help = 'run the benchmarks')
+    run_parser.add_argument('-o', '--output', dest = 'output', default = None, help = 'JSON file for the results')
+    run_parser.add_argument('--cases', dest = 'cases', default = None, help = 'comma separated cases (see list), all by default')
+    run_parser.add_argument('--accuracies', dest = 'accuracies', default = '5e-5,1e-4,1e-3', help = 'comma separated integrator accuracies')
+    run_parser.add_argument('--steps', dest = 'steps', type = int, default = 200)
+    run_parser.add_argument('--resets', dest = 'resets', type = int, default = 10)
+
+    subparsers.add_parser('list', help = 'list the benchmark cases')
+
+    compare_parser = subparsers.add_parser('compare', help = 'compare two result files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', dest = 'threshold', type = float, default = 0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        print("\n".join(list_cases()))
+    elif args.command == 'run':
+        cases = args.cases.split(",") if args.cases else list_cases()
+        accuracies = [float(x) for x in args.accuracies.split(",")]
+        results = run(cases, accuracies, args.steps, args.resets)
+        print("import time %.3f s" % results["import_time"])
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent = 2)
+    elif args.command == 'compare':
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.threshold)
+        if regressions:
+            print("%d regression(s) above %.0f%%" % (len(regressions), args.threshold * 100))
+            return 1
+    else:
+        parser.print_help()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
 from __future__ import absolute_import
 #from .run import *
 from .osim import *
+from .vec import VecOsimEnv, OsimForkServer
@@ -0,0 +1,68 @@
+import os
+from collections import OrderedDict
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        # Not on Linux
+        return None
+
+## Model cache
+# LRU cache of constructed OsimModel instances, so that going back to a
+# model used before (e.g. ProstheticsEnv.change_model) does not parse and
+# initialize the .osim file again. At most `max_models` models are kept,
+# and, if `max_memory` (bytes) is set, the least recently used models are
+# dropped while the models take more memory than that. The memory of a
+# model is estimated as the growth of the resident memory of the process
+# while it was created (on Linux only), so it is only approximate.
+#
+# The models are the environment's own, a cache can't be shared between
+# environments.
+class ModelCache(object):
+    def __init__(self, max_models = 4, max_memory = None):
+        self.max_models = max_models
+        self.max_memory = max_memory
+        self.models = OrderedDict() # key -> (model, memory)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, create):
+        if key in self.models:
+            self.hits += 1
+            self.models.move_to_end(key)
+            return self.models[key][0]
+
+        self.misses += 1
+        before = _rss()
+        model = create()
+        after = _rss()
+        memory = max(after - before, 0) if before is not None and after is not None else 0
+        self.models[key] = (model, memory)
+        self.evict()
+        return model
+
+    def memory(self):
+        return sum(memory for model, memory in self.models.values())
+
+    # The most recently used model is always kept
+    def evict(self):
+        while len(self.models) > 1 and (len(self.models) > self.max_models or
+                                        (self.max_memory is not None and self.memory() > self.max_memory)):
+            self.models.popitem(last = False)
+            self.evictions += 1
+
+    def clear(self):
+        self.models.clear()
+
+    def __contains__(self, key):
+        return key in self.models
+
+    def __len__(self):
+        return len(self.models)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "models": len(self.models), "memory": self.memory()}
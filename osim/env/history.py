@@ -0,0 +1,46 @@
+import numpy as np
+
+## Ring buffer
+# The last `size` rows (state vectors, observations) in a preallocated
+# array. Every row is written twice, at i and i + size, so that the last
+# rows are always contiguous: `last()` is a view, not a copy. The view is
+# overwritten by the next `push`, copy it to keep it.
+class RingBuffer(object):
+    def __init__(self, size, width, dtype = np.float64):
+        self.size = size
+        self.width = width
+        self.data = np.zeros((2 * size, width), dtype = dtype)
+        self.count = 0
+
+    def push(self, row):
+        i = self.count % self.size
+        self.data[i] = row
+        self.data[i + self.size] = self.data[i]
+        self.count += 1
+
+    """
+    Fill the buffer with `row`, e.g. the first observation of an episode.
+    """
+    def fill(self, row):
+        self.data[:] = row
+        self.count = self.size
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    """
+    The last `k` rows (all by default), from the oldest to the newest.
+    """
+    def last(self, k = None):
+        if k is None:
+            k = self.size
+        end = (self.count - 1) % self.size + 1 + self.size
+        return self.data[end - k:end]
+
+    """
+    The row pushed `age` pushes ago (0 for the newest).
+    """
+    def get(self, age = 0):
+        if age >= len(self):
+            raise IndexError("Only %d rows in the buffer" % len(self))
+        return self.data[(self.count - 1) % self.size + self.size - age]
@@ -2,7 +2,7 @@ import opensim
 import math
 import numpy as np
 import os
-from .utils.mygym import convert_to_gym
+from ..utils.mygym import convert_to_gym
 import gym
 
 class Osim(object):
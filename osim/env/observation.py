@@ -0,0 +1,87 @@
+import fnmatch
+import numpy as np
+
+## Observation spec
+# A declarative description of an observation vector, compiled once into
+# index arrays into the flat state vector (OsimModel.state_index). Building
+# an observation is then one gather, one subtraction for the values
+# relative to another body and the zero padding.
+#
+#     spec = ObservationSpec()
+#     spec.add("joint_pos/ground_pelvis")
+#     spec.add("body_pos/head", 0, 2, relative_to = "body_pos/pelvis")
+#     spec.add("muscles/*/activation")      # all muscles, sorted by name
+#     spec.zeros(2, "padding")
+#     compiled = spec.compile(osim_model.state_index)
+#     observation = compiled.gather(osim_model.get_state_vector(compiled.fields))
+#     compiled.names                        # name of each value
+class ObservationSpec(object):
+    def __init__(self):
+        self.entries = []
+
+    """
+    Add the values [start:stop] of `field`, a name in the state index
+    which may contain wildcards (all matching fields, in sorted order).
+    With `relative_to`, the values [start:stop] of that field are subtracted.
+    """
+    def add(self, field, start = None, stop = None, relative_to = None):
+        self.entries.append((field, slice(start, stop), relative_to))
+        return self
+
+    def zeros(self, size, name = "zeros"):
+        self.entries.append((name, size, None))
+        return self
+
+    def compile(self, state_index):
+        return CompiledObservationSpec(self.entries, state_index)
+
+def _group(name):
+    # The field of the state description to read for a name of the index
+    parts = name.split("/")
+    return "/".join(parts[:2]) if parts[0] == "misc" else parts[0]
+
+class CompiledObservationSpec(object):
+    def __init__(self, entries, state_index):
+        self.state_index = state_index
+        self.names = []
+        indices, zeros, relative, reference = [], [], [], []
+        fields = set()
+
+        for field, part, relative_to in entries:
+            if not isinstance(part, slice):
+                zeros += range(len(indices), len(indices) + part)
+                indices += [0] * part
+                self.names += ["%s/%d" % (field, i) for i in range(part)]
+                continue
+
+            keys = sorted(fnmatch.filter(state_index.keys(), field)) if "*" in field else [field]
+            if not keys or keys[0] not in state_index:
+                raise KeyError("%s is not in the state index" % field)
+            for key in keys:
+                positions = list(range(state_index[key].start, state_index[key].stop))[part]
+                fields.add(_group(key))
+                if relative_to is not None:
+                    references = list(range(state_index[relative_to].start, state_index[relative_to].stop))[part]
+                    if len(references) != len(positions):
+                        raise ValueError("%s and %s have different sizes" % (key, relative_to))
+                    relative += range(len(indices), len(indices) + len(positions))
+                    reference += references
+                    fields.add(_group(relative_to))
+                start = part.start or 0
+                self.names += ["%s/%d" % (key, start + i) for i in range(len(positions))]
+                indices += positions
+
+        self.indices = np.array(indices, dtype = np.intp)
+        self.zeros = np.array(zeros, dtype = np.intp)
+        self.relative = np.array(relative, dtype = np.intp)
+        self.reference = np.array(reference, dtype = np.intp)
+        self.fields = sorted(fields)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def gather(self, vector):
+        observation = vector[self.indices]
+        observation[self.relative] -= vector[self.reference]
+        observation[self.zeros] = 0
+        return observation
@@ -1,10 +1,107 @@
+import copy
 import math
 import numpy as np
 import os
 from .utils.mygym import convert_to_gym
+from .profiler import StepProfiler
+from .history import RingBuffer
+from .cache import ModelCache
+from .observation import ObservationSpec
+from .recorder import TrajectoryRecorder
 import gym
 import opensim
 import random
+import time
+from collections import OrderedDict, namedtuple
+
+## Description of the state
+# A dictionary filled group by group on first access (for example
+# state_desc["body_pos"]), so that we only realize the Simbody stage
+# and only read the values that are actually used. Fields can be
+# given as "group" or "group/key" for nested groups ("misc/mass_center_pos").
+# Once the simulation moves on, the description is frozen: only the
+# groups already read and the environment's `state_desc_fields` are kept
+# (all the groups if it is None). Iterating reads all the groups which
+# can be read.
+class StateDesc(dict):
+    vector = None # row of OsimModel.state_buffer, if flat_state is on
+
+    def __init__(self, readers):
+        super(StateDesc, self).__init__()
+        self.readers = readers
+        self.frozen = False
+
+    def __missing__(self, key):
+        if key not in self.readers:
+            raise KeyError(key)
+        if self.frozen:
+            raise KeyError("'%s' was not read before the simulation moved on. Add it to state_desc_fields." % key)
+        self.update(self.readers[key]())
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (not self.frozen and key in self.readers)
+
+    def __bool__(self):
+        return len(self.readers) > 0 or dict.__len__(self) > 0
+    __nonzero__ = __bool__
+
+    def __len__(self):
+        return dict.__len__(self._all())
+
+    def __iter__(self):
+        return dict.__iter__(self._all())
+
+    def keys(self):
+        return dict.keys(self._all())
+
+    def values(self):
+        return dict.values(self._all())
+
+    def items(self):
+        return dict.items(self._all())
+
+    def _all(self):
+        if not self.frozen:
+            self.materialize()
+        return self
+
+    def get(self, key, default = None):
+        if key in self:
+            return self[key]
+        return default
+
+    def materialize(self, fields = None):
+        if fields is None:
+            fields = list(self.readers.keys())
+        for field in fields:
+            group, _, rest = field.partition("/")
+            value = self[group]
+            if isinstance(value, StateDesc):
+                value.materialize([rest] if rest else None)
+        return self
+
+    def freeze(self):
+        self.frozen = True
+        for value in dict.values(self):
+            if isinstance(value, StateDesc):
+                value.freeze()
+
+## Integrator statistics
+# What the Simbody integrator did during one call of OsimModel.integrate:
+# internal steps taken, failed steps (attempted but rejected), error and
+# convergence test failures, the size of the last internal step and the
+# number of realizations of the state. Adding statistics sums the counts
+# and keeps the last step size.
+class IntegratorStats(namedtuple("IntegratorStats", ["steps", "failed_steps", "error_test_failures",
+                                                     "convergence_test_failures", "step_size", "realizations"])):
+    __slots__ = ()
+
+    def __add__(self, other):
+        return IntegratorStats(self.steps + other.steps, self.failed_steps + other.failed_steps,
+                               self.error_test_failures + other.error_test_failures,
+                               self.convergence_test_failures + other.convergence_test_failures,
+                               other.step_size, self.realizations + other.realizations)
 
 ## OpenSim interface
 # The amin purpose of this class is to provide wrap all 
@@ -23,22 +120,50 @@ class OsimModel(object):
     model = None
     state = None
     state0 = None
+    cache_initial_state = True
+    model_version = 0 # incremented when properties of the model change, see model_changed
     joints = []
     bodies = []
     brain = None
+    brain_functions = []
     verbose = False
     istep = 0
     
+    state_plan = None
+    flat_state = False
+    state_index = None
+    state_buffer = None
     state_desc_istep = None
     prev_state_desc = None
     state_desc = None
+    state_desc_fields = None # fields kept in prev_state_desc, None for all
     integrator_accuracy = None
+    integrator = None
+    integrator_min_step = None
+    integrator_max_step = None
+    integrator_internal_step_limit = None
+    manager = None
+    restore_state = None
+    slow_step_time = None # wall time (s) above which a step is flagged, once it returns
+    max_internal_steps = None # budget of internal integrator steps per step
+    manager_internal_step_limit = None # limit set on the current manager
+    budget_exceeded = None # which budget the last integrate() exceeded
+    budget_counters = None
+    integrator_stats = False # collect IntegratorStats in integrate()
+    last_integrator_stats = None
 
     maxforces = []
     curforces = []
 
-    def __init__(self, model_path, visualize, integrator_accuracy = 5e-5):
+    def __init__(self, model_path, visualize, integrator_accuracy = 5e-5, flat_state = False,
+                 integrator = None, integrator_min_step = None, integrator_max_step = None, integrator_internal_step_limit = None,
+                 slow_step_time = None, max_internal_steps = None, integrator_stats = False):
         self.integrator_accuracy = integrator_accuracy
+        self.flat_state = flat_state
+        self.integrator_stats = integrator_stats
+        self.set_integrator(integrator, integrator_min_step, integrator_max_step, integrator_internal_step_limit)
+        self.set_step_budget(slow_step_time, max_internal_steps)
+        self.budget_counters = {"steps": 0, "wall_time": 0, "internal_steps": 0}
         self.model = opensim.Model(model_path)
         self.model.initSystem()
         self.brain = opensim.PrescribedController()
@@ -59,18 +184,41 @@ class OsimModel(object):
         # Add actuators as constant functions. Then, during simulations
         # we will change levels of constants.
         # One actuartor per each muscle
+        # We keep handles to the functions to update them without
+        # going through the controller set at every step
+        self.brain_functions = []
         for j in range(self.muscleSet.getSize()):
             func = opensim.Constant(1.0)
             self.brain.addActuator(self.muscleSet.get(j))
             self.brain.prescribeControlForActuator(j, func)
+            self.brain_functions.append(func)
 
             self.maxforces.append(self.muscleSet.get(j).getMaxIsometricForce())
             self.curforces.append(1.0)
 
         self.noutput = self.muscleSet.getSize()
+        self.excitations = np.ones(self.noutput)
             
         self.model.addController(self.brain)
+        self.init_system()
+
+    """
+    Initialize the system. Needs to be called again
+    whenever components are added to the model.
+    """
+    def init_system(self):
         self.model.initSystem()
+        self.model_changed()
+        self.build_state_plan()
+
+    """
+    To be called after changing properties of the model (e.g. muscle
+    strength): the initial state is computed again at the next reset and
+    what was computed from it (e.g. memoized reset observations) is dropped.
+    """
+    def model_changed(self):
+        self.state0 = None
+        self.model_version += 1
 
     def list_elements(self):
         print("JOINTS")
@@ -90,18 +238,26 @@ class OsimModel(object):
             print(i,self.markerSet.get(i).getName())
 
     def actuate(self, action):
-        if np.any(np.isnan(action)):
-            raise ValueError("NaN passed in the activation vector. Values in [0,1] interval are required.")
-
         # TODO: Check if actions within [0,1]
+        self.set_excitations(action)
         self.last_action = action
-            
-        brain = opensim.PrescribedController.safeDownCast(self.model.getControllerSet().get(0))
-        functionSet = brain.get_ControlFunctions()
 
-        for j in range(functionSet.getSize()):
-            func = opensim.Constant.safeDownCast(functionSet.get(j))
-            func.setValue( float(action[j]) )
+    """
+    Set all muscle excitations from an array. Only the control
+    functions whose value changed are updated in OpenSim.
+    """
+    def set_excitations(self, excitations):
+        excitations = np.asarray(excitations, dtype=np.float64)[:self.noutput]
+        if np.any(np.isnan(excitations)):
+            raise ValueError("NaN passed in the activation vector. Values in [0,1] interval are required.")
+
+        changed = np.flatnonzero(excitations != self.excitations)
+        if len(changed) == 0:
+            return
+        values = excitations.tolist()
+        for j in changed.tolist():
+            self.brain_functions[j].setValue(values[j])
+        self.excitations[changed] = excitations[changed]
 
     """
     Directly modifies activations in the current state.
@@ -109,6 +265,7 @@ class OsimModel(object):
     def set_activations(self, activations):
         if np.any(np.isnan(activations)):
             raise ValueError("NaN passed in the activation vector. Values in [0,1] interval are required.")
+        self.invalidate_state_desc()
         for j in range(self.muscleSet.getSize()):
             self.muscleSet.get(j).setActivation(self.state, activations[j])
         self.reset_manager()
@@ -119,89 +276,253 @@ class OsimModel(object):
     def get_activations(self):
         return [self.muscleSet.get(j).getActivation(self.state) for j in range(self.muscleSet.getSize())]
 
-    def compute_state_desc(self):
-        self.model.realizeAcceleration(self.state)
-
-        res = {}
-
-        ## Joints
-        res["joint_pos"] = {}
-        res["joint_vel"] = {}
-        res["joint_acc"] = {}
+    ## State read plan
+    # Resolve once all the components read by compute_state_desc
+    # (together with their names), so that at every step we do not
+    # walk the SWIG sets and rebuild the name strings again.
+    # Needs to be rebuilt if components are added to the model.
+    def build_state_plan(self):
+        plan = {}
+        plan["joints"] = []
         for i in range(self.jointSet.getSize()):
             joint = self.jointSet.get(i)
-            name = joint.getName()
-            res["joint_pos"][name] = [joint.get_coordinates(i).getValue(self.state) for i in range(joint.numCoordinates())]
-            res["joint_vel"][name] = [joint.get_coordinates(i).getSpeedValue(self.state) for i in range(joint.numCoordinates())]
-            res["joint_acc"][name] = [joint.get_coordinates(i).getAccelerationValue(self.state) for i in range(joint.numCoordinates())]
-
-        ## Bodies
-        res["body_pos"] = {}
-        res["body_vel"] = {}
-        res["body_acc"] = {}
-        res["body_pos_rot"] = {}
-        res["body_vel_rot"] = {}
-        res["body_acc_rot"] = {}
-        for i in range(self.bodySet.getSize()):
-            body = self.bodySet.get(i)
-            name = body.getName()
-            res["body_pos"][name] = [body.getTransformInGround(self.state).p()[i] for i in range(3)]
-            res["body_vel"][name] = [body.getVelocityInGround(self.state).get(1).get(i) for i in range(3)]
-            res["body_acc"][name] = [body.getAccelerationInGround(self.state).get(1).get(i) for i in range(3)]
-            
-            res["body_pos_rot"][name] = [body.getTransformInGround(self.state).R().convertRotationToBodyFixedXYZ().get(i) for i in range(3)]
-            res["body_vel_rot"][name] = [body.getVelocityInGround(self.state).get(0).get(i) for i in range(3)]
-            res["body_acc_rot"][name] = [body.getAccelerationInGround(self.state).get(0).get(i) for i in range(3)]
+            coordinates = [joint.get_coordinates(j) for j in range(joint.numCoordinates())]
+            plan["joints"].append((joint.getName(), coordinates))
+
+        plan["bodies"] = [(body.getName(), body) for body in [self.bodySet.get(i) for i in range(self.bodySet.getSize())]]
+        plan["forces"] = [(force.getName(), force) for force in [self.forceSet.get(i) for i in range(self.forceSet.getSize())]]
+        plan["muscles"] = [(muscle.getName(), muscle) for muscle in [self.muscleSet.get(i) for i in range(self.muscleSet.getSize())]]
+        plan["markers"] = [(marker.getName(), marker) for marker in [self.markerSet.get(i) for i in range(self.markerSet.getSize())]]
+
+        self.state_plan = plan
+
+        if self.flat_state:
+            self.build_state_index()
+
+    ## Readers of the state description
+    # Each reader realizes only the Simbody stage it needs and
+    # returns one or more groups of the state description
+    def _read_joint_pos(self, state):
+        self.model.realizePosition(state)
+        return {"joint_pos": dict((name, [coordinate.getValue(state) for coordinate in coordinates]) for name, coordinates in self.state_plan["joints"])}
+
+    def _read_joint_vel(self, state):
+        self.model.realizeVelocity(state)
+        return {"joint_vel": dict((name, [coordinate.getSpeedValue(state) for coordinate in coordinates]) for name, coordinates in self.state_plan["joints"])}
+
+    def _read_joint_acc(self, state):
+        self.model.realizeAcceleration(state)
+        return {"joint_acc": dict((name, [coordinate.getAccelerationValue(state) for coordinate in coordinates]) for name, coordinates in self.state_plan["joints"])}
+
+    def _read_body_pos(self, state):
+        self.model.realizePosition(state)
+        res = {"body_pos": {}, "body_pos_rot": {}}
+        for name, body in self.state_plan["bodies"]:
+            # The transform is fetched once per body
+            transform = body.getTransformInGround(state)
+            pos = transform.p()
+            rot = transform.R().convertRotationToBodyFixedXYZ()
+            res["body_pos"][name] = [pos[0], pos[1], pos[2]]
+            res["body_pos_rot"][name] = [rot.get(0), rot.get(1), rot.get(2)]
+        return res
 
-        ## Forces
-        res["forces"] = {}
-        for i in range(self.forceSet.getSize()):
-            force = self.forceSet.get(i)
-            name = force.getName()
-            values = force.getRecordValues(self.state)
-            res["forces"][name] = [values.get(i) for i in range(values.size())]
+    def _read_body_vel(self, state):
+        self.model.realizeVelocity(state)
+        res = {"body_vel": {}, "body_vel_rot": {}}
+        for name, body in self.state_plan["bodies"]:
+            vel = body.getVelocityInGround(state)
+            lin, rot = vel.get(1), vel.get(0)
+            res["body_vel"][name] = [lin.get(0), lin.get(1), lin.get(2)]
+            res["body_vel_rot"][name] = [rot.get(0), rot.get(1), rot.get(2)]
+        return res
 
-        ## Muscles
-        res["muscles"] = {}
-        for i in range(self.muscleSet.getSize()):
-            muscle = self.muscleSet.get(i)
-            name = muscle.getName()
-            res["muscles"][name] = {}
-            res["muscles"][name]["activation"] = muscle.getActivation(self.state)
-            res["muscles"][name]["fiber_length"] = muscle.getFiberLength(self.state)
-            res["muscles"][name]["fiber_velocity"] = muscle.getFiberVelocity(self.state)
-            res["muscles"][name]["fiber_force"] = muscle.getFiberForce(self.state)
+    def _read_body_acc(self, state):
+        self.model.realizeAcceleration(state)
+        res = {"body_acc": {}, "body_acc_rot": {}}
+        for name, body in self.state_plan["bodies"]:
+            acc = body.getAccelerationInGround(state)
+            lin, rot = acc.get(1), acc.get(0)
+            res["body_acc"][name] = [lin.get(0), lin.get(1), lin.get(2)]
+            res["body_acc_rot"][name] = [rot.get(0), rot.get(1), rot.get(2)]
+        return res
+
+    def _read_forces(self, state):
+        self.model.realizeDynamics(state)
+        res = {}
+        for name, force in self.state_plan["forces"]:
+            values = force.getRecordValues(state)
+            res[name] = [values.get(i) for i in range(values.size())]
+        return {"forces": res}
+
+    def _read_muscles(self, state):
+        self.model.realizeDynamics(state)
+        res = {}
+        for name, muscle in self.state_plan["muscles"]:
+            res[name] = {}
+            res[name]["activation"] = muscle.getActivation(state)
+            res[name]["fiber_length"] = muscle.getFiberLength(state)
+            res[name]["fiber_velocity"] = muscle.getFiberVelocity(state)
+            res[name]["fiber_force"] = muscle.getFiberForce(state)
             # We can get more properties from here http://myosin.sourceforge.net/2125/classOpenSim_1_1Muscle.html 
-        
-        ## Markers
-        res["markers"] = {}
-        for i in range(self.markerSet.getSize()):
-            marker = self.markerSet.get(i)
-            name = marker.getName()
-            res["markers"][name] = {}
-            res["markers"][name]["pos"] = [marker.getLocationInGround(self.state)[i] for i in range(3)]
-            res["markers"][name]["vel"] = [marker.getVelocityInGround(self.state)[i] for i in range(3)]
-            res["markers"][name]["acc"] = [marker.getAccelerationInGround(self.state)[i] for i in range(3)]
-
-        ## Other
-        res["misc"] = {}
-        res["misc"]["mass_center_pos"] = [self.model.calcMassCenterPosition(self.state)[i] for i in range(2)]
-        res["misc"]["mass_center_vel"] = [self.model.calcMassCenterVelocity(self.state)[i] for i in range(2)]
-        res["misc"]["mass_center_acc"] = [self.model.calcMassCenterAcceleration(self.state)[i] for i in range(2)]
+        return {"muscles": res}
 
-        return res
+    def _read_markers(self, state):
+        self.model.realizeAcceleration(state)
+        res = {}
+        for name, marker in self.state_plan["markers"]:
+            pos = marker.getLocationInGround(state)
+            vel = marker.getVelocityInGround(state)
+            acc = marker.getAccelerationInGround(state)
+            res[name] = {}
+            res[name]["pos"] = [pos[0], pos[1], pos[2]]
+            res[name]["vel"] = [vel[0], vel[1], vel[2]]
+            res[name]["acc"] = [acc[0], acc[1], acc[2]]
+        return {"markers": res}
+
+    def _read_mass_center_pos(self, state):
+        self.model.realizePosition(state)
+        pos = self.model.calcMassCenterPosition(state)
+        return {"mass_center_pos": [pos[0], pos[1]]}
+
+    def _read_mass_center_vel(self, state):
+        self.model.realizeVelocity(state)
+        vel = self.model.calcMassCenterVelocity(state)
+        return {"mass_center_vel": [vel[0], vel[1]]}
+
+    def _read_mass_center_acc(self, state):
+        self.model.realizeAcceleration(state)
+        acc = self.model.calcMassCenterAcceleration(state)
+        return {"mass_center_acc": [acc[0], acc[1]]}
+
+    ## Flat state vector
+    # Optionally (flat_state = True), all the values of the state description
+    # are also written to one preallocated float64 array, with `state_index`
+    # mapping names such as "body_pos/pelvis" or "muscles/soleus_r/activation"
+    # to slices of that array. The dictionary then holds views of the array.
+    # Two rows are used in turns, so that prev_state_desc stays valid.
+    def build_state_index(self):
+        sizes = []
+        for group in ["joint_pos", "joint_vel", "joint_acc"]:
+            sizes += [(group + "/" + name, len(coordinates)) for name, coordinates in self.state_plan["joints"]]
+        for group in ["body_pos", "body_pos_rot", "body_vel", "body_vel_rot", "body_acc", "body_acc_rot"]:
+            sizes += [(group + "/" + name, 3) for name, body in self.state_plan["bodies"]]
+        sizes += [("forces/" + name, force.getRecordLabels().size()) for name, force in self.state_plan["forces"]]
+        for name, muscle in self.state_plan["muscles"]:
+            sizes += [("muscles/" + name + "/" + key, 1) for key in ["activation", "fiber_length", "fiber_velocity", "fiber_force"]]
+        for name, marker in self.state_plan["markers"]:
+            sizes += [("markers/" + name + "/" + key, 3) for key in ["pos", "vel", "acc"]]
+        sizes += [("misc/" + key, 2) for key in ["mass_center_pos", "mass_center_vel", "mass_center_acc"]]
+
+        self.state_index = OrderedDict()
+        start = 0
+        for name, size in sizes:
+            self.state_index[name] = slice(start, start + size)
+            start += size
+
+        self.state_buffer = np.zeros((2, start))
+        self.state_buffer_row = 0
+
+    def _store_state_values(self, values, row, prefix = ""):
+        for key, value in values.items():
+            name = prefix + key
+            if isinstance(value, dict):
+                self._store_state_values(value, row, name + "/")
+            elif name in self.state_index:
+                row[self.state_index[name]] = value
+                if isinstance(value, list):
+                    values[key] = row[self.state_index[name]]
+        return values
 
-    def get_state_desc(self):
+    """
+    The description of `state`, whose values are also written to `row`
+    (an array of the size of the state index) if given.
+    """
+    def create_state_desc(self, state, row = None):
+        def read(reader, prefix = ""):
+            if row is None:
+                return lambda: reader(state)
+            return lambda: self._store_state_values(reader(state), row, prefix)
+
+        misc = {
+            "mass_center_pos": read(self._read_mass_center_pos, "misc/"),
+            "mass_center_vel": read(self._read_mass_center_vel, "misc/"),
+            "mass_center_acc": read(self._read_mass_center_acc, "misc/"),
+        }
+        readers = {
+            "joint_pos": read(self._read_joint_pos),
+            "joint_vel": read(self._read_joint_vel),
+            "joint_acc": read(self._read_joint_acc),
+            "body_pos": read(self._read_body_pos),
+            "body_pos_rot": read(self._read_body_pos),
+            "body_vel": read(self._read_body_vel),
+            "body_vel_rot": read(self._read_body_vel),
+            "body_acc": read(self._read_body_acc),
+            "body_acc_rot": read(self._read_body_acc),
+            "forces": read(self._read_forces),
+            "muscles": read(self._read_muscles),
+            "markers": read(self._read_markers),
+            "misc": lambda: {"misc": StateDesc(misc)},
+        }
+        state_desc = StateDesc(readers)
+        state_desc.vector = row
+        return state_desc
+
+    """
+    A new description of the current state with `fields` read (all by
+    default). Its vector (flat_state) is its own, the rows of
+    state_buffer used by get_state_desc are left alone.
+    """
+    def compute_state_desc(self, fields = None):
+        row = np.full(self.state_buffer.shape[1], np.nan) if self.flat_state else None
+        return self.create_state_desc(self.state, row).materialize(fields)
+
+    def _next_state_buffer_row(self):
+        if not self.flat_state:
+            return None
+        self.state_buffer_row = 1 - self.state_buffer_row
+        row = self.state_buffer[self.state_buffer_row]
+        row.fill(np.nan)
+        return row
+
+    """
+    Get the description of the current state. Groups are read
+    lazily on first access, `fields` are read right away.
+    """
+    def get_state_desc(self, fields = None):
         if self.state_desc_istep != self.istep:
             self.prev_state_desc = self.state_desc
-            self.state_desc = self.compute_state_desc()
+            self.state_desc = self.create_state_desc(self.state, self._next_state_buffer_row())
             self.state_desc_istep = self.istep
+        if fields:
+            self.state_desc.materialize(fields)
         return self.state_desc
 
+    """
+    Get the current state as a flat vector (requires flat_state = True).
+    Use `state_index` to find the values. Groups which were not read are NaN.
+    """
+    def get_state_vector(self, fields = None):
+        return self.get_state_desc(fields).vector
+
+    """
+    The simulation is about to leave the current state: read
+    `state_desc_fields` from it and freeze the description.
+    """
+    def seal_state_desc(self):
+        if self.state_desc is not None and self.state_desc_istep == self.istep:
+            self.state_desc.materialize(self.state_desc_fields)
+            self.state_desc.freeze()
+
+    def invalidate_state_desc(self):
+        self.seal_state_desc()
+        self.state_desc_istep = None
+
     def set_strength(self, strength):
         self.curforces = strength
         for i in range(len(self.curforces)):
             self.muscleSet.get(i).setMaxIsometricForce(self.curforces[i] * self.maxforces[i])
+        # The muscle equilibrium of the initial state depends on the strength
+        self.model_changed()
 
     def get_body(self, name):
         return self.bodySet.get(name)
@@ -227,15 +548,73 @@ class OsimModel(object):
     def set_integrator_accuracy(self, integrator_accuracy):
         self.integrator_accuracy = integrator_accuracy
 
+    """
+    Select the integration scheme by the name of its OpenSim
+    Manager.IntegratorMethod (e.g. "RungeKuttaMerson", the default,
+    "SemiExplicitEuler2" or "CPodes" if available) and the step control.
+    None keeps the OpenSim default. Applies from the next reset.
+    """
+    def set_integrator(self, integrator = None, min_step = None, max_step = None, internal_step_limit = None):
+        if integrator is not None and not hasattr(opensim.Manager, "IntegratorMethod_" + integrator):
+            available = [name[len("IntegratorMethod_"):] for name in dir(opensim.Manager) if name.startswith("IntegratorMethod_")]
+            raise ValueError("Unknown integrator %s. Available integrators: %s" % (integrator, ", ".join(available)))
+        self.integrator = integrator
+        self.integrator_min_step = min_step
+        self.integrator_max_step = max_step
+        self.integrator_internal_step_limit = internal_step_limit
+
+    """
+    Limit the number of internal integrator steps spent on one step of the
+    simulation, and flag steps slower than `slow_step_time` seconds. The
+    internal steps bound the integration itself: the integrator returns
+    before the end of the step when it reaches them. The wall time does not
+    interrupt a step, it is only compared once the step returns. integrate()
+    sets `budget_exceeded` to "internal_steps" or "wall_time" accordingly.
+    """
+    def set_step_budget(self, slow_step_time = None, max_internal_steps = None):
+        self.slow_step_time = slow_step_time
+        self.max_internal_steps = max_internal_steps
+        # The limit of a previous budget stays on the manager otherwise
+        if self.manager is not None and max_internal_steps is None:
+            self.set_manager_internal_step_limit(None)
+
     def reset_manager(self):
         self.manager = opensim.Manager(self.model)
+        # The method needs to be set first, it recreates the integrator
+        if self.integrator is not None:
+            self.manager.setIntegratorMethod(getattr(opensim.Manager, "IntegratorMethod_" + self.integrator))
         self.manager.setIntegratorAccuracy(self.integrator_accuracy)
+        if self.integrator_min_step is not None:
+            self.manager.setIntegratorMinimumStepSize(self.integrator_min_step)
+        if self.integrator_max_step is not None:
+            self.manager.setIntegratorMaximumStepSize(self.integrator_max_step)
+        self.manager_internal_step_limit = self.integrator_internal_step_limit
+        if self.integrator_internal_step_limit is not None:
+            self.manager.setIntegratorInternalStepLimit(self.integrator_internal_step_limit)
         self.manager.initialize(self.state)
 
+    """
+    Set the internal step limit of the current manager, capped by
+    `integrator_internal_step_limit`. None restores that limit, or no
+    limit (-1 for Simbody) if there is none.
+    """
+    def set_manager_internal_step_limit(self, limit):
+        if self.integrator_internal_step_limit is not None:
+            limit = self.integrator_internal_step_limit if limit is None else min(limit, self.integrator_internal_step_limit)
+        if limit != self.manager_internal_step_limit:
+            self.manager.setIntegratorInternalStepLimit(-1 if limit is None else limit)
+            self.manager_internal_step_limit = limit
+
     def reset(self):
-        self.state = self.model.initializeState()
+        self.invalidate_state_desc()
+
+        # The default state is computed once and copied at every reset
+        if self.state0 is None or not self.cache_initial_state:
+            self.state0 = opensim.State(self.model.initializeState())
+        self.state = opensim.State(self.state0)
         self.state.setTime(0)
         self.istep = 0
+        self.restore_state = None
 
         self.reset_manager()
 
@@ -243,19 +622,127 @@ class OsimModel(object):
         return opensim.State(self.state)
 
     def set_state(self, state):
+        self.invalidate_state_desc()
         self.state = state
+        self.restore_state = None
         self.reset_manager()
 
-    def integrate(self):
+    ## Snapshots
+    # A compact record of the time, the continuous state Y (Q, U and Z,
+    # which includes muscle activations and fiber lengths) and the muscle
+    # excitations. Discrete variables (e.g. locked coordinates) are kept
+    # from the state of the last reset/set_state.
+    def snapshot(self):
+        y = self.get_y()
+        record = np.zeros((), dtype=[("time", np.float64), ("istep", np.int64),
+                                     ("excitations", np.float64, (self.noutput,)),
+                                     ("y", np.float64, (len(y),))])
+        record["time"] = self.state.getTime()
+        record["istep"] = self.istep
+        record["excitations"] = self.excitations
+        record["y"] = y
+        return record
+
+    """
+    The continuous state Y of the current state as an array.
+    """
+    def get_y(self):
+        y = self.state.getY()
+        # One copy of the whole vector where the bindings have it (OpenSim >= 4.1),
+        # element by element otherwise
+        if hasattr(y, "to_numpy"):
+            return np.array(y.to_numpy(), dtype=np.float64)
+        ny = y.size()
+        return np.fromiter((y[i] for i in range(ny)), dtype=np.float64, count=ny)
+
+    def restore_snapshot(self, record):
+        self.invalidate_state_desc()
+
+        # The record is written in a state owned by us, since self.state
+        # usually belongs to the manager
+        if self.restore_state is None:
+            self.restore_state = opensim.State(self.state)
+        state = self.restore_state
+        state.setTime(float(record["time"]))
+        # One copy of the whole vector where the bindings have it (OpenSim >= 4.1),
+        # element by element otherwise
+        if hasattr(opensim.Vector, "createFromMat"):
+            state.setY(opensim.Vector.createFromMat(np.ascontiguousarray(record["y"], dtype=np.float64)))
+        else:
+            y = state.updY()
+            for i, value in enumerate(record["y"].tolist()):
+                y[i] = value
+
+        self.set_excitations(record["excitations"])
+        self.istep = int(record["istep"])
+        self.state = state
+        self.reset_manager()
+
+    def integrate(self, nsteps = 1):
+        self.seal_state_desc()
+
         # Define the new endtime of the simulation
-        self.istep = self.istep + 1
+        self.istep = self.istep + nsteps
+        self.budget_exceeded = None
+        counts = self._integrator_counts() if self.integrator_stats else None
 
         # Integrate till the new endtime
         try:
-            self.state = self.manager.integrate(self.stepsize * self.istep)
+            if self.slow_step_time is None and self.max_internal_steps is None:
+                self.state = self.manager.integrate(self.stepsize * self.istep)
+            else:
+                self.integrate_with_budget(nsteps)
         except Exception as e:
             print (e)
 
+        if counts is not None:
+            self.last_integrator_stats = self._integrator_stats_since(counts)
+
+    def _integrator(self):
+        try:
+            return self.manager.getIntegrator()
+        except AttributeError:
+            # Not exposed by this version of OpenSim
+            return None
+
+    def _internal_steps(self):
+        integrator = self._integrator()
+        return integrator.getNumStepsTaken() if integrator is not None else None
+
+    def _integrator_counts(self):
+        integrator = self._integrator()
+        if integrator is None:
+            return None
+        return (integrator.getNumStepsTaken(), integrator.getNumStepsAttempted(), integrator.getNumErrorTestFailures(),
+                integrator.getNumConvergenceTestFailures(), integrator.getNumRealizations())
+
+    def _integrator_stats_since(self, counts):
+        integrator = self._integrator()
+        taken, attempted, error_failures, convergence_failures, realizations = [
+            now - before for now, before in zip(self._integrator_counts(), counts)]
+        return IntegratorStats(taken, attempted - taken, error_failures, convergence_failures,
+                               integrator.getPreviousStepSizeTaken(), realizations)
+
+    def integrate_with_budget(self, nsteps):
+        self.budget_counters["steps"] += 1
+        start_time, start_steps = time.perf_counter(), self._internal_steps()
+        t1 = self.stepsize * self.istep
+
+        # The whole step in one call, the integrator returns early when it
+        # reaches the internal steps budget
+        if self.max_internal_steps is not None:
+            self.set_manager_internal_step_limit(self.max_internal_steps * nsteps)
+        self.state = self.manager.integrate(t1)
+
+        # Only flagged here, the wall time cannot interrupt manager.integrate
+        if self.slow_step_time is not None and time.perf_counter() - start_time > self.slow_step_time * nsteps:
+            self.budget_exceeded = "wall_time"
+        elif self.max_internal_steps is not None and (self.state.getTime() < t1 - 1e-9 * self.stepsize or
+              (start_steps is not None and self._internal_steps() - start_steps > self.max_internal_steps * nsteps)):
+            self.budget_exceeded = "internal_steps"
+        if self.budget_exceeded:
+            self.budget_counters[self.budget_exceeded] += 1
+
 
 class Spec(object):
     def __init__(self, *args, **kwargs):
@@ -278,10 +765,50 @@ class OsimEnv(gym.Env):
     verbose = False
 
     visualize = False
+    flat_state = False
+    model_options = {}
+    profiler = None
     spec = None
     time_limit = 1e10
 
     prev_state_desc = None
+    # Fields of the state description used by the environment, None for
+    # all. Only these are kept in prev_state_desc (and in state_history),
+    # so subclasses reading more from get_prev_state_desc() widen the list.
+    state_desc_fields = None
+
+    # Number of simulation steps for which each action is repeated
+    frame_skip = 1
+    # Whether the reward over several steps is the reward between the first
+    # and the last state (e.g. a distance travelled). With frame_skip, such
+    # environments are integrated in a single call and is_done is only
+    # checked at the end.
+    telescoping_reward = False
+
+    # Number of observations stacked in the returned observation, and
+    # number of state vectors (flat_state) kept in state_history
+    frame_stack = 1
+    state_history_size = 0
+    observation_history = None
+    state_history = None
+
+    # Return observations as NumPy arrays of this dtype, written in
+    # observation_buffer (None for the lists of get_observation)
+    observation_dtype = None
+    observation_buffer = None
+
+    # ModelCache of the models loaded by load_model (or its maximum
+    # number of models), None to create a new model at every load
+    model_cache = None
+
+    # TrajectoryRecorder of the steps (or its directory), None not to record
+    recorder = None
+
+    compiled_observation_spec = None
+
+    # Whether the observation after reset only depends on the model
+    memoize_reset_observation = False
+    reset_observation = None
 
     model_path = None # os.path.join(os.path.dirname(__file__), '../models/MODEL_NAME.osim')    
 
@@ -296,16 +823,41 @@ class OsimEnv(gym.Env):
     def is_done(self):
         return False
 
-    def __init__(self, visualize = True, integrator_accuracy = 5e-5):
+    # Other options (integrator, integrator_min_step, integrator_max_step,
+    # integrator_internal_step_limit) are passed to OsimModel
+    def __init__(self, visualize = True, integrator_accuracy = 5e-5, flat_state = False, frame_skip = 1, profile = False,
+                 frame_stack = 1, state_history_size = 0, model_cache = None, observation_dtype = None, recorder = None,
+                 **model_options):
         self.visualize = visualize
         self.integrator_accuracy = integrator_accuracy
+        self.flat_state = flat_state
+        self.frame_skip = frame_skip
+        self.frame_stack = frame_stack
+        self.state_history_size = state_history_size
+        self.observation_dtype = np.dtype(observation_dtype) if observation_dtype is not None else None
+        self.model_options = model_options
+        if model_cache is not None:
+            self.model_cache = model_cache
+        if not self.model_cache:
+            self.model_cache = None
+        elif not isinstance(self.model_cache, ModelCache):
+            self.model_cache = ModelCache(self.model_cache)
+        if recorder is not None:
+            self.recorder = recorder if isinstance(recorder, TrajectoryRecorder) else TrajectoryRecorder(recorder)
+        if profile:
+            self.profiler = profile if isinstance(profile, StepProfiler) else StepProfiler()
         self.load_model()
+        if self.profiler:
+            self.profiler.instrument_env(self)
 
     def load_model(self, model_path = None):
         if model_path:
             self.model_path = model_path
             
-        self.osim_model = OsimModel(self.model_path, self.visualize, integrator_accuracy = self.integrator_accuracy)
+        if self.model_cache is not None:
+            self.osim_model = self.model_cache.get(self.model_path, self.create_model)
+        else:
+            self.osim_model = self.create_model()
 
         # Create specs, action and observation spaces mocks for compatibility with OpenAI gym
         self.spec = Spec()
@@ -313,11 +865,27 @@ class OsimEnv(gym.Env):
 
         self.action_space = ( [0.0] * self.osim_model.get_action_space_size(), [1.0] * self.osim_model.get_action_space_size() )
 #        self.observation_space = ( [-math.pi*100] * self.get_observation_space_size(), [math.pi*100] * self.get_observation_space_s
-        self.observation_space = ( [0] * self.get_observation_space_size(), [0] * self.get_observation_space_size() )
+        self.observation_space = ( [0] * self.get_observation_space_size() * self.frame_stack, [0] * self.get_observation_space_size() * self.frame_stack )
         
         self.action_space = convert_to_gym(self.action_space)
         self.observation_space = convert_to_gym(self.observation_space)
 
+        self.observation_history = None
+        if self.frame_stack > 1:
+            self.observation_history = RingBuffer(self.frame_stack, self.get_observation_space_size(), dtype = self.observation_dtype or np.float64)
+        self.state_history = None
+        if self.state_history_size:
+            if not self.flat_state:
+                raise ValueError("state_history_size requires flat_state = True")
+            self.state_history = RingBuffer(self.state_history_size, self.osim_model.state_buffer.shape[1])
+
+    def create_model(self):
+        osim_model = OsimModel(self.model_path, self.visualize, integrator_accuracy = self.integrator_accuracy, flat_state = self.flat_state, **self.model_options)
+        osim_model.state_desc_fields = self.state_desc_fields
+        if self.profiler:
+            self.profiler.instrument_model(osim_model)
+        return osim_model
+
     def get_state_desc(self):
         return self.osim_model.get_state_desc()
 
@@ -332,58 +900,207 @@ class OsimEnv(gym.Env):
     def get_observation_space_size(self):
         return 0
 
+    """
+    Declarative description of the observation (an ObservationSpec), or
+    None. With flat_state, the environments use it in get_observation.
+    """
+    def get_observation_spec(self):
+        return None
+
+    def _compiled_observation_spec(self):
+        if self.osim_model.state_index is None:
+            self.osim_model.build_state_index()
+        spec = self.compiled_observation_spec
+        # The index is rebuilt whenever the model is initialized again
+        if spec is None or spec.state_index is not self.osim_model.state_index:
+            spec = self.compiled_observation_spec = self.get_observation_spec().compile(self.osim_model.state_index)
+        return spec
+
+    def gather_observation(self):
+        spec = self._compiled_observation_spec()
+        return spec.gather(self.osim_model.get_state_vector(spec.fields))
+
+    """
+    Name of each value of the observation (see get_observation_spec).
+    """
+    def get_observation_names(self):
+        return list(self._compiled_observation_spec().names)
+
     def get_action_space_size(self):
         return self.osim_model.get_action_space_size()
 
-    def reset(self, project = True):
+    """
+    Add the observation to the history and return the last `frame_stack`
+    observations, as a view of the history (valid until the next step).
+    """
+    def stack_observation(self, observation, reset = False):
+        if self.observation_history is None:
+            return observation
+        if reset:
+            self.observation_history.fill(observation)
+        else:
+            self.observation_history.push(observation)
+        return self.observation_history.last().reshape(-1)
+
+    """
+    Write the observation in `out`, or in observation_buffer if
+    observation_dtype is set. The buffer is reused at every step.
+    """
+    def output_observation(self, observation, out = None):
+        if out is None:
+            if self.observation_dtype is None:
+                return observation
+            if self.observation_buffer is None or len(self.observation_buffer) != len(observation):
+                self.observation_buffer = np.empty(len(observation), dtype = self.observation_dtype)
+            out = self.observation_buffer
+        out[:] = observation
+        return out
+
+    def reset(self, project = True, out = None):
         self.osim_model.reset()
+        if self.state_history is not None:
+            self.state_history.fill(self.osim_model.get_state_desc().materialize(self.state_desc_fields).vector)
         
         if not project:
-            return self.get_state_desc()
-        return self.get_observation()
+            if self.recorder is not None:
+                self.recorder.reset(self.get_observation())
+            return self.get_state_desc().materialize()
+        if not self.memoize_reset_observation:
+            observation = self.output_observation(self.stack_observation(self.get_observation(), reset = True), out)
+        else:
+            # The initial state is the same in every episode of a given model,
+            # until its properties change
+            key = (self.osim_model, self.osim_model.model_version)
+            if self.reset_observation is None or self.reset_observation[0] != key:
+                self.reset_observation = (key, self.get_observation())
+            observation = self.reset_observation[1]
+            if self.observation_history is None and self.observation_dtype is None and out is None:
+                observation = copy.copy(observation)
+            else:
+                observation = self.output_observation(self.stack_observation(observation, reset = True), out)
+        if self.recorder is not None:
+            self.recorder.reset(observation)
+        return observation
 
-    def step(self, action, project = True):
+    def step(self, action, project = True, out = None):
         self.prev_state_desc = self.get_state_desc()        
         self.osim_model.actuate(action)
-        self.osim_model.integrate()
+
+        # With frame_skip, the action is repeated for several steps
+        # of the simulation (without going over the time limit)
+        nsteps = max(1, min(self.frame_skip, int(self.spec.timestep_limit - self.osim_model.istep)))
+        if nsteps > 1 and not self.telescoping_reward:
+            reward, done = self.skip_frames(nsteps)
+        else:
+            self.osim_model.integrate(nsteps)
+
+        # A step which went over the wall time or internal steps budget ends the episode
+        info = {}
+        budget_exceeded = self.osim_model.budget_exceeded
+        if budget_exceeded:
+            info["budget_exceeded"] = budget_exceeded
+        if self.osim_model.last_integrator_stats is not None:
+            info["integrator_stats"] = self.osim_model.last_integrator_stats
+
+        if self.state_history is not None:
+            self.state_history.push(self.osim_model.get_state_desc().materialize(self.state_desc_fields).vector)
 
         if project:
-            obs = self.get_observation()
+            obs = self.output_observation(self.stack_observation(self.get_observation()), out)
         else:
-            obs = self.get_state_desc()
+            obs = self.get_state_desc().materialize()
+
+        if nsteps == 1 or self.telescoping_reward:
+            reward, done = self.reward(), self.is_done()
+        done = done or bool(budget_exceeded) or (self.osim_model.istep >= self.spec.timestep_limit)
+
+        if self.recorder is not None:
+            self.recorder.record(action, obs if project else self.get_observation(), reward, done,
+                                 self.osim_model.get_y() if self.recorder.record_states else None)
             
-        return [ obs, self.reward(), self.is_done() or (self.osim_model.istep >= self.spec.timestep_limit), {} ]
+        return [ obs, reward, done, info ]
+
+    """
+    Integrate `nsteps` steps one by one, summing the rewards and stopping
+    when done. Only what reward() and is_done() read from the state
+    description is kept at the intermediate steps.
+    """
+    def skip_frames(self, nsteps):
+        reward = 0
+        fields = self.osim_model.state_desc_fields
+        stats = None
+        try:
+            for i in range(nsteps):
+                if i > 0:
+                    self.prev_state_desc = self.get_state_desc()
+                    self.osim_model.state_desc_fields = []
+                self.osim_model.integrate()
+                if self.osim_model.last_integrator_stats is not None:
+                    stats = self.osim_model.last_integrator_stats if stats is None else stats + self.osim_model.last_integrator_stats
+                reward += self.reward()
+                if self.is_done() or self.osim_model.budget_exceeded:
+                    return reward, True
+        finally:
+            self.osim_model.state_desc_fields = fields
+            if stats is not None:
+                self.osim_model.last_integrator_stats = stats
+        return reward, False
 
     def render(self, mode='human', close=False):
         return
 
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+
 class L2RunEnv(OsimEnv):
     model_path = os.path.join(os.path.dirname(__file__), '../models/gait9dof18musc.osim')    
     time_limit = 1000
+    telescoping_reward = True
+    memoize_reset_observation = True
+    state_desc_fields = ["joint_pos", "joint_vel", "body_pos", "misc/mass_center_pos", "misc/mass_center_vel"]
 
     def is_done(self):
         state_desc = self.get_state_desc()
         return state_desc["body_pos"]["pelvis"][1] < 0.6
 
     ## Values in the observation vector
+    def get_observation_spec(self):
+        spec = ObservationSpec()
+        spec.add("joint_pos/ground_pelvis")
+        spec.add("joint_vel/ground_pelvis")
+        for joint in ["hip_l","hip_r","knee_l","knee_r","ankle_l","ankle_r",]:
+            spec.add("joint_pos/" + joint)
+            spec.add("joint_vel/" + joint)
+        for body_part in ["head", "pelvis", "torso", "toes_l", "toes_r", "talus_l", "talus_r"]:
+            spec.add("body_pos/" + body_part, 0, 2)
+        spec.add("misc/mass_center_pos")
+        spec.add("misc/mass_center_vel")
+        spec.zeros(5)
+        return spec
+
     def get_observation(self):
+        if self.flat_state:
+            return self.gather_observation()
+
         state_desc = self.get_state_desc()
 
         # Augmented environment from the L2R challenge
         res = []
         pelvis = None
 
-        res += state_desc["joint_pos"]["ground_pelvis"]
-        res += state_desc["joint_vel"]["ground_pelvis"]
+        res.extend(state_desc["joint_pos"]["ground_pelvis"])
+        res.extend(state_desc["joint_vel"]["ground_pelvis"])
 
         for joint in ["hip_l","hip_r","knee_l","knee_r","ankle_l","ankle_r",]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
+            res.extend(state_desc["joint_pos"][joint])
+            res.extend(state_desc["joint_vel"][joint])
 
         for body_part in ["head", "pelvis", "torso", "toes_l", "toes_r", "talus_l", "talus_r"]:
-            res += state_desc["body_pos"][body_part][0:2]
+            res.extend(state_desc["body_pos"][body_part][0:2])
 
-        res = res + state_desc["misc"]["mass_center_pos"] + state_desc["misc"]["mass_center_vel"]
+        res.extend(state_desc["misc"]["mass_center_pos"])
+        res.extend(state_desc["misc"]["mass_center_vel"])
 
         res += [0]*5
 
@@ -406,15 +1123,20 @@ class ProstheticsEnv(OsimEnv):
         return self.model + ("_pros" if self.prosthetic else "")
 
     time_limit = 300
+    memoize_reset_observation = True
+    model_cache = 4 # keep the four variants of the model, see change_model
+    state_desc_fields = ["joint_pos", "joint_vel", "joint_acc",
+                         "body_pos", "body_vel", "body_acc", "body_pos_rot", "body_vel_rot", "body_acc_rot",
+                         "muscles", "misc"]
 
-    def __init__(self, visualize = True, integrator_accuracy = 5e-5):
+    def __init__(self, visualize = True, integrator_accuracy = 5e-5, **kwargs):
         self.model_paths = {}
         self.model_paths["3D_pros"] = os.path.join(os.path.dirname(__file__), '../models/gait14dof22musc_pros_20180507.osim')    
         self.model_paths["3D"] = os.path.join(os.path.dirname(__file__), '../models/gait14dof22musc_20170320.osim')    
         self.model_paths["2D_pros"] = os.path.join(os.path.dirname(__file__), '../models/gait14dof22musc_planar_pros_20180507.osim')    
         self.model_paths["2D"] = os.path.join(os.path.dirname(__file__), '../models/gait14dof22musc_planar_20170320.osim')
         self.model_path = self.model_paths[self.get_model_key()]
-        super(ProstheticsEnv, self).__init__(visualize = visualize, integrator_accuracy = integrator_accuracy)
+        super(ProstheticsEnv, self).__init__(visualize = visualize, integrator_accuracy = integrator_accuracy, **kwargs)
 
     def change_model(self, model='3D', prosthetic=True, difficulty=0, seed=None):
         if (self.model, self.prosthetic) != (model, prosthetic):
@@ -432,7 +1154,41 @@ class ProstheticsEnv(OsimEnv):
     # activation, fiber_len, fiber_vel for all muscles (3*18)
     # x, y, vx, vy, ax, ay ofg center of mass (6)
     # 8 + 9*6 + 8*3 + 3*18 + 6 = 146
+    def get_observation_spec(self):
+        spec = ObservationSpec()
+        for body_part in ["pelvis", "head","torso","toes_l","toes_r","talus_l","talus_r"]:
+            if self.prosthetic and body_part in ["toes_r","talus_r"]:
+                spec.zeros(9, body_part)
+                continue
+            # Positions and rotations of the other bodies are relative to the pelvis
+            if body_part == "pelvis":
+                spec.add("body_pos/pelvis", 1, 2)
+            else:
+                spec.add("body_pos/" + body_part, 0, 2, relative_to = "body_pos/pelvis")
+            spec.add("body_vel/" + body_part, 0, 2)
+            spec.add("body_acc/" + body_part, 0, 2)
+            spec.add("body_pos_rot/" + body_part, 2, None, relative_to = None if body_part == "pelvis" else "body_pos_rot/pelvis")
+            spec.add("body_vel_rot/" + body_part, 2)
+            spec.add("body_acc_rot/" + body_part, 2)
+
+        for joint in ["ankle_l","ankle_r","back","hip_l","hip_r","knee_l","knee_r"]:
+            spec.add("joint_pos/" + joint)
+            spec.add("joint_vel/" + joint)
+            spec.add("joint_acc/" + joint)
+
+        for muscle in sorted(name for name, muscle in self.osim_model.state_plan["muscles"]):
+            for key in ["activation", "fiber_length", "fiber_velocity"]:
+                spec.add("muscles/%s/%s" % (muscle, key))
+
+        spec.add("misc/mass_center_pos", 0, 2, relative_to = "body_pos/pelvis")
+        spec.add("misc/mass_center_vel")
+        spec.add("misc/mass_center_acc")
+        return spec
+
     def get_observation(self):
+        if self.flat_state:
+            return self.gather_observation()
+
         state_desc = self.get_state_desc()
 
         # Augmented environment from the L2R challenge
@@ -444,12 +1200,12 @@ class ProstheticsEnv(OsimEnv):
                 res += [0] * 9
                 continue
             cur = []
-            cur += state_desc["body_pos"][body_part][0:2]
-            cur += state_desc["body_vel"][body_part][0:2]
-            cur += state_desc["body_acc"][body_part][0:2]
-            cur += state_desc["body_pos_rot"][body_part][2:]
-            cur += state_desc["body_vel_rot"][body_part][2:]
-            cur += state_desc["body_acc_rot"][body_part][2:]
+            cur.extend(state_desc["body_pos"][body_part][0:2])
+            cur.extend(state_desc["body_vel"][body_part][0:2])
+            cur.extend(state_desc["body_acc"][body_part][0:2])
+            cur.extend(state_desc["body_pos_rot"][body_part][2:])
+            cur.extend(state_desc["body_vel_rot"][body_part][2:])
+            cur.extend(state_desc["body_acc_rot"][body_part][2:])
             if body_part == "pelvis":
                 pelvis = cur
                 res += cur[1:]
@@ -460,9 +1216,9 @@ class ProstheticsEnv(OsimEnv):
                 res += cur
 
         for joint in ["ankle_l","ankle_r","back","hip_l","hip_r","knee_l","knee_r"]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
-            res += state_desc["joint_acc"][joint]
+            res.extend(state_desc["joint_pos"][joint])
+            res.extend(state_desc["joint_vel"][joint])
+            res.extend(state_desc["joint_acc"][joint])
 
         for muscle in sorted(state_desc["muscles"].keys()):
             res += [state_desc["muscles"][muscle]["activation"]]
@@ -470,7 +1226,9 @@ class ProstheticsEnv(OsimEnv):
             res += [state_desc["muscles"][muscle]["fiber_velocity"]]
 
         cm_pos = [state_desc["misc"]["mass_center_pos"][i] - pelvis[i] for i in range(2)]
-        res = res + cm_pos + state_desc["misc"]["mass_center_vel"] + state_desc["misc"]["mass_center_acc"]
+        res += cm_pos
+        res.extend(state_desc["misc"]["mass_center_vel"])
+        res.extend(state_desc["misc"]["mass_center_acc"])
 
         return res
 
@@ -490,10 +1248,27 @@ class ProstheticsEnv(OsimEnv):
 class Arm2DEnv(OsimEnv):
     model_path = os.path.join(os.path.dirname(__file__), '../models/arm2dof6musc.osim')    
     time_limit = 200
+    state_desc_fields = ["joint_pos", "joint_vel", "joint_acc", "muscles", "markers"]
     target_x = 0
     target_y = 0
 
+    def get_observation_spec(self):
+        spec = ObservationSpec()
+        spec.zeros(2, "target")
+        for joint in ["r_shoulder","r_elbow",]:
+            spec.add("joint_pos/" + joint)
+            spec.add("joint_vel/" + joint)
+            spec.add("joint_acc/" + joint)
+        spec.add("muscles/*/activation")
+        spec.add("markers/r_radius_styloid/pos", 0, 2)
+        return spec
+
     def get_observation(self):
+        if self.flat_state:
+            res = self.gather_observation()
+            res[:2] = self.target_x, self.target_y
+            return res
+
         state_desc = self.get_state_desc()
 
         res = [self.target_x, self.target_y]
@@ -507,16 +1282,16 @@ class Arm2DEnv(OsimEnv):
         #     res += state_desc["body_acc_rot"][body_part][2:]
 
         for joint in ["r_shoulder","r_elbow",]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
-            res += state_desc["joint_acc"][joint]
+            res.extend(state_desc["joint_pos"][joint])
+            res.extend(state_desc["joint_vel"][joint])
+            res.extend(state_desc["joint_acc"][joint])
 
         for muscle in sorted(state_desc["muscles"].keys()):
             res += [state_desc["muscles"][muscle]["activation"]]
             # res += [state_desc["muscles"][muscle]["fiber_length"]]
             # res += [state_desc["muscles"][muscle]["fiber_velocity"]]
 
-        res += state_desc["markers"]["r_radius_styloid"]["pos"][:2]
+        res.extend(state_desc["markers"]["r_radius_styloid"]["pos"][:2])
 
         return res
 
@@ -539,8 +1314,8 @@ class Arm2DEnv(OsimEnv):
         self.target_joint.getCoordinate(2).setLocked(state, True)
         self.osim_model.set_state(state)
         
-    def reset(self, random_target = True):
-        obs = super(Arm2DEnv, self).reset()
+    def reset(self, random_target = True, out = None):
+        obs = super(Arm2DEnv, self).reset(out = out)
         if random_target:
             self.generate_new_target()
         self.osim_model.reset_manager()
@@ -564,7 +1339,7 @@ class Arm2DEnv(OsimEnv):
         self.osim_model.model.addJoint(self.target_joint)
         self.osim_model.model.addBody(blockos)
         
-        self.osim_model.model.initSystem()
+        self.osim_model.init_system()
     
     def reward(self):
         state_desc = self.get_state_desc()
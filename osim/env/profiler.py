@@ -0,0 +1,109 @@
+import functools
+import json
+import time
+from collections import deque
+import numpy as np
+
+## Step profiler
+# Opt-in timing of the phases of OsimEnv.step and reset (actuate,
+# integrate, state description readers, get_observation, reward, is_done).
+# Methods are wrapped on the instances, so nothing is paid when the
+# profiler is off. Reading the state description is lazy, hence the
+# "state_desc" time is also included in the phases which read it.
+#
+#     env = ProstheticsEnv(visualize=False, profile=StepProfiler(trace=True))
+#     observation, reward, done, info = env.step(action)
+#     info["timing"]                 # seconds spent in each phase of this step
+#     env.profiler.percentiles()     # p50/p99 over the last `window` samples
+#     env.profiler.dump_chrome_trace("trace.json")  # chrome://tracing
+#
+# `profile=True` keeps the timings and percentiles only.
+class StepProfiler(object):
+    MODEL_PHASES = ["actuate", "integrate"]
+    ENV_PHASES = ["get_observation", "reward", "is_done"]
+
+    def __init__(self, window = 1000, trace = False, trace_size = 100000):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.current = {}
+        self.trace = trace
+        self.events = deque(maxlen = trace_size)
+        self.origin = time.time() - time.perf_counter()
+
+    def add(self, phase, start, duration):
+        if phase not in self.samples:
+            self.samples[phase] = np.zeros(self.window)
+            self.counts[phase] = 0
+        self.samples[phase][self.counts[phase] % self.window] = duration
+        self.counts[phase] += 1
+        self.current[phase] = self.current.get(phase, 0.0) + duration
+        if self.trace:
+            self.events.append((phase, start, duration))
+
+    def timed(self, phase, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(phase, start, time.perf_counter() - start)
+        return wrapper
+
+    def instrument_model(self, osim_model):
+        for phase in self.MODEL_PHASES:
+            setattr(osim_model, phase, self.timed(phase, getattr(osim_model, phase)))
+        for name in dir(osim_model):
+            if name.startswith("_read_"):
+                setattr(osim_model, name, self.timed("state_desc", getattr(osim_model, name)))
+
+    def instrument_env(self, env):
+        for phase in self.ENV_PHASES:
+            setattr(env, phase, self.timed(phase, getattr(env, phase)))
+
+        step, reset = self.timed("step", env.step), self.timed("reset", env.reset)
+
+        @functools.wraps(step)
+        def timed_step(*args, **kwargs):
+            self.current = {}
+            res = step(*args, **kwargs)
+            res[3]["timing"] = self.current
+            return res
+
+        @functools.wraps(reset)
+        def timed_reset(*args, **kwargs):
+            self.current = {}
+            return reset(*args, **kwargs)
+
+        env.step, env.reset = timed_step, timed_reset
+
+    def _window(self, phase):
+        return self.samples[phase][:min(self.counts[phase], self.window)]
+
+    """
+    Median and 99th percentile (in seconds) of each phase over the last
+    `window` samples, together with the total number of samples.
+    """
+    def percentiles(self):
+        res = {}
+        for phase in self.samples:
+            p50, p99 = np.percentile(self._window(phase), [50, 99])
+            res[phase] = {"p50": p50, "p99": p99, "count": self.counts[phase]}
+        return res
+
+    def histogram(self, phase, bins = 20):
+        return np.histogram(self._window(phase), bins = bins)
+
+    """
+    Write the recorded events (profiler created with trace = True)
+    in the Chrome trace event format.
+    """
+    def dump_chrome_trace(self, path):
+        if not self.trace:
+            raise ValueError("The profiler does not record a trace, create it with StepProfiler(trace=True).")
+        events = [{"name": phase, "ph": "X", "pid": 0, "tid": 0,
+                   "ts": (self.origin + start) * 1e6, "dur": duration * 1e6}
+                  for phase, start, duration in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
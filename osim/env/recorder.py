@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+## Trajectory recorder
+# Streams the steps of rollouts to append-only binary files in a
+# directory, one file per column, with one row per step:
+#   actions.bin, observations.bin     `dtype` (float32 by default)
+#   rewards.bin                       float64
+#   dones.bin                         uint8
+#   states.bin                        float64, the state Y vector (record_states)
+# and one row per finished episode:
+#   episodes.bin                      int64 (first step, last step + 1)
+#   reset_observations.bin            the observation returned by reset (NaN if none)
+# The shapes and types are in meta.json. Steps are copied into chunks of
+# `chunk_size` rows and the full chunks are written by a background thread,
+# so stepping never waits for the disk. Recording in an existing directory
+# appends to it.
+#
+#     env = ProstheticsEnv(visualize=False, recorder="rollouts/run1")
+#     ...
+#     env.close()                           # or env.recorder.flush()
+#
+#     trajectories = Trajectories("rollouts/run1")
+#     trajectories.observations             # np.memmap, one row per step
+#     trajectories.episode(3)["rewards"]    # steps of the 4th episode
+
+EPISODES = "episodes"
+RESET_OBSERVATIONS = "reset_observations"
+
+def _rows(directory, name, dtype, width):
+    path = os.path.join(directory, name + ".bin")
+    return os.path.getsize(path) // (np.dtype(dtype).itemsize * width) if os.path.exists(path) else 0
+
+def _truncate(directory, name, dtype, width, rows):
+    path = os.path.join(directory, name + ".bin")
+    if os.path.exists(path):
+        os.truncate(path, rows * np.dtype(dtype).itemsize * width)
+
+class TrajectoryRecorder(object):
+    def __init__(self, directory, chunk_size = 1024, dtype = np.float32, record_states = True):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.record_states = record_states
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Columns are created by the first record, from the sizes of its values
+        self.columns = None
+        self.chunk = None
+        self.free_chunks = []
+        self.row = 0
+        self.rows = 0                  # rows already in the files
+        self.episode_start = 0
+        self.reset_observation = None
+        self.episodes = 0
+
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.writer = threading.Thread(target = self._write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    ## Writer thread
+    def _write(self):
+        files = {}
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                kind = item[0]
+                if kind == "rows":
+                    chunk, count = item[1], item[2]
+                    for name, data in chunk.items():
+                        if name not in files:
+                            files[name] = open(os.path.join(self.directory, name + ".bin"), "ab")
+                        files[name].write(memoryview(data[:count]))
+                    with self.lock:
+                        self.free_chunks.append(chunk)
+                elif kind == "episode":
+                    for name, data in item[1].items():
+                        if name not in files:
+                            files[name] = open(os.path.join(self.directory, name + ".bin"), "ab")
+                        files[name].write(memoryview(data))
+                elif kind == "flush":
+                    for f in files.values():
+                        f.flush()
+                    item[1].set()
+        except Exception as e:
+            self.error = e
+            # Don't leave flush() waiting
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                if item[0] == "flush":
+                    item[1].set()
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _check(self):
+        if self.error is not None:
+            raise IOError("Writing trajectories in %s failed: %s" % (self.directory, self.error))
+        if self.closed:
+            raise ValueError("The recorder is closed")
+
+    def _create_columns(self, action, observation, state):
+        columns = {"actions": (self.dtype.str, len(action)),
+                   "observations": (self.dtype.str, len(observation)),
+                   "rewards": ("<f8", 1),
+                   "dones": ("|u1", 1)}
+        if state is not None:
+            columns["states"] = ("<f8", len(state))
+        columns[EPISODES] = ("<i8", 2)
+        columns[RESET_OBSERVATIONS] = (self.dtype.str, len(observation))
+
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)["columns"]
+            existing = dict((name, (value["dtype"], value["width"])) for name, value in meta.items())
+            if existing != columns:
+                raise ValueError("Trajectories in %s have other columns: %s" % (self.directory, existing))
+            # Resume after the last complete step and episode, dropping
+            # the rows of an interrupted write
+            steps = [name for name in columns if name not in (EPISODES, RESET_OBSERVATIONS)]
+            self.rows = min(_rows(self.directory, name, *columns[name]) for name in steps)
+            self.episodes = min(_rows(self.directory, name, *columns[name]) for name in (EPISODES, RESET_OBSERVATIONS))
+            for name, (dtype, width) in columns.items():
+                _truncate(self.directory, name, dtype, width, self.rows if name in steps else self.episodes)
+            self.episode_start = self.rows
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"columns": dict((name, {"dtype": dtype, "width": width}) for name, (dtype, width) in columns.items())}, f, indent = 2)
+        self.columns = columns
+
+    def _new_chunk(self):
+        with self.lock:
+            if self.free_chunks:
+                return self.free_chunks.pop()
+        return dict((name, np.empty((self.chunk_size, width), dtype = dtype)) for name, (dtype, width) in self.columns.items()
+                    if name not in (EPISODES, RESET_OBSERVATIONS))
+
+    def _send_chunk(self):
+        if self.row:
+            self.queue.put(("rows", self.chunk, self.row))
+            self.rows += self.row
+            self.chunk = self._new_chunk()
+            self.row = 0
+
+    """
+    Record the observation returned by reset, which starts an episode
+    (and ends the current one, if it did not end with done).
+    """
+    def reset(self, observation):
+        self._check()
+        self.end_episode()
+        self.reset_observation = np.array(observation, dtype = self.dtype)
+
+    """
+    Record a step: the action, what step returned for it and the state Y vector.
+    """
+    def record(self, action, observation, reward, done, state = None):
+        self._check()
+        if not self.record_states:
+            state = None
+        if self.columns is None:
+            self._create_columns(action, observation, state)
+            self.chunk = self._new_chunk()
+        chunk, row = self.chunk, self.row
+        chunk["actions"][row] = action
+        chunk["observations"][row] = observation
+        chunk["rewards"][row] = reward
+        chunk["dones"][row] = done
+        if state is not None:
+            chunk["states"][row] = state
+        self.row += 1
+        if self.row == self.chunk_size:
+            self._send_chunk()
+        if done:
+            self.end_episode()
+
+    """
+    End the current episode, if it has steps.
+    """
+    def end_episode(self):
+        stop = self.rows + self.row
+        if self.columns is None or stop == self.episode_start:
+            return
+        reset_observation = self.reset_observation
+        if reset_observation is None:
+            reset_observation = np.full(self.columns[RESET_OBSERVATIONS][1], np.nan, dtype = self.dtype)
+        # Rows before the episode index, so that a complete episode is always in the files
+        self._send_chunk()
+        self.queue.put(("episode", {EPISODES: np.array([[self.episode_start, stop]], dtype = np.int64),
+                                    RESET_OBSERVATIONS: reset_observation.reshape(1, -1)}))
+        self.episode_start = stop
+        self.reset_observation = None
+        self.episodes += 1
+
+    """
+    Write the steps recorded so far and wait for the writer. The episode
+    index only has the episodes which ended.
+    """
+    def flush(self):
+        self._check()
+        self._send_chunk()
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+        self._check()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.error is None:
+            self.end_episode()
+            self.flush()
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class Trajectories(object):
+    """
+    Read the trajectories of a TrajectoryRecorder as memory maps (read only),
+    including the ones being recorded up to the last written chunk.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)["columns"]
+        steps = min(_rows(directory, name, value["dtype"], value["width"]) for name, value in self.meta.items()
+                    if name not in (EPISODES, RESET_OBSERVATIONS))
+        episodes = min(_rows(directory, name, self.meta[name]["dtype"], self.meta[name]["width"])
+                       for name in (EPISODES, RESET_OBSERVATIONS))
+        self.columns = {}
+        for name, value in self.meta.items():
+            rows = episodes if name in (EPISODES, RESET_OBSERVATIONS) else steps
+            self.columns[name] = self._memmap(name, value["dtype"], value["width"], rows)
+        self.episodes = self.columns[EPISODES]
+        self.reset_observations = self.columns[RESET_OBSERVATIONS]
+        self.actions = self.columns["actions"]
+        self.observations = self.columns["observations"]
+        self.rewards = self.columns["rewards"][:, 0]
+        self.dones = self.columns["dones"][:, 0].view(np.bool_)
+        self.states = self.columns.get("states")
+
+    def _memmap(self, name, dtype, width, rows):
+        if rows == 0:
+            return np.zeros((0, width), dtype = dtype)
+        return np.memmap(os.path.join(self.directory, name + ".bin"), dtype = dtype, mode = "r", shape = (rows, width))
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def episode(self, i):
+        start, stop = self.episodes[i]
+        result = {"reset_observation": self.reset_observations[i],
+                  "actions": self.actions[start:stop],
+                  "observations": self.observations[start:stop],
+                  "rewards": self.rewards[start:stop],
+                  "dones": self.dones[start:stop]}
+        if self.states is not None:
+            result["states"] = self.states[start:stop]
+        return result
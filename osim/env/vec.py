@@ -0,0 +1,400 @@
+import functools
+import gc
+import mmap
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+import traceback
+import numpy as np
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+
+## Vectorized environments
+# VecOsimEnv runs N environments (L2RunEnv, ProstheticsEnv, Arm2DEnv, ...)
+# in worker processes. OpenSim integration is single threaded, so this is
+# how we use many cores. Observations, rewards, dones and actions are
+# exchanged through shared memory; the pipes only carry short commands
+# and the `info` dictionaries.
+#
+#     from functools import partial
+#     env = VecOsimEnv([partial(L2RunEnv, visualize=False)] * 8)
+#     observations = env.reset()
+#     observations, rewards, dones, infos = env.step(actions)
+#
+# Environments are reset automatically when they are done, in which case
+# the last observation of the episode is in info["terminal_observation"].
+
+def _shared_array(shape):
+    size = int(np.prod(shape))
+    raw = multiprocessing.RawArray('d', size)
+    return raw, shape, 0
+
+def _as_array(buffer):
+    raw, shape, offset = buffer
+    return np.frombuffer(raw, dtype=np.float64, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+def _worker(remote, parent_remote, env_fn, buffers, index):
+    if parent_remote is not None:
+        parent_remote.close()
+    observations, actions, rewards, dones = [_as_array(buffer) for buffer in buffers]
+    env = None
+    try:
+        env = env_fn()
+        while True:
+            command, data = remote.recv()
+            if command == "step":
+                observation, reward, done, info = env.step(actions[index])
+                if done:
+                    info["terminal_observation"] = np.array(observation, dtype=np.float64)
+                    observation = env.reset()
+                observations[index] = observation
+                rewards[index] = reward
+                dones[index] = done
+                remote.send((True, info))
+            elif command == "reset":
+                observations[index] = env.reset(**data)
+                remote.send((True, None))
+            elif command == "call":
+                name, args, kwargs = data
+                remote.send((True, getattr(env, name)(*args, **kwargs)))
+            elif command == "getattr":
+                remote.send((True, getattr(env, data)))
+            elif command == "close":
+                remote.send((True, None))
+                break
+            else:
+                remote.send((False, "Unknown command %s" % command))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        remote.send((False, traceback.format_exc()))
+    finally:
+        if env is not None:
+            env.close()
+        remote.close()
+
+class VecOsimEnv(object):
+    """
+    Run the environments created by `env_fns` in worker processes.
+
+    `env_fns` is a list of callables returning environments, one per worker.
+    They need to be picklable unless the "fork" start method is used (the
+    default on Linux). Unless `spaces` (observation_space, action_space) is
+    given, one environment is created in the main process to read them.
+
+    With `copy = False`, `reset` and `step` return the shared buffers
+    themselves, which are overwritten by the next call.
+    """
+    def __init__(self, env_fns, context = None, copy = True, spaces = None):
+        self.num_envs = len(env_fns)
+        self.env_fns = env_fns
+        self.copy = copy
+        self.closed = False
+        self.waiting = False
+
+        if spaces is None:
+            env = env_fns[0]()
+            spaces = (env.observation_space, env.action_space)
+            env.close()
+        self.observation_space, self.action_space = spaces
+
+        observation_size = self.observation_space.shape[0]
+        action_size = self.action_space.shape[0]
+
+        self.buffers = self._create_buffers([
+            (self.num_envs, observation_size),
+            (self.num_envs, action_size),
+            (self.num_envs,),
+            (self.num_envs,),
+        ])
+        self.observations, self.actions, self.rewards, self.dones = [_as_array(buffer) for buffer in self.buffers]
+
+        self.ctx = multiprocessing.get_context(context) if context else multiprocessing
+        self.remotes, self.processes = [None] * self.num_envs, [None] * self.num_envs
+        for index in range(self.num_envs):
+            self._start_worker(index)
+
+    def _create_buffers(self, shapes):
+        return [_shared_array(shape) for shape in shapes]
+
+    def _start_worker(self, index):
+        remote, work_remote = self.ctx.Pipe()
+        process = self.ctx.Process(target=_worker, args=(work_remote, remote, self.env_fns[index], self.buffers, index))
+        process.daemon = True
+        process.start()
+        work_remote.close()
+        self.remotes[index] = remote
+        self.processes[index] = process
+
+    """
+    Replace the worker `index` (e.g. after it crashed) with a new one.
+    The environment needs to be reset before stepping it.
+    """
+    def restart_worker(self, index):
+        if self.processes[index].is_alive():
+            self.processes[index].terminate()
+        self.processes[index].join()
+        self.remotes[index].close()
+        self._start_worker(index)
+
+    def _receive(self, remote):
+        ok, payload = remote.recv()
+        if not ok:
+            raise Exception("Error in a VecOsimEnv worker:\n{}".format(payload))
+        return payload
+
+    """
+    Read the replies of all the `remotes` before raising the first error,
+    so that the next command does not read a stale reply.
+    """
+    def _receive_all(self, remotes):
+        replies, error = [], None
+        for remote in remotes:
+            try:
+                replies.append(self._receive(remote))
+            except Exception as e:
+                replies.append(None)
+                error = error or e
+        if error is not None:
+            raise error
+        return replies
+
+    def _output(self, array):
+        return array.copy() if self.copy else array
+
+    def reset(self, **kwargs):
+        for remote in self.remotes:
+            remote.send(("reset", kwargs))
+        self._receive_all(self.remotes)
+        return self._output(self.observations)
+
+    def step_async(self, actions):
+        self.actions[:] = actions
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        self.waiting = False
+        infos = self._receive_all(self.remotes)
+        return self._output(self.observations), self._output(self.rewards), self.dones.astype(bool), infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        return indices
+
+    def env_method(self, name, *args, **kwargs):
+        indices = self._indices(kwargs.pop("indices", None))
+        for i in indices:
+            self.remotes[i].send(("call", (name, args, kwargs)))
+        return self._receive_all([self.remotes[i] for i in indices])
+
+    def get_attr(self, name, indices = None):
+        indices = self._indices(indices)
+        for i in indices:
+            self.remotes[i].send(("getattr", name))
+        return self._receive_all([self.remotes[i] for i in indices])
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            try:
+                if self.waiting:
+                    remote.recv()
+                remote.send(("close", None))
+                remote.recv()
+            except (EOFError, OSError):
+                # The worker already exited
+                pass
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+
+## Fork server
+# Every worker of VecOsimEnv parses the .osim file and initializes the
+# model, which takes seconds for the bigger models. OsimForkServer starts
+# one server process which loads and resets each environment once, and
+# then forks the workers from itself with the environment already
+# initialized. Memory of the models is shared with the workers
+# (copy-on-write) and restarting a worker is nearly free.
+#
+#     server = OsimForkServer({"3D_pros": partial(ProstheticsEnv, visualize=False)})
+#     env = server.make_vec_env(["3D_pros"] * 64)
+#     ...
+#     env.close()
+#     server.close()
+#
+# The server only runs its request loop, so it forks from a single
+# threaded process whatever the main process does. It is started with
+# `context` ("fork" by default, "spawn" to start it from a fresh
+# interpreter, which needs picklable `env_fns`); the workers are always
+# forked from it (Linux, OSX). A worker gets its end of the command pipe
+# and the file of the shared buffers of its VecOsimEnv through the server
+# pipe (file descriptor passing).
+
+def _forked_worker(key, index, layout, remote, buffer_fd, template):
+    # Runs in the child of os.fork() in the server
+    code = 0
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        shapes, offsets, size = layout
+        shared = mmap.mmap(buffer_fd, size)
+        os.close(buffer_fd)
+        buffers = [(shared, shape, offset) for shape, offset in zip(shapes, offsets)]
+        _worker(Connection(remote), None, lambda: template, buffers, index)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+def _fork_server(remote, parent_remote, env_fns):
+    parent_remote.close()
+    templates = {}
+    try:
+        for key, env_fn in env_fns.items():
+            env = env_fn()
+            env.reset()
+            templates[key] = env
+        remote.send((True, dict((key, (env.observation_space, env.action_space)) for key, env in templates.items())))
+    except Exception:
+        remote.send((False, traceback.format_exc()))
+        return
+
+    # Keep the garbage collector from touching (and so copying)
+    # the memory shared with the workers
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    # Workers are reaped by the kernel, VecOsimEnv waits for their pipes
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    try:
+        while True:
+            request = remote.recv()
+            if request is None:
+                break
+            key, index, layout = request
+            worker_remote = reduction.recv_handle(remote)
+            buffer_fd = reduction.recv_handle(remote)
+            pid = os.fork()
+            if pid == 0:
+                remote.close()
+                _forked_worker(key, index, layout, worker_remote, buffer_fd, templates[key])
+            os.close(worker_remote)
+            os.close(buffer_fd)
+            remote.send(pid)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        for env in templates.values():
+            env.close()
+        remote.close()
+
+class _ForkedProcess(object):
+    """
+    The parts of multiprocessing.Process used by VecOsimEnv, for a worker
+    forked by the server (not a child of this process).
+    """
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except OSError:
+            return False
+        return True
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def join(self, timeout = None):
+        deadline = None if timeout is None else time.time() + timeout
+        while self.is_alive() and (deadline is None or time.time() < deadline):
+            time.sleep(0.01)
+
+class _ForkServerVecEnv(VecOsimEnv):
+    def __init__(self, server, keys, copy = True):
+        self.server = server
+        super(_ForkServerVecEnv, self).__init__(keys, copy = copy, spaces = server.spaces[keys[0]])
+
+    def _create_buffers(self, shapes):
+        # A file, so that its descriptor can be sent to the server
+        offsets, size = [], 0
+        for shape in shapes:
+            offsets.append(size)
+            size += 8 * int(np.prod(shape))
+        self.buffer_file = tempfile.TemporaryFile()
+        self.buffer_file.truncate(size)
+        self.layout = (shapes, offsets, size)
+        shared = mmap.mmap(self.buffer_file.fileno(), size)
+        return [(shared, shape, offset) for shape, offset in zip(shapes, offsets)]
+
+    def _start_worker(self, index):
+        remote, work_remote = multiprocessing.Pipe()
+        pid = self.server.fork(self.env_fns[index], index, self.layout, work_remote.fileno(), self.buffer_file.fileno())
+        work_remote.close()
+        self.remotes[index] = remote
+        self.processes[index] = _ForkedProcess(pid)
+
+    def close(self):
+        super(_ForkServerVecEnv, self).close()
+        self.buffer_file.close()
+
+class OsimForkServer(object):
+    def __init__(self, env_fns, context = None):
+        ctx = multiprocessing.get_context(context or "fork")
+        self.remote, server_remote = ctx.Pipe()
+        self.process = ctx.Process(target=_fork_server, args=(server_remote, self.remote, env_fns))
+        self.process.daemon = True
+        self.process.start()
+        server_remote.close()
+        try:
+            ok, payload = self.remote.recv()
+        except EOFError:
+            ok, payload = False, "The server exited with code {}".format(self.process.exitcode)
+        if not ok:
+            self.process.join()
+            raise Exception("Error in the OsimForkServer:\n{}".format(payload))
+        # key -> (observation_space, action_space), read from the templates
+        self.spaces = payload
+
+    """
+    Fork a worker running the environment `key`, with the end `remote` of its
+    command pipe and the file `buffer_fd` of the shared buffers, returns its pid.
+    """
+    def fork(self, key, index, layout, remote, buffer_fd):
+        if key not in self.spaces:
+            raise KeyError("No environment {} in the OsimForkServer, one of {}".format(key, sorted(self.spaces)))
+        self.remote.send((key, index, layout))
+        reduction.send_handle(self.remote, remote, self.process.pid)
+        reduction.send_handle(self.remote, buffer_fd, self.process.pid)
+        return self.remote.recv()
+
+    def make_vec_env(self, keys, copy = True):
+        sizes = set((self.spaces[key][0].shape, self.spaces[key][1].shape) for key in keys)
+        if len(sizes) > 1:
+            raise ValueError("The environments of a VecOsimEnv need the same observation and action sizes")
+        return _ForkServerVecEnv(self, keys, copy = copy)
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.remote.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join()
+        self.remote.close()
+        self.process = None
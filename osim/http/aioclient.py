@@ -0,0 +1,134 @@
+import pkg_resources
+import six.moves.urllib.parse as urlparse
+import numpy as np
+from osim.http.client import ServerError
+from osim.redis import messages
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class AsyncClient(object):
+    """
+    asyncio version of osim.http.client.Client, with the same
+    env_create / env_reset / env_step / submit methods as coroutines.
+
+    Each client drives one environment instance. Clients created with the
+    same `session` (an aiohttp.ClientSession) share its pool of connections,
+    so one process can run many episodes at once:
+
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=64)) as session:
+            clients = [AsyncClient(remote_base, session) for _ in range(32)]
+            observations = await asyncio.gather(*[c.env_create(token) for c in clients])
+
+    Without `session`, the client opens its own (closed by env_close / close).
+    With `encoding` messages.BINARY or BINARY32, the bodies are in the
+    binary encoding of osim.redis.messages (served by osim.http.server)
+    and observations are NumPy arrays.
+    Requires aiohttp.
+    """
+    def __init__(self, remote_base, session=None, limit=16, encoding=messages.JSON):
+        if aiohttp is None:
+            raise ImportError("AsyncClient requires aiohttp (pip install osim-rl[async])")
+        self.remote_base = remote_base
+        self.session = session
+        self.own_session = session is None
+        self.limit = limit
+        self.encoding = encoding
+        self.instance_id = None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit))
+        return self.session
+
+    async def _parse_server_error_or_raise_for_status(self, resp):
+        j = {}
+        try:
+            j, _ = messages.decode(await resp.read())
+        except Exception:
+            # Same as the blocking client: no JSON means a network error, not a server error
+            resp.raise_for_status()
+        if resp.status != 200 and "message" in j:  # descriptive message from server side
+            raise ServerError(message=j["message"], status_code=resp.status)
+        resp.raise_for_status()
+        return j
+
+    async def _post_request(self, route, data):
+        url = urlparse.urljoin(self.remote_base, route)
+        logger.info("POST {}\n{}".format(url, data))
+        if self.encoding == messages.JSON:
+            body, content_type = messages.encode(data), 'application/json'
+        else:
+            body, content_type = messages.encode(data or {}, self.encoding), 'application/x-osim-rl'
+        async with self._get_session().post(url, data=body, headers={'Content-type': content_type}) as resp:
+            return await self._parse_server_error_or_raise_for_status(resp)
+
+    async def _get_request(self, route):
+        url = urlparse.urljoin(self.remote_base, route)
+        logger.info("GET {}".format(url))
+        async with self._get_session().get(url) as resp:
+            return await self._parse_server_error_or_raise_for_status(resp)
+
+    async def env_create(self, token, env_id = "Run"):
+        route = '/v1/envs/'
+        data = {'env_id': env_id,
+                'token': token,
+                'version': pkg_resources.get_distribution("osim-rl").version }
+        resp = await self._post_request(route, data)
+        self.instance_id = resp['instance_id']
+        await self.env_monitor_start("tmp", force=True)
+        return await self.env_reset()
+
+    async def env_reset(self):
+        route = '/v1/envs/{}/reset/'.format(self.instance_id)
+        resp = await self._post_request(route, None)
+        return resp['observation']
+
+    async def env_step(self, action, render=False):
+        route = '/v1/envs/{}/step/'.format(self.instance_id)
+        if self.encoding != messages.JSON:
+            action = np.asarray(action, dtype=np.float64)
+        data = {'action': action, 'render': render}
+        resp = await self._post_request(route, data)
+        return [resp['observation'], resp['reward'], resp['done'], resp['info']]
+
+    async def env_monitor_start(self, directory,
+                                force=False, resume=False, video_callable=False):
+        route = '/v1/envs/{}/monitor/start/'.format(self.instance_id)
+        data = {'directory': directory,
+                'force': force,
+                'resume': resume,
+                'video_callable': video_callable}
+        await self._post_request(route, data)
+
+    async def submit(self):
+        route = '/v1/envs/{}/monitor/close/'.format(self.instance_id)
+        result = await self._post_request(route, None)
+        if result['reward']:
+            print("Your total reward from this submission: %f" % result['reward'])
+        else:
+            print("There was an error in your submission. Please contact administrators.")
+        await self.env_close()
+        return result
+
+    async def env_close(self):
+        route = '/v1/envs/{}/close/'.format(self.instance_id)
+        await self._post_request(route, None)
+        await self.close()
+
+    async def close(self):
+        if self.own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
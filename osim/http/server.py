@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+import asyncio
+import collections
+import multiprocessing
+import time
+import traceback
+import uuid
+import numpy as np
+from osim.redis import messages
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+import logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+## HTTP environment server
+# Serves the routes of the gym-http-api used by osim.http.client.Client
+# (and its asyncio version), to run the grader protocol locally:
+#
+#     POST /v1/envs/                        {"env_id"}   -> {"instance_id"}
+#     GET  /v1/envs/                                     -> {"all_envs"}
+#     POST /v1/envs/<id>/reset/                          -> {"observation"}
+#     POST /v1/envs/<id>/step/              {"action"}   -> {"observation", "reward", "done", "info"}
+#     POST /v1/envs/<id>/monitor/start/
+#     POST /v1/envs/<id>/monitor/close/                  -> {"reward"} (total since monitor/start)
+#     POST /v1/envs/<id>/close/
+#
+# The environments live in `workers` processes, a new instance going to the
+# worker with the fewest. Requests of all the clients are multiplexed on
+# the pipes of the workers, so the event loop only parses and encodes.
+# Bodies are JSON, or the binary encoding of osim.redis.messages with the
+# content type "application/x-osim-rl" : the response has the encoding of
+# the request. Errors are {"message"} in JSON with status 400 (the
+# traceback is only logged by the server). The time spent in the
+# environment is in the X-Osim-Env-Time header (seconds). A worker which
+# exits is replaced, its instances are lost (status 500).
+#
+#     python -m osim.http.server --port 5000 --workers 4
+
+BINARY_CONTENT_TYPE = "application/x-osim-rl"
+
+# env_id -> class of osim.env
+ENVS = {"Run": "L2RunEnv", "L2Run": "L2RunEnv", "Prosthetics": "ProstheticsEnv", "Arm2D": "Arm2DEnv"}
+
+class InvalidUsage(Exception):
+    def __init__(self, message, status_code=400):
+        Exception.__init__(self, message)
+        self.message = message
+        self.status_code = status_code
+
+def _observation(observation):
+    return np.asarray(observation, dtype=np.float64)
+
+def _worker(remote, parent_remote, env_kwargs):
+    parent_remote.close()
+    envs, monitors = {}, {}
+    try:
+        while True:
+            request = remote.recv()
+            if request is None:
+                break
+            instance_id, command, data = request
+            try:
+                start = time.perf_counter()
+                result = None
+                if command == "create":
+                    import osim.env
+                    envs[instance_id] = getattr(osim.env, ENVS[data])(**env_kwargs)
+                elif command == "reset":
+                    result = {"observation": _observation(envs[instance_id].reset())}
+                elif command == "step":
+                    observation, reward, done, info = envs[instance_id].step(np.asarray(data, dtype=np.float64))
+                    if instance_id in monitors:
+                        monitors[instance_id] += reward
+                    result = {"observation": _observation(observation), "reward": float(reward),
+                              "done": bool(done), "info": info}
+                elif command == "monitor_start":
+                    monitors[instance_id] = 0.0
+                elif command == "monitor_close":
+                    result = {"reward": monitors.pop(instance_id, 0.0)}
+                elif command == "close":
+                    monitors.pop(instance_id, None)
+                    env = envs.pop(instance_id)
+                    if hasattr(env, "close"):
+                        env.close()
+                else:
+                    raise ValueError("Unknown command %s" % command)
+                remote.send((True, result, time.perf_counter() - start))
+            except Exception as e:
+                logger.error("Error in {} of instance {}:\n{}".format(command, instance_id, traceback.format_exc()))
+                remote.send((False, str(e), 0.0))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        for env in envs.values():
+            if hasattr(env, "close"):
+                env.close()
+        remote.close()
+
+class EnvServer(object):
+    """
+    The aiohttp application of the HTTP environment server (see above).
+    `env_kwargs` are given to the constructors of the environments.
+
+        server = EnvServer(workers = 4)
+        web.run_app(server.app(), port = 5000)
+    """
+    def __init__(self, workers = 1, env_kwargs = None, context = None):
+        if web is None:
+            raise ImportError("EnvServer requires aiohttp (pip install osim-rl[async])")
+        self.workers = workers
+        self.env_kwargs = {"visualize": False} if env_kwargs is None else env_kwargs
+        self.context = multiprocessing.get_context(context or "fork")
+        self.instances = {} # instance_id -> (env_id, worker)
+        self.lost = {} # instance_id -> why, for the instances of workers which exited
+        self.load = [0] * workers
+        self.remotes, self.processes = [None] * workers, [None] * workers
+        self.pending = [collections.deque() for i in range(workers)]
+        self.loop = None
+        for worker in range(workers):
+            self._start_worker(worker)
+
+    def _start_worker(self, worker):
+        remote, work_remote = self.context.Pipe()
+        process = self.context.Process(target=_worker, args=(work_remote, remote, self.env_kwargs))
+        process.daemon = True
+        process.start()
+        work_remote.close()
+        self.remotes[worker], self.processes[worker] = remote, process
+        if self.loop is not None:
+            self.loop.add_reader(remote.fileno(), self._receive, worker)
+
+    def _restart_worker(self, worker):
+        # Fail what was waiting for it, lose its instances and replace it
+        remote, process = self.remotes[worker], self.processes[worker]
+        self.loop.remove_reader(remote.fileno())
+        remote.close()
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        message = "Worker {} exited with code {}".format(worker, process.exitcode)
+        logger.error("{}, restarting it".format(message))
+        pending = self.pending[worker]
+        while pending:
+            future = pending.popleft()
+            if not future.done():
+                future.set_exception(InvalidUsage(message, 500))
+        for instance_id in [key for key, value in self.instances.items() if value[1] == worker]:
+            self._forget(instance_id)
+            self.lost[instance_id] = "Instance_id {} lost: {}".format(instance_id, message)
+        self._start_worker(worker)
+
+    def _receive(self, worker):
+        # Workers answer in order, so a response is for the oldest request
+        remote, pending = self.remotes[worker], self.pending[worker]
+        try:
+            while remote.poll():
+                response = remote.recv()
+                future = pending.popleft()
+                if not future.done():
+                    future.set_result(response)
+        except (EOFError, OSError):
+            self._restart_worker(worker)
+
+    async def _start(self, app):
+        self.loop = asyncio.get_running_loop()
+        for worker, remote in enumerate(self.remotes):
+            self.loop.add_reader(remote.fileno(), self._receive, worker)
+
+    async def _stop(self, app):
+        self.close()
+
+    async def call(self, instance_id, command, data=None):
+        if instance_id in self.lost:
+            raise InvalidUsage(self.lost[instance_id], 500)
+        if instance_id not in self.instances:
+            raise InvalidUsage("Instance_id {} unknown".format(instance_id))
+        worker = self.instances[instance_id][1]
+        future = self.loop.create_future()
+        self.pending[worker].append(future)
+        try:
+            self.remotes[worker].send((instance_id, command, data))
+        except (BrokenPipeError, OSError):
+            self._restart_worker(worker)
+        ok, result, env_time = await future
+        if not ok:
+            raise InvalidUsage(result)
+        return result, env_time
+
+    ## Routes
+    async def _body(self, request):
+        raw = await request.read()
+        if not raw:
+            return {}, messages.JSON
+        try:
+            data, encoding = messages.decode(raw)
+        except ValueError:
+            raise InvalidUsage("Invalid request body")
+        return data or {}, encoding
+
+    def _response(self, result, encoding, env_time=0.0):
+        headers = {"X-Osim-Env-Time": repr(env_time)}
+        if encoding == messages.JSON:
+            return web.Response(text=messages.encode(result or {}), content_type="application/json", headers=headers)
+        return web.Response(body=messages.encode(result or {}, encoding), content_type=BINARY_CONTENT_TYPE, headers=headers)
+
+    async def env_create(self, request):
+        data, encoding = await self._body(request)
+        env_id = data.get("env_id", "Run")
+        if env_id not in ENVS:
+            raise InvalidUsage("Unknown env_id {}, one of {}".format(env_id, sorted(ENVS)))
+        instance_id = uuid.uuid4().hex[:8]
+        worker = self.load.index(min(self.load))
+        self.instances[instance_id] = (env_id, worker)
+        self.load[worker] += 1
+        try:
+            result, env_time = await self.call(instance_id, "create", env_id)
+        except InvalidUsage:
+            if instance_id in self.instances:
+                self._forget(instance_id)
+            self.lost.pop(instance_id, None)
+            raise
+        return self._response({"instance_id": instance_id}, encoding, env_time)
+
+    async def env_list_all(self, request):
+        return web.json_response({"all_envs": dict((key, value[0]) for key, value in self.instances.items())})
+
+    async def env_reset(self, request):
+        data, encoding = await self._body(request)
+        result, env_time = await self.call(request.match_info["instance_id"], "reset")
+        return self._response(result, encoding, env_time)
+
+    async def env_step(self, request):
+        data, encoding = await self._body(request)
+        if "action" not in data:
+            raise InvalidUsage("action missing")
+        result, env_time = await self.call(request.match_info["instance_id"], "step", data["action"])
+        return self._response(result, encoding, env_time)
+
+    async def env_monitor_start(self, request):
+        data, encoding = await self._body(request)
+        result, env_time = await self.call(request.match_info["instance_id"], "monitor_start")
+        return self._response(result, encoding, env_time)
+
+    async def env_monitor_close(self, request):
+        data, encoding = await self._body(request)
+        result, env_time = await self.call(request.match_info["instance_id"], "monitor_close")
+        return self._response(result, encoding, env_time)
+
+    async def env_close(self, request):
+        data, encoding = await self._body(request)
+        instance_id = request.match_info["instance_id"]
+        if self.lost.pop(instance_id, None) is not None:
+            # Already gone with its worker
+            return self._response({}, encoding)
+        result, env_time = await self.call(instance_id, "close")
+        self._forget(instance_id)
+        return self._response(result, encoding, env_time)
+
+    def _forget(self, instance_id):
+        env_id, worker = self.instances.pop(instance_id)
+        self.load[worker] -= 1
+
+    def app(self):
+        @web.middleware
+        async def errors(request, handler):
+            try:
+                return await handler(request)
+            except InvalidUsage as e:
+                logger.info("Error {}: {}".format(e.status_code, e.message))
+                return web.json_response({"message": e.message}, status=e.status_code)
+
+        app = web.Application(middlewares=[errors])
+        app.router.add_post('/v1/envs/', self.env_create)
+        app.router.add_get('/v1/envs/', self.env_list_all)
+        app.router.add_post('/v1/envs/{instance_id}/reset/', self.env_reset)
+        app.router.add_post('/v1/envs/{instance_id}/step/', self.env_step)
+        app.router.add_post('/v1/envs/{instance_id}/monitor/start/', self.env_monitor_start)
+        app.router.add_post('/v1/envs/{instance_id}/monitor/close/', self.env_monitor_close)
+        app.router.add_post('/v1/envs/{instance_id}/close/', self.env_close)
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    def close(self):
+        if self.loop is not None and not self.loop.is_closed():
+            # Workers exiting now are not restarted
+            for remote in self.remotes:
+                self.loop.remove_reader(remote.fileno())
+        for remote in self.remotes:
+            try:
+                remote.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.remotes, self.processes = [], []
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve osim-rl environments over HTTP')
+    parser.add_argument('--host', dest='host', action='store', default='127.0.0.1')
+    parser.add_argument('--port', dest='port', type=int, default=5000)
+    parser.add_argument('--workers', dest='workers', type=int, default=multiprocessing.cpu_count(), help='processes running the environments')
+    parser.add_argument('--keepalive', dest='keepalive', type=float, default=75.0, help='keep-alive timeout of the connections, in seconds')
+    args = parser.parse_args()
+
+    server = EnvServer(workers=args.workers)
+    web.run_app(server.app(), host=args.host, port=args.port, keepalive_timeout=args.keepalive)
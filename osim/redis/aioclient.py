@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import numpy as np
+from osim.redis import messages
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+class AsyncClient(object):
+    """
+        asyncio version of osim.redis.client.Client, with the same
+        env_create / env_reset / env_step / submit methods as coroutines.
+
+        Requests are sent on a pool of connections and one task reads
+        all the responses from the response channel of the client, so
+        many coroutines can wait for their responses at the same time
+        (e.g. one per session of a service evaluating many clients).
+
+            client = AsyncClient()
+            await client.connect()
+            observation = await client.env_create()
+            observation, reward, done, info = await client.env_step(action)
+            await client.close()
+
+        Requires redis >= 4.2.
+    """
+    def __init__(self, remote_host='127.0.0.1', remote_port=6379, remote_db=0, remote_password=None, verbose=False, encoding=messages.BINARY, max_connections=16):
+        if aioredis is None:
+            raise ImportError("AsyncClient requires redis >= 4.2 (pip install -U redis)")
+        self.redis_pool = aioredis.BlockingConnectionPool(host=remote_host, port=remote_port, db=remote_db, password=remote_password, max_connections=max_connections)
+        self.namespace = "osim-rl"
+        try:
+            self.service_id =  os.environ['osim_rl_redis_service_id']
+        except KeyError:
+            self.service_id = "osim_rl_redis_service_id"
+        self.command_channel = "{}::{}::commands".format(self.namespace, self.service_id)
+        self.session_id = hashlib.md5("{}".format(random.randint(0, 10**10)).encode('utf-8')).hexdigest()
+        self.response_channel = "{}::{}::response::{}".format(self.namespace, self.service_id, self.session_id)
+        self.sequence = 0
+        self.futures = {}
+        self.reader = None
+        self.verbose = verbose
+        self.requested_encoding = encoding
+        self.encoding = messages.JSON
+        self._redis = aioredis.Redis(connection_pool=self.redis_pool)
+
+    async def connect(self):
+        await self.ping_pong()
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _read_responses(self):
+        # A connection of its own, blocked on the response channel
+        _redis = aioredis.Redis(connection_pool=self.redis_pool)
+        try:
+            while True:
+                _response = (await _redis.blpop(self.response_channel))[1]
+                _response, _ = messages.decode(_response)
+                if self.verbose: print("Response : ", _response)
+                # Services which don't know about sequence numbers answer in order
+                sequence = _response.get('sequence')
+                if sequence is None and self.futures:
+                    sequence = min(self.futures)
+                future = self.futures.pop(sequence, None)
+                if future is None:
+                    # Nobody waits for it (e.g. the request was cancelled)
+                    if self.verbose: print("Dropped response : ", _response)
+                    continue
+                if not future.done():
+                    future.set_result(_response)
+        except Exception as e:
+            # Don't leave the requests waiting forever
+            for future in self.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            self.futures = {}
+            self.reader = None
+            raise
+
+    async def request(self, _request, session_id=None):
+        self.sequence += 1
+        sequence = self.sequence
+        _request['response_channel'] = self.response_channel
+        _request['session_id'] = session_id or self.session_id
+        _request['sequence'] = sequence
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.futures[sequence] = future
+        if self.reader is None:
+            self.reader = loop.create_task(self._read_responses())
+        if self.verbose: print("Request : ", _request)
+        await self._redis.lpush(self.command_channel, messages.encode(_request, self.encoding))
+        _response = await future
+        if _response['type'] == messages.OSIM_RL.ERROR:
+            raise Exception(json.dumps(_response))
+        return _response
+
+    async def ping_pong(self):
+        _request = {}
+        _request['type'] = messages.OSIM_RL.PING
+        _request['payload'] = {}
+        if self.requested_encoding != messages.JSON:
+            _request['payload']['encodings'] = [self.requested_encoding, messages.JSON]
+        _response = await self.request(_request)
+        if _response['type'] != messages.OSIM_RL.PONG:
+            raise Exception("Unable to perform handshake with the redis service. Expected PONG; received {}".format(json.dumps(_response)))
+        self.encoding = _response['payload'].get('encoding', messages.JSON)
+        return True
+
+    def _as_list(self, observation):
+        if isinstance(observation, np.ndarray):
+            return observation.tolist()
+        return observation
+
+    async def env_create(self, session_id=None):
+        _request = {}
+        _request['type'] = messages.OSIM_RL.ENV_CREATE
+        _request['payload'] = {}
+        _response = await self.request(_request, session_id)
+        return self._as_list(_response['payload']['observation'])
+
+    async def env_reset(self, session_id=None):
+        _request = {}
+        _request['type'] = messages.OSIM_RL.ENV_RESET
+        _request['payload'] = {}
+        _response = await self.request(_request, session_id)
+        return self._as_list(_response['payload']['observation'])
+
+    async def env_step(self, action, render=False, session_id=None):
+        _request = {}
+        _request['type'] = messages.OSIM_RL.ENV_STEP
+        _request['payload'] = {}
+        _request['payload']['action'] = np.array(action, dtype=np.float64)
+        _response = await self.request(_request, session_id)
+        _payload = _response['payload']
+        return [np.array(_payload['observation']), _payload['reward'], _payload['done'], _payload['info']]
+
+    async def submit(self, session_id=None):
+        _request = {}
+        _request['type'] = messages.OSIM_RL.ENV_SUBMIT
+        _request['payload'] = {}
+        _response = await self.request(_request, session_id)
+        return _response['payload']
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            try:
+                await self.reader
+            except (asyncio.CancelledError, aioredis.RedisError):
+                # redis-py reports a cancelled blpop as a TimeoutError
+                pass
+            self.reader = None
+        await self.redis_pool.disconnect()
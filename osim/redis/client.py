@@ -28,7 +28,7 @@ class Client(object):
         where `service_id` is either provided as an `env` variable or is
         instantiated to "osim_rl_redis_service_id"
     """
-    def __init__(self, remote_host='127.0.0.1', remote_port=6379, remote_db=0, remote_password=None, verbose=False):
+    def __init__(self, remote_host='127.0.0.1', remote_port=6379, remote_db=0, remote_password=None, verbose=False, encoding=messages.BINARY, max_in_flight=16):
         self.redis_pool = redis.ConnectionPool(host=remote_host, port=remote_port, db=remote_db, password=remote_password)
         self.namespace = "osim-rl"
         try:
@@ -36,51 +36,89 @@ class Client(object):
         except KeyError:
             self.service_id = "osim_rl_redis_service_id"
         self.command_channel = "{}::{}::commands".format(self.namespace, self.service_id)
+        # Identifies the evaluation of this client when the service evaluates many clients at once
+        self.session_id = hashlib.md5("{}".format(random.randint(0, 10**10)).encode('utf-8')).hexdigest()
+        # All the responses come on the same channel, matched to their
+        # requests by sequence number
+        self.response_channel = "{}::{}::response::{}".format(self.namespace, self.service_id, self.session_id)
+        self.sequence = 0
+        self.in_flight = []
+        self.responses = {}
+        self.max_in_flight = max_in_flight
         self.verbose = verbose
+        # Payload encoding, see osim.redis.messages. JSON until the
+        # service accepts `encoding` in the handshake
+        self.requested_encoding = encoding
+        self.encoding = messages.JSON
+        self._redis = self.get_redis_connection()
         self.ping_pong()
 
     def get_redis_connection(self):
         return redis.Redis(connection_pool=self.redis_pool)
 
-    def _generate_response_channel(self):
-        random_hash = hashlib.md5("{}".format(random.randint(0, 10**10)).encode('utf-8')).hexdigest()
-        response_channel = "{}::{}::response::{}".format(   self.namespace,
-                                                            self.service_id,
-                                                            random_hash)
-        return response_channel
+    def _receive(self):
+        _response = self._redis.blpop(self.response_channel)[1]
+        _response, _ = messages.decode(_response)
+        if self.verbose: print("Response : ", _response)
+        # Services which don't know about sequence numbers answer in order
+        sequence = _response.get('sequence', self.in_flight[0])
+        self.in_flight.remove(sequence)
+        self.responses[sequence] = _response
+
+    def send_request(self, _request, session_id=None):
+        """
+            Push the request on the command_channel without waiting for
+            the response, returns its sequence number (see get_response).
+            Up to `max_in_flight` requests can wait for their response.
+            `session_id` selects another session (environment) of the
+            service than the one of this client.
+        """
+        assert type(_request) ==type({})
+        while len(self.in_flight) >= self.max_in_flight:
+            self._receive()
+        self.sequence += 1
+        _request['response_channel'] = self.response_channel
+        _request['session_id'] = session_id or self.session_id
+        _request['sequence'] = self.sequence
+        if self.verbose: print("Request : ", _request)
+        """
+            The client always pushes in the left
+            and the service always pushes in the right
+        """
+        self._redis.lpush(self.command_channel, messages.encode(_request, self.encoding))
+        self.in_flight.append(self.sequence)
+        return self.sequence
 
-    def _blocking_request(self, _request):
+    def get_response(self, sequence):
+        while sequence not in self.responses:
+            self._receive()
+        _response = self.responses.pop(sequence)
+        if _response['type'] == messages.OSIM_RL.ERROR:
+            raise Exception(json.dumps(_response))
+        else:
+            return _response
+
+    def _blocking_request(self, _request, session_id=None):
         """
             request:
                 -command_type
                 -payload
                 -response_channel
+                -session_id
+                -sequence
             response: (on response_channel)
                 - RESULT
             * Send the payload on command_channel (self.namespace+"::command")
                 ** redis-left-push (LPUSH)
             * Keep listening on response_channel (BLPOP)
         """
-        assert type(_request) ==type({})
-        _request['response_channel'] = self._generate_response_channel()
+        return self.get_response(self.send_request(_request, session_id))
 
-        _redis = self.get_redis_connection()
-        """
-            The client always pushes in the left
-            and the service always pushes in the right
-        """
-        if self.verbose: print("Request : ", json.dumps(_response))
-        # Push request in command_channel
-        _redis.lpush(self.command_channel, json.dumps(_request))
-        ## TODO: Check if we can use `repr` for json.dumps string serialization
-        # Wait with a blocking pop for the response
-        _response = _redis.blpop(_request['response_channel'])[1]
-        if self.verbose: print("Response : ", _response)
-        _response = json.loads(_response)
-        if _response['type'] == messages.OSIM_RL.ERROR:
-            raise Exception(json.dumps(_response))
-        else:
-            return _response
+    def _as_list(self, observation):
+        # Observations of env_create and env_reset are lists (or False) whatever the encoding
+        if isinstance(observation, np.ndarray):
+            return observation.tolist()
+        return observation
 
     def ping_pong(self):
         """
@@ -92,38 +130,52 @@ class Client(object):
         _request = {}
         _request['type'] = messages.OSIM_RL.PING
         _request['payload'] = {}
+        if self.requested_encoding != messages.JSON:
+            _request['payload']['encodings'] = [self.requested_encoding, messages.JSON]
         _response = self._blocking_request(_request)
         if _response['type'] != messages.OSIM_RL.PONG:
             raise Exception("Unable to perform handshake with the redis service. Expected PONG; received {}".format(json.dumps(_response)))
         else:
+            self.encoding = _response['payload'].get('encoding', messages.JSON)
             return True
 
-    def env_create(self):
+    def env_create(self, session_id=None):
         _request = {}
         _request['type'] = messages.OSIM_RL.ENV_CREATE
         _request['payload'] = {}
-        _response = self._blocking_request(_request)
+        _response = self._blocking_request(_request, session_id)
         observation = _response['payload']['observation']
-        return observation
+        return self._as_list(observation)
 
-    def env_reset(self):
+    def env_reset(self, session_id=None):
         _request = {}
         _request['type'] = messages.OSIM_RL.ENV_RESET
         _request['payload'] = {}
-        _response = self._blocking_request(_request)
+        _response = self._blocking_request(_request, session_id)
         observation = _response['payload']['observation']
-        return observation
+        return self._as_list(observation)
 
-    def env_step(self, action, render=False):
+    def env_step(self, action, render=False, session_id=None):
         """
             Respond with [observation, reward, done, info]
         """
-        action = np.array(action).tolist()
+        return self.env_step_wait(self.env_step_async(action, session_id))
+
+    def env_step_async(self, action, session_id=None):
+        """
+            Send the action without waiting for the result, e.g. to step
+            several sessions at once. Returns the sequence number to give
+            to env_step_wait.
+        """
+        action = np.array(action, dtype=np.float64)
         _request = {}
         _request['type'] = messages.OSIM_RL.ENV_STEP
         _request['payload'] = {}
         _request['payload']['action'] = action
-        _response = self._blocking_request(_request)
+        return self.send_request(_request, session_id)
+
+    def env_step_wait(self, sequence):
+        _response = self.get_response(sequence)
         _payload = _response['payload']
         observation = np.array(_payload['observation'])
         reward = _payload['reward']
@@ -131,9 +183,9 @@ class Client(object):
         info = _payload['info']
         return [observation, reward, done, info]
 
-    def submit(self):
+    def submit(self, session_id=None):
         _request = {}
         _request['type'] = messages.OSIM_RL.ENV_SUBMIT
         _request['payload'] = {}
-        _response = self._blocking_request(_request)
+        _response = self._blocking_request(_request, session_id)
         return _response['payload']
@@ -1,3 +1,7 @@
+import json
+import struct
+import numpy as np
+
 class OSIM_RL:
     PING = "OSIM_RL.PING"
     PONG = "OSIM_RL.PONG"
@@ -10,3 +14,82 @@ class OSIM_RL:
     ENV_SUBMIT = "OSIM_RL.ENV_SUBMIT"
     ENV_SUBMIT_RESPONSE = "OSIM_RL.ENV_SUBMIT_RESPONSE"
     ERROR = "OSIM_RL.ERROR"
+
+## Payload encodings
+# "json" sends arrays as lists of floats. With "binary" (float64) and
+# "binary32" (float32), a message is a short JSON header followed by the
+# raw little-endian buffers of its NumPy arrays (observations, actions).
+# The client offers the encodings it knows in the payload of PING and the
+# service answers with the one it picked in the payload of PONG; services
+# and clients which don't know about encodings keep using JSON. The
+# service answers every request in the encoding of the request.
+JSON = "json"
+BINARY = "binary"
+BINARY32 = "binary32"
+ENCODINGS = [BINARY, BINARY32, JSON]
+
+_MAGIC = b"\x00OSB"
+_DTYPES = {BINARY: "<f8", BINARY32: "<f4"}
+
+def negotiate(offered):
+    for encoding in offered or []:
+        if encoding in ENCODINGS:
+            return encoding
+    return JSON
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{} is not JSON serializable".format(type(value)))
+
+def encode(message, encoding = JSON):
+    if encoding == JSON:
+        return json.dumps(message, default=_json_default)
+
+    dtype = _DTYPES[encoding]
+    buffers = []
+    offset = [0]
+    def replace(value):
+        if isinstance(value, dict):
+            return dict((key, replace(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return [replace(item) for item in value]
+        if isinstance(value, np.ndarray) and value.dtype.kind in "fiub":
+            data = np.ascontiguousarray(value, dtype=dtype).tobytes()
+            buffers.append(data)
+            offset[0] += len(data)
+            return {"__array__": [offset[0] - len(data), list(value.shape)]}
+        return value
+
+    header = json.dumps({"encoding": encoding, "message": replace(message)}, default=_json_default).encode('utf-8')
+    return b"".join([_MAGIC, struct.pack("<I", len(header)), header] + buffers)
+
+"""
+Decode a message, returns the message and its encoding.
+"""
+def decode(data):
+    if not isinstance(data, bytes) or not data.startswith(_MAGIC):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data), JSON
+
+    size, = struct.unpack_from("<I", data, len(_MAGIC))
+    start = len(_MAGIC) + 4
+    header = json.loads(data[start:start + size].decode('utf-8'))
+    start += size
+    dtype = np.dtype(_DTYPES[header["encoding"]])
+
+    def restore(value):
+        if isinstance(value, dict):
+            if "__array__" in value:
+                offset, shape = value["__array__"]
+                count = int(np.prod(shape))
+                return np.frombuffer(data, dtype=dtype, count=count, offset=start + offset).reshape(shape).copy()
+            return dict((key, restore(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [restore(item) for item in value]
+        return value
+
+    return restore(header["message"]), header["encoding"]
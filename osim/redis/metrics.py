@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+## Service metrics
+# Latency histograms of OsimRlRedisService by command and phase:
+#   decode   : from the raw request to the command dict (in the dispatcher)
+#   simulate : execution of the command (OsimRlSession.handle)
+#   encode   : encoding and pushing of the response
+# plus the depth of the command queue and the steps per second. Under
+# serve(), the queue depth is the number of commands dispatched to each
+# worker and not answered yet (and their total); under run(), it is the
+# length of the redis command list. They are
+# published every `interval` seconds in the redis hash
+# "osim-rl::<service_id>::metrics" and, with a port, as text on
+# http://127.0.0.1:<port>/metrics (Prometheus format).
+
+COMMANDS = ["PING", "ENV_CREATE", "ENV_RESET", "ENV_STEP", "ENV_SUBMIT"]
+
+# Upper bounds of the buckets, in seconds
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")]
+
+def command_name(command):
+    name = command.get('type', '') if isinstance(command, dict) else ''
+    name = name.replace("OSIM_RL.", "")
+    return name if name in COMMANDS else "UNKNOWN"
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    """
+    Upper bound of the bucket of the q-quantile (0 without observations)
+    """
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank, total = q * self.count, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return BUCKETS[-1]
+
+class ServiceMetrics(object):
+    def __init__(self):
+        self.histograms = {}
+        self.steps = 0
+        self.queue_depth = 0
+        self.worker_queue_depths = []
+        self.sessions = 0
+        self.steps_per_sec = 0.0
+        self.started = time.time()
+        self.last_steps = 0
+        self.last_update = time.time()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent by the workers of serve() to the dispatcher
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def observe(self, command, phase, seconds):
+        key = (command_name(command), phase)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+            self.histograms[key].observe(seconds)
+            if key == ("ENV_STEP", "simulate"):
+                self.steps += 1
+
+    def merge(self, other):
+        with self.lock:
+            for key, histogram in other.histograms.items():
+                if key not in self.histograms:
+                    self.histograms[key] = LatencyHistogram()
+                self.histograms[key].merge(histogram)
+            self.steps += other.steps
+
+    """
+    Update the gauges (steps per second since the last update)
+    """
+    def update(self, queue_depth = 0, sessions = 0, worker_queue_depths = None):
+        now = time.time()
+        with self.lock:
+            self.queue_depth = queue_depth
+            self.worker_queue_depths = list(worker_queue_depths or [])
+            self.sessions = sessions
+            if now > self.last_update:
+                self.steps_per_sec = (self.steps - self.last_steps) / (now - self.last_update)
+            self.last_steps = self.steps
+            self.last_update = now
+
+    def as_dict(self):
+        with self.lock:
+            result = {
+                "steps": self.steps,
+                "steps_per_sec": round(self.steps_per_sec, 3),
+                "queue_depth": self.queue_depth,
+                "sessions": self.sessions,
+                "uptime": round(time.time() - self.started, 3),
+                "updated": self.last_update,
+            }
+            for worker, depth in enumerate(self.worker_queue_depths):
+                result["queue_depth.worker{}".format(worker)] = depth
+            for (command, phase), histogram in sorted(self.histograms.items()):
+                prefix = "{}.{}.".format(command, phase)
+                result[prefix + "count"] = histogram.count
+                result[prefix + "mean_ms"] = round(1000 * histogram.sum / max(histogram.count, 1), 3)
+                result[prefix + "p50_ms"] = 1000 * histogram.quantile(0.5)
+                result[prefix + "p99_ms"] = 1000 * histogram.quantile(0.99)
+            return result
+
+    def publish(self, _redis, key):
+        pipeline = _redis.pipeline()
+        for field, value in self.as_dict().items():
+            pipeline.hset(key, field, value)
+        pipeline.execute()
+
+    def prometheus(self):
+        lines = ["# TYPE osim_rl_command_seconds histogram"]
+        with self.lock:
+            for (command, phase), histogram in sorted(self.histograms.items()):
+                labels = 'command="{}",phase="{}"'.format(command, phase)
+                total = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    total += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append('osim_rl_command_seconds_bucket{%s,le="%s"} %d' % (labels, le, total))
+                lines.append('osim_rl_command_seconds_sum{%s} %r' % (labels, histogram.sum))
+                lines.append('osim_rl_command_seconds_count{%s} %d' % (labels, histogram.count))
+            lines += ["# TYPE osim_rl_steps_total counter",
+                      "osim_rl_steps_total %d" % self.steps,
+                      "# TYPE osim_rl_steps_per_second gauge",
+                      "osim_rl_steps_per_second %r" % self.steps_per_sec,
+                      "# TYPE osim_rl_command_queue_depth gauge",
+                      "osim_rl_command_queue_depth %d" % self.queue_depth]
+            if self.worker_queue_depths:
+                lines.append("# TYPE osim_rl_worker_queue_depth gauge")
+                for worker, depth in enumerate(self.worker_queue_depths):
+                    lines.append('osim_rl_worker_queue_depth{worker="%d"} %d' % (worker, depth))
+            lines += ["# TYPE osim_rl_sessions gauge",
+                      "osim_rl_sessions %d" % self.sessions]
+        return "\n".join(lines) + "\n"
+
+"""
+Serve metrics.prometheus() on http://host:port/metrics from a daemon
+thread, returns the server (server.shutdown() to stop it)
+"""
+def serve_metrics(metrics, port, host = '127.0.0.1'):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -2,7 +2,9 @@
 from __future__ import print_function
 import redis
 from osim.redis import messages
+from osim.redis.metrics import ServiceMetrics, serve_metrics
 import json
+import multiprocessing
 import numpy as np
 import osim
 from osim.env import *
@@ -10,6 +12,223 @@ import os
 import timeout_decorator
 import time
 
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+import collections
+
+
+DEFAULT_SESSION = "default"
+
+class OsimRlSession:
+    """
+        State of the evaluation of one client : its environment and
+        its progress through the seed_map.
+    """
+    def __init__(self, service, session_id = DEFAULT_SESSION):
+        self.service = service
+        self.session_id = session_id
+        self.env = False
+        self.env_available = False
+        self.reward = 0
+        self.simulation_count = 0
+        self.simualation_rewards = []
+        self.simulation_times = []
+        self.begin_simulation = False
+        self.current_step = 0
+
+    def create_env(self):
+        return RunEnv(  visualize = self.service.visualize,
+                        max_obstacles = self.service.max_obstacles,
+                        report = self.service.report)
+
+    def _observation(self, _observation):
+        _observation = np.array(_observation, dtype=np.float64)
+        if self.service.report:
+            """
+                In case of reporting mode, truncate to the first
+                41 observations.
+                (The rest are extra activations which are used only for reporting
+                and should not be available to the agent)
+            """
+            _observation = _observation[:41]
+        return _observation
+
+    def handle(self, command):
+        """
+            Execute a command of this session.
+            Returns the response and whether the session is over
+            (submitted, or failed)
+        """
+        service = self.service
+        if command['type'] == messages.OSIM_RL.PING:
+            """
+                INITIAL HANDSHAKE : Respond with PONG
+            """
+            _command_response = {}
+            _command_response['type'] = messages.OSIM_RL.PONG
+            _command_response['payload'] = {}
+            if 'encodings' in command['payload']:
+                _command_response['payload']['encoding'] = messages.negotiate(command['payload']['encodings'])
+            return _command_response, False
+        elif command['type'] == messages.OSIM_RL.ENV_CREATE:
+            """
+                ENV_CREATE
+
+                Respond with initial observation
+            """
+            if self.env: #If env already exists, throw an error
+                _error_message = "Attempt to create environment when one already exists."
+                return service._error_template(_error_message), True
+
+            self.env = self.create_env()
+            _observation = self.env.reset(seed=service.seed_map[self.simulation_count], difficulty=service.difficulty)
+            self.begin_simulation = time.time()
+            self.simualation_rewards.append(0)
+            self.env_available = True
+            self.current_step = 0
+
+            _command_response = {}
+            _command_response['type'] = messages.OSIM_RL.ENV_CREATE_RESPONSE
+            _command_response['payload'] = {}
+            _command_response['payload']['observation'] = self._observation(_observation)
+            return _command_response, False
+        elif command['type'] == messages.OSIM_RL.ENV_RESET:
+            """
+                ENV_RESET
+
+                Respond with observation from next simulation or
+                False if no simulations are left
+            """
+            self.simulation_count += 1
+            if self.begin_simulation:
+                self.simulation_times.append(time.time()-self.begin_simulation)
+                self.begin_simulation = time.time()
+
+            _command_response = {}
+            _command_response['type'] = messages.OSIM_RL.ENV_RESET_RESPONSE
+            _command_response['payload'] = {}
+            if service.seed_map and self.simulation_count < len(service.seed_map):
+                _observation = self.env.reset(seed=service.seed_map[self.simulation_count], difficulty=2)
+                self.simualation_rewards.append(0)
+                self.env_available = True
+                self.current_step = 0
+                _command_response['payload']['observation'] = self._observation(_observation)
+            else:
+                _command_response['payload']['observation'] = False
+            return _command_response, False
+        elif command['type'] == messages.OSIM_RL.ENV_STEP:
+            """
+                ENV_STEP
+
+                Request : Action array
+                Respond with updated [observation,reward,done,info] after step
+            """
+            args = command['payload']
+            action = args['action']
+            action = np.array(action)
+            if self.env and self.env_available:
+                [_observation, reward, done, info] = self.env.step(action)
+            else:
+                if self.env:
+                    raise Exception("Attempt to call `step` function after max_steps={} in a single simulation. Please reset your environment before calling the `step` function after max_step s".format(service.max_steps))
+                else:
+                    raise Exception("Attempt to call `step` function on a non existent `env`")
+            self.reward += reward
+            self.simualation_rewards[-1] += reward
+            self.current_step += 1
+
+            _command_response = {}
+            _command_response['type'] = messages.OSIM_RL.ENV_STEP_RESPONSE
+            _command_response['payload'] = {}
+            _command_response['payload']['observation'] = self._observation(_observation)
+            _command_response['payload']['reward'] = reward
+            _command_response['payload']['done'] = done or self.current_step >= service.max_steps
+            _command_response['payload']['info'] = info
+            if _command_response['payload']['done']:
+                """
+                    Mark env as unavailable until next reset
+                """
+                self.env_available = False
+            if service.verbose: print("Current Step : ", self.current_step)
+            return _command_response, False
+        elif command['type'] == messages.OSIM_RL.ENV_SUBMIT:
+            """
+                ENV_SUBMIT
+
+                Submit the final cumulative reward
+            """
+            _response = {}
+            _response['type'] = messages.OSIM_RL.ENV_SUBMIT_RESPONSE
+            _payload = {}
+            _payload['mean_reward'] = float(self.reward)/len(service.seed_map) #Mean reward
+            _payload['simulation_rewards'] = self.simualation_rewards
+            _payload['simulation_times'] = self.simulation_times
+            _response['payload'] = _payload
+            return _response, True
+        else:
+            _error = service._error_template(
+                            "UNKNOWN_REQUEST:{}".format(
+                                messages.encode(command)))
+            return _error, True
+
+    def close(self):
+        if self.env and hasattr(self.env, "close"):
+            self.env.close()
+
+
+def _session_worker(service, worker, commands, answered, reports):
+    """
+        Worker process of OsimRlRedisService.serve : executes the
+        commands of the sessions assigned to it and pushes the responses.
+        Every answered command is reported on `answered`, with the index
+        of the worker and the response when the session is over. Its metrics are sent to the
+        dispatcher on `reports` every metrics_interval seconds.
+    """
+    _redis = service.get_redis_connection()
+    sessions = {}
+    service.metrics = ServiceMetrics()
+    last_report = time.time()
+    while True:
+        if service.metrics_interval and time.time() - last_report >= service.metrics_interval:
+            reports.put(service.metrics)
+            service.metrics = ServiceMetrics()
+            last_report = time.time()
+        try:
+            item = commands.get(timeout = service.metrics_interval or None)
+        except Empty:
+            continue
+        if item is None:
+            break
+        session_id, command, encoding = item
+        if command is None:
+            # Dropped by the dispatcher (timeout)
+            if session_id in sessions:
+                sessions.pop(session_id).close()
+            continue
+        if session_id not in sessions:
+            sessions[session_id] = OsimRlSession(service, session_id)
+        session = sessions[session_id]
+        try:
+            begin = time.perf_counter()
+            response, over = session.handle(command)
+            service.metrics.observe(command, "simulate", time.perf_counter() - begin)
+            if service.verbose: print("Responding to {} with : {}".format(session_id, response))
+            service.respond(_redis, command, response, encoding)
+        except Exception as e:
+            print("Error in session {} : {}".format(session_id, str(e)))
+            response, over = service._error_template(str(e)), True
+            try:
+                service.respond(_redis, command, response, encoding)
+            except Exception as e:
+                print("Error in session {} : unable to respond : {}".format(session_id, str(e)))
+        if over:
+            sessions.pop(session_id).close()
+        answered.put((worker, session_id, over, response if over else None))
+    reports.put(service.metrics)
+    for session in sessions.values():
+        session.close()
 
 
 class OsimRlRedisService:
@@ -25,30 +244,42 @@ class OsimRlRedisService:
                     max_obstacles = 10,
                     visualize = False,
                     report = None,
-                    verbose = False):
+                    verbose = False,
+                    workers = 1,
+                    metrics_interval = 5,
+                    metrics_port = None,
+                    session_timeout = 15*60):
         """
             TODO: Expose more RunEnv related variables
+
+            With serve(), a session fails when it sends no command, or
+            a command is not answered, for `session_timeout` seconds.
+
+            Metrics (see osim.redis.metrics) are published every
+            `metrics_interval` seconds (None to disable) in the redis hash
+            `metrics_key`, and on http://127.0.0.1:`metrics_port`/metrics
         """
         print("Attempting to connect to redis server at {}:{}/{}".format(remote_host, remote_port, remote_db))
         self.redis_pool = redis.ConnectionPool(host=remote_host, port=remote_port, db=remote_db, password=remote_password)
         self.namespace = "osim-rl"
         self.service_id = osim_rl_redis_service_id
         self.command_channel = "{}::{}::commands".format(self.namespace, self.service_id)
-        self.env = False
-        self.env_available = False
-        self.reward = 0
-        self.simulation_count = 0
-        self.simualation_rewards = []
-        self.simulation_times = []
-        self.begin_simulation = False
-        self.current_step = 0
         self.difficulty = difficulty
         self.max_obstacles = max_obstacles
         self.verbose = verbose
         self.visualize = visualize
         self.report = report
         self.max_steps = max_steps
+        self.workers = workers
+        self.metrics = ServiceMetrics()
+        self.metrics_key = "{}::{}::metrics".format(self.namespace, self.service_id)
+        self.metrics_interval = metrics_interval
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.last_publish = 0
+        self.session_timeout = session_timeout
         self.initalize_seed_map(seed_map)
+        self.session = OsimRlSession(self)
 
     def initalize_seed_map(self, seed_map_string):
         if seed_map_string:
@@ -68,217 +299,281 @@ class OsimRlRedisService:
         _response['payload'] = payload
         return _response
 
+    def check_command(self, command):
+        if not isinstance(command, dict):
+            raise ValueError("Invalid command : {}".format(command))
+        for key in ['type', 'response_channel']:
+            if key not in command:
+                raise ValueError("Invalid command : no {}".format(key))
+
+    def respond_error(self, _redis, command, message, encoding = messages.JSON):
+        """
+            Push an error on the response channel of the command, when
+            it has one. Returns the error.
+        """
+        _error = self._error_template(message)
+        if isinstance(command, dict) and 'response_channel' in command:
+            try:
+                self.respond(_redis, command, _error, encoding)
+            except Exception as e:
+                print("Error : unable to respond : ", str(e))
+        return _error
+
+    def respond(self, _redis, command, response, encoding = messages.JSON):
+        """
+            Push the response on the response channel of the command,
+            with the sequence number of the command (if any) so that a
+            client with many requests in flight can match them.
+        """
+        begin = time.perf_counter()
+        if 'sequence' in command:
+            response['sequence'] = command['sequence']
+        _redis.rpush(command['response_channel'], messages.encode(response, encoding))
+        self.metrics.observe(command, "encode", time.perf_counter() - begin)
+
+    def start_metrics_server(self):
+        if self.metrics_port and self.metrics_server is None:
+            self.metrics_server = serve_metrics(self.metrics, self.metrics_port)
+            print("Serving metrics at : http://127.0.0.1:{}/metrics".format(self.metrics_port))
+
+    def publish_metrics(self, _redis, sessions = 0, force = False, worker_queue_depths = None):
+        """
+            Update the gauges and publish the metrics in the redis hash,
+            at most every metrics_interval seconds unless `force`.
+            Without `worker_queue_depths` (commands waiting in each
+            worker), the queue depth is the length of the command list.
+        """
+        if not self.metrics_interval:
+            return
+        if not force and time.time() - self.last_publish < self.metrics_interval:
+            return
+        if worker_queue_depths is None:
+            queue_depth = _redis.llen(self.command_channel)
+        else:
+            queue_depth = sum(worker_queue_depths)
+        self.metrics.update(queue_depth = queue_depth, sessions = sessions, worker_queue_depths = worker_queue_depths)
+        self.metrics.publish(_redis, self.metrics_key)
+        self.last_publish = time.time()
+
     @timeout_decorator.timeout(15*60)#15*60 seconds timeout for each command
     def get_next_command(self, _redis):
         command = _redis.brpop(self.command_channel)[1]
         return command
 
     def run(self):
+        """
+            Evaluate a single client, in this process. Returns the
+            response to ENV_SUBMIT, or the first error.
+        """
         print("Listening for commands at : ", self.command_channel)
+        self.start_metrics_server()
+        session = self.session
         while True:
             try:
                 _redis = self.get_redis_connection()
                 command = self.get_next_command(_redis)
             except timeout_decorator.timeout_decorator.TimeoutError:
-                raise Exception("Timeout in step {} of simulation {}".format(self.current_step, self.simulation_count))
+                raise Exception("Timeout in step {} of simulation {}".format(session.current_step, session.simulation_count))
             command_response_channel = "default_response_channel"
-            if self.verbose: print("Self.Reward : ", self.reward)
-            if self.verbose: print("Current Simulation : ", self.simulation_count)
-            if self.seed_map and self.verbose and self.simulation_count < len(self.seed_map): print("Current SEED : ", self.seed_map[self.simulation_count])
+            encoding = messages.JSON
+            if self.verbose: print("Self.Reward : ", session.reward)
+            if self.verbose: print("Current Simulation : ", session.simulation_count)
+            if self.seed_map and self.verbose and session.simulation_count < len(self.seed_map): print("Current SEED : ", self.seed_map[session.simulation_count])
             try:
-                command = json.loads(command.decode('utf-8'))
+                begin = time.perf_counter()
+                command, encoding = messages.decode(command)
+                self.metrics.observe(command, "decode", time.perf_counter() - begin)
                 if self.verbose: print("Received Request : ", command)
                 command_response_channel = command['response_channel']
-                if command['type'] == messages.OSIM_RL.PING:
-                    """
-                        INITIAL HANDSHAKE : Respond with PONG
-                    """
-                    _command_response = {}
-                    _command_response['type'] = messages.OSIM_RL.PONG
-                    _command_response['payload'] = {}
-                    if self.verbose: print("Responding with : ", _command_response)
-                    _redis.rpush(command_response_channel, json.dumps(_command_response))
-                elif command['type'] == messages.OSIM_RL.ENV_CREATE:
-                    """
-                        ENV_CREATE
-
-                        Respond with initial observation
-                    """
-                    _payload = command['payload']
-
-                    if self.env: #If env already exists, throw an error
-                        _error_message = "Attempt to create environment when one already exists."
-                        if self.verbose: print("Responding with : ", self._error_template(_error_message))
-                        _redis.rpush( command_response_channel, self._error_template(_error_message))
-                        return self._error_template(_error_message)
-                    else:
-                        self.env = RunEnv(  visualize = self.visualize,
-                                            max_obstacles = self.max_obstacles,
-                                            report = self.report)
-                        _observation = self.env.reset(seed=self.seed_map[self.simulation_count], difficulty=self.difficulty)
-                        self.begin_simulation = time.time()
-                        self.simualation_rewards.append(0)
-                        self.env_available = True
-                        self.current_step = 0
-                        _observation = np.array(_observation).tolist()
-                        if self.report:
-                            """
-                                In case of reporting mode, truncate to the first
-                                41 observations.
-                                (The rest are extra activations which are used only for reporting
-                                and should not be available to the agent)
-                            """
-                            _observation = _observation[:41]
-
-                        _command_response = {}
-                        _command_response['type'] = messages.OSIM_RL.ENV_CREATE_RESPONSE
-                        _command_response['payload'] = {}
-                        _command_response['payload']['observation'] = _observation
-                        if self.verbose: print("Responding with : ", _command_response)
-                        _redis.rpush(command_response_channel, json.dumps(_command_response))
-                elif command['type'] == messages.OSIM_RL.ENV_RESET:
-                    """
-                        ENV_RESET
-
-                        Respond with observation from next simulation or
-                        False if no simulations are left
-                    """
-                    self.simulation_count += 1
-                    if self.begin_simulation:
-                        self.simulation_times.append(time.time()-self.begin_simulation)
-                        self.begin_simulation = time.time()
-                    if self.seed_map and self.simulation_count < len(self.seed_map):
-                        _observation = self.env.reset(seed=self.seed_map[self.simulation_count], difficulty=2)
-                        self.simualation_rewards.append(0)
-                        self.env_available = True
-                        self.current_step = 0
-                        _observation = list(_observation)
-                        if self.report:
-                            """
-                                In case of reporting mode, truncate to the first
-                                41 observations.
-                                (The rest are extra activations which are used only for reporting
-                                and should not be available to the agent)
-                            """
-                            _observation = _observation[:41]
-
-                        _command_response = {}
-                        _command_response['type'] = messages.OSIM_RL.ENV_RESET_RESPONSE
-                        _command_response['payload'] = {}
-                        _command_response['payload']['observation'] = _observation
-                        if self.verbose: print("Responding with : ", _command_response)
-                        _redis.rpush(command_response_channel, json.dumps(_command_response))
-                    else:
-                        _command_response = {}
-                        _command_response['type'] = messages.OSIM_RL.ENV_RESET_RESPONSE
-                        _command_response['payload'] = {}
-                        _command_response['payload']['observation'] = False
-                        if self.verbose: print("Responding with : ", _command_response)
-                        _redis.rpush(command_response_channel, json.dumps(_command_response))
-                elif command['type'] == messages.OSIM_RL.ENV_STEP:
-                    """
-                        ENV_STEP
-
-                        Request : Action array
-                        Respond with updated [observation,reward,done,info] after step
-                    """
-                    args = command['payload']
-                    action = args['action']
-                    action = np.array(action)
-                    if self.env and self.env_available:
-                        [_observation, reward, done, info] = self.env.step(action)
-                    else:
-                        if self.env:
-                            raise Exception("Attempt to call `step` function after max_steps={} in a single simulation. Please reset your environment before calling the `step` function after max_step s".format(self.max_steps))
-                        else:
-                                raise Exception("Attempt to call `step` function on a non existent `env`")
-                    self.reward += reward
-                    self.simualation_rewards[-1] += reward
-                    self.current_step += 1
-                    _observation = np.array(_observation).tolist()
-                    if self.report:
-                        """
-                            In case of reporting mode, truncate to the first
-                            41 observations.
-                            (The rest are extra activations which are used only for reporting
-                            and should not be available to the agent)
-                        """
-                        _observation = _observation[:41]
-
-                    if self.current_step >= self.max_steps:
-                        _command_response = {}
-                        _command_response['type'] = messages.OSIM_RL.ENV_STEP_RESPONSE
-                        _command_response['payload'] = {}
-                        _command_response['payload']['observation'] = _observation
-                        _command_response['payload']['reward'] = reward
-                        _command_response['payload']['done'] = True
-                        _command_response['payload']['info'] = info
-
-                        """
-                        Mark env as unavailable until next reset
-                        """
-                        self.env_available = False
-                    else:
-                        _command_response = {}
-                        _command_response['type'] = messages.OSIM_RL.ENV_STEP_RESPONSE
-                        _command_response['payload'] = {}
-                        _command_response['payload']['observation'] = _observation
-                        _command_response['payload']['reward'] = reward
-                        _command_response['payload']['done'] = done
-                        _command_response['payload']['info'] = info
-
-                        if done:
-                            """
-                                Mark env as unavailable until next reset
-                            """
-                            self.env_available = False
-                    if self.verbose: print("Responding with : ", _command_response)
-                    if self.verbose: print("Current Step : ", self.current_step)
-                    _redis.rpush(command_response_channel, json.dumps(_command_response))
-                elif command['type'] == messages.OSIM_RL.ENV_SUBMIT:
-                    """
-                        ENV_SUBMIT
-
-                        Submit the final cumulative reward
-                    """
-                    _response = {}
-                    _response['type'] = messages.OSIM_RL.ENV_SUBMIT_RESPONSE
-                    _payload = {}
-                    _payload['mean_reward'] = np.float(self.reward)/len(self.seed_map) #Mean reward
-                    _payload['simulation_rewards'] = self.simualation_rewards
-                    _payload['simulation_times'] = self.simulation_times
-                    _response['payload'] = _payload
-                    _redis.rpush(command_response_channel, json.dumps(_response))
-                    if self.verbose: print("Responding with : ", _response)
-                    return _response
-                else:
-                    _error = self._error_template(
-                                    "UNKNOWN_REQUEST:{}".format(
-                                        json.dumps(command)))
-                    if self.verbose: print("Responding with : ", json.dumps(_error))
-                    _redis.rpush(command_response_channel, json.dumps(_error))
-                    return _error
-
+                begin = time.perf_counter()
+                _command_response, over = session.handle(command)
+                self.metrics.observe(command, "simulate", time.perf_counter() - begin)
+                if self.verbose: print("Responding with : ", _command_response)
+                self.respond(_redis, command, _command_response, encoding)
+                self.publish_metrics(_redis, sessions = 1, force = over)
+                if over:
+                    return _command_response
             except Exception as e:
                 print("Error : ", str(e))
+                _error = self._error_template(str(e))
+                if isinstance(command, dict) and 'sequence' in command:
+                    _error['sequence'] = command['sequence']
                 _redis.rpush(   command_response_channel,
-                                json.dumps(self._error_template(str(e))))
+                                messages.encode(_error, encoding))
                 return self._error_template(str(e))
 
+    def serve(self, max_sessions = None):
+        """
+            Evaluate many clients at once with a pool of `workers`
+            processes. Clients are told apart by the `session_id` of their
+            commands, and every session goes through the seed_map on its
+            own. A new session is given to the worker with the fewest
+            sessions, and all its commands are executed by that worker.
+
+            Returns the responses to ENV_SUBMIT (or the errors) by
+            session, after `max_sessions` sessions (None to serve forever).
+        """
+        print("Listening for commands at : {} with {} workers".format(self.command_channel, self.workers))
+        ctx = multiprocessing.get_context("fork")
+        answered = ctx.Queue()
+        reports = ctx.Queue()
+        queues, processes = [None] * self.workers, [None] * self.workers
+
+        def start_worker(worker):
+            queues[worker] = ctx.Queue()
+            processes[worker] = ctx.Process(target=_session_worker, args=(self, worker, queues[worker], answered, reports))
+            processes[worker].daemon = True
+            processes[worker].start()
+
+        for worker in range(self.workers):
+            start_worker(worker)
+
+        assignment = {} # session_id -> worker
+        load = [0] * self.workers
+        pending = {} # session_id -> (command, encoding) not answered yet, in order
+        queue_depths = [0] * self.workers # commands dispatched to each worker and not answered yet
+        last_activity = {} # session_id -> time of its last command or response
+        results = {}
+        _redis = self.get_redis_connection()
+        self.start_metrics_server()
+
+        def collect_metrics():
+            while True:
+                try:
+                    self.metrics.merge(reports.get_nowait())
+                except Empty:
+                    break
+
+        def end_session(session_id, response):
+            load[assignment.pop(session_id)] -= 1
+            del pending[session_id], last_activity[session_id]
+            results[session_id] = response
+
+        def fail_session(session_id, message):
+            print("Error in session {} : {}".format(session_id, message))
+            _error = self._error_template(message)
+            # Whoever waits for a response gets the error
+            for command, encoding in pending[session_id]:
+                self.respond_error(_redis, command, message, encoding)
+            end_session(session_id, _error)
+
+        def collect_answers():
+            while True:
+                try:
+                    worker, session_id, over, response = answered.get_nowait()
+                except Empty:
+                    break
+                # Also for the commands of a session which is over
+                queue_depths[worker] -= 1
+                if session_id not in assignment:
+                    # Already over or failed
+                    continue
+                pending[session_id].popleft()
+                last_activity[session_id] = time.time()
+                if over:
+                    end_session(session_id, response)
+
+        def restart_worker(worker, message):
+            process = processes[worker]
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            print("Restarting worker {} : {}".format(worker, message))
+            # Commands answered before it exited are not failed
+            collect_answers()
+            for session_id in [key for key, value in assignment.items() if value == worker]:
+                fail_session(session_id, message)
+            queue_depths[worker] = 0
+            start_worker(worker)
+
+        def check_sessions():
+            for worker, process in enumerate(processes):
+                if not process.is_alive():
+                    restart_worker(worker, "Worker exited with code {}".format(process.exitcode))
+            if not self.session_timeout:
+                return
+            now = time.time()
+            for session_id in list(last_activity):
+                if session_id not in last_activity or now - last_activity[session_id] < self.session_timeout:
+                    continue
+                worker = assignment[session_id]
+                if pending[session_id]:
+                    # The worker is stuck in a command, with all its sessions
+                    restart_worker(worker, "Timeout : a command of session {} took more than {} seconds".format(session_id, self.session_timeout))
+                else:
+                    queues[worker].put((session_id, None, None))
+                    fail_session(session_id, "Timeout : no command for {} seconds".format(self.session_timeout))
+
+        try:
+            while max_sessions is None or len(results) < max_sessions:
+                collect_metrics()
+                collect_answers()
+                self.publish_metrics(_redis, sessions = len(assignment), worker_queue_depths = queue_depths)
+                check_sessions()
+                if max_sessions is not None and len(results) >= max_sessions:
+                    break
+
+                item = _redis.brpop(self.command_channel, timeout=1)
+                if item is None:
+                    continue
+                command, encoding = None, messages.JSON
+                try:
+                    begin = time.perf_counter()
+                    command, encoding = messages.decode(item[1])
+                    self.metrics.observe(command, "decode", time.perf_counter() - begin)
+                    if self.verbose: print("Received Request : ", command)
+                    self.check_command(command)
+
+                    if command['type'] == messages.OSIM_RL.PING:
+                        begin = time.perf_counter()
+                        _command_response, over = self.session.handle(command)
+                        self.metrics.observe(command, "simulate", time.perf_counter() - begin)
+                        self.respond(_redis, command, _command_response, encoding)
+                        continue
+                except Exception as e:
+                    print("Error : ", str(e))
+                    self.respond_error(_redis, command, str(e), encoding)
+                    continue
+
+                session_id = command.get('session_id', DEFAULT_SESSION)
+                if session_id not in assignment:
+                    assignment[session_id] = load.index(min(load))
+                    load[assignment[session_id]] += 1
+                    pending[session_id] = collections.deque()
+                pending[session_id].append((command, encoding))
+                queue_depths[assignment[session_id]] += 1
+                last_activity[session_id] = time.time()
+                queues[assignment[session_id]].put((session_id, command, encoding))
+        finally:
+            for queue in queues:
+                queue.put(None)
+            for process in processes:
+                process.join()
+            collect_metrics()
+            self.publish_metrics(_redis, force = True, worker_queue_depths = queue_depths)
+        return results
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Submit the result to crowdAI')
     parser.add_argument('--port', dest='port', action='store', required=True)
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='evaluate several clients at once')
+    parser.add_argument('--sessions', dest='sessions', type=int, default=None, help='with --workers, stop after this number of clients')
+    parser.add_argument('--metrics-port', dest='metrics_port', type=int, default=None, help='serve the metrics on http://127.0.0.1:<port>/metrics')
     args = parser.parse_args()
 
-    grader = OsimRlRedisService(remote_port=int(args.port), seed_map="11,22,33", max_steps=1000, verbose=True)
-    result = grader.run()
-    if result['type'] == messages.OSIM_RL.ENV_SUBMIT_RESPONSE:
-        cumulative_results = result['payload']
-        print("Results : ", cumulative_results)
-    elif result['type'] == messages.OSIM_RL.ERROR:
-        error = result['payload']
-        raise Exception("Evaluation Failed : {}".format(str(error)))
+    grader = OsimRlRedisService(remote_port=int(args.port), seed_map="11,22,33", max_steps=1000, verbose=True, workers=args.workers, metrics_port=args.metrics_port)
+    if args.workers > 1:
+        for session_id, result in grader.serve(args.sessions).items():
+            print("Results of {} : {}".format(session_id, result['payload']))
     else:
-        #Evaluation failed
-        print("Evaluation Failed : ", result['payload'])
+        result = grader.run()
+        if result['type'] == messages.OSIM_RL.ENV_SUBMIT_RESPONSE:
+            cumulative_results = result['payload']
+            print("Results : ", cumulative_results)
+        elif result['type'] == messages.OSIM_RL.ERROR:
+            error = result['payload']
+            raise Exception("Evaluation Failed : {}".format(str(error)))
+        else:
+            #Evaluation failed
+            print("Evaluation Failed : ", result['payload'])
@@ -19,7 +19,10 @@ setup(name='osim-rl',
       packages=find_packages(),
       package_data={'osim': ['models/Geometry/*.vtp', 'models/*.osim']},
       include_package_data=True,
+      entry_points={'console_scripts': ['osim-bench=osim.bench:main']},
       install_requires=['numpy>=1.14.2','gym>=0.10.4', 'redis>=2.10.6', 'timeout-decorator>=0.4.0'],
+      extras_require={'async': ['aiohttp>=3.0', 'redis>=4.2'],
+                      'test': ['aiohttp>=3.0', 'redis>=4.2', 'fakeredis>=2.0']},
       classifiers=[
           'Intended Audience :: Science/Research',
           'Operating System :: OS Independent',
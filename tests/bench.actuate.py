@@ -0,0 +1,35 @@
+# Micro-benchmark of setting muscle excitations:
+# the per-step SWIG lookup through the controller set
+# versus OsimModel.set_excitations with cached function handles
+import timeit
+import numpy as np
+import opensim
+from osim.env import ProstheticsEnv
+
+env = ProstheticsEnv(visualize=False)
+env.reset()
+model = env.osim_model
+nsteps = 1000
+
+actions = [np.random.uniform(size=model.noutput) for i in range(nsteps)]
+
+def controller_set_path():
+    for action in actions:
+        brain = opensim.PrescribedController.safeDownCast(model.model.getControllerSet().get(0))
+        functionSet = brain.get_ControlFunctions()
+        for j in range(functionSet.getSize()):
+            func = opensim.Constant.safeDownCast(functionSet.get(j))
+            func.setValue( float(action[j]) )
+
+def cached_path():
+    for action in actions:
+        model.set_excitations(action)
+
+def cached_path_repeated():
+    # A policy repeating its action: nothing to update
+    for action in actions:
+        model.set_excitations(actions[0])
+
+for name, fn in [("controller set", controller_set_path), ("cached handles", cached_path), ("cached handles, repeated action", cached_path_repeated)]:
+    t = min(timeit.repeat(fn, number=1, repeat=5))
+    print("%-32s %8.2f us/step" % (name, t / nsteps * 1e6))
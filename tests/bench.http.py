@@ -0,0 +1,72 @@
+# Load test of osim.http.server: per-step overhead of the blocking client
+# (round trip minus the time of a step in process) and steps per second
+# of the asyncio client with many concurrent episodes, by encoding.
+#
+#     python tests/bench.http.py [workers] [concurrent episodes]
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+from osim.env import L2RunEnv
+from osim.http.client import Client
+from osim.redis import messages
+
+nsteps = 200
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+episodes = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+port = 5057
+remote_base = "http://127.0.0.1:%d" % port
+action = [0.5] * 18
+
+env = L2RunEnv(visualize=False)
+env.reset()
+start = time.time()
+for i in range(nsteps):
+    env.step(action)
+step_time = (time.time() - start) / nsteps
+print("in process          %8.1f us per step" % (step_time * 1e6))
+
+server = subprocess.Popen([sys.executable, "-m", "osim.http.server", "--port", str(port), "--workers", str(workers)],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+try:
+    for i in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    client = Client(remote_base)
+    client.env_create("bench")
+    start = time.time()
+    for i in range(nsteps):
+        client.env_step(action)
+    elapsed = (time.time() - start) / nsteps
+    client.env_close()
+    print("blocking client     %8.1f us per step, overhead %8.1f us" % (elapsed * 1e6, (elapsed - step_time) * 1e6))
+
+    import aiohttp
+    from osim.http.aioclient import AsyncClient
+
+    async def episode(session, encoding):
+        client = AsyncClient(remote_base, session, encoding=encoding)
+        await client.env_create("bench")
+        for i in range(nsteps):
+            await client.env_step(action)
+        await client.env_close()
+
+    async def run(encoding):
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=episodes)) as session:
+            start = time.time()
+            await asyncio.gather(*[episode(session, encoding) for i in range(episodes)])
+            return time.time() - start
+
+    for encoding in messages.ENCODINGS:
+        elapsed = asyncio.get_event_loop().run_until_complete(run(encoding))
+        print("async %-9s     %8.1f steps per second (%d episodes, %d workers)" % (encoding, episodes * nsteps / elapsed, episodes, workers))
+finally:
+    server.terminate()
+    server.wait()
@@ -0,0 +1,43 @@
+# Benchmark of the integrator settings: steps per second and
+# deviation of the trajectory from a tight-tolerance reference
+import time
+import numpy as np
+from osim.env import L2RunEnv
+
+nsteps = 100
+np.random.seed(0)
+actions = [np.random.uniform(size=18) for i in range(nsteps)]
+
+def run(**options):
+    env = L2RunEnv(visualize=False, **options)
+    env.reset()
+    trajectory = []
+    start = time.time()
+    for action in actions:
+        observation, reward, done, info = env.step(action)
+        trajectory.append(observation)
+    return nsteps / (time.time() - start), np.array(trajectory)
+
+settings = [
+    dict(integrator_accuracy = 5e-5),
+    dict(integrator_accuracy = 1e-3),
+    dict(integrator_accuracy = 1e-2),
+    dict(integrator_accuracy = 5e-5, integrator = "RungeKutta3"),
+    dict(integrator_accuracy = 5e-5, integrator = "RungeKuttaFeldberg"),
+    dict(integrator_accuracy = 1e-3, integrator = "SemiExplicitEuler2"),
+    dict(integrator_accuracy = 1e-3, integrator = "SemiExplicitEuler2", integrator_max_step = 1e-3),
+    dict(integrator_accuracy = 5e-5, integrator = "CPodes"),
+    dict(integrator_accuracy = 5e-5, integrator_internal_step_limit = 100),
+]
+
+reference_speed, reference = run(integrator_accuracy = 1e-8)
+print("reference (accuracy 1e-8): %.1f steps/s" % reference_speed)
+for options in settings:
+    try:
+        speed, trajectory = run(**options)
+    except ValueError as e:
+        print("%-90s %s" % (options, e))
+        continue
+    deviation = np.abs(trajectory - reference)
+    print("%-90s %8.1f steps/s, max deviation %.2e, final deviation %.2e" %
+          (options, speed, deviation.max(), deviation[-1].max()))
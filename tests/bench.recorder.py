@@ -0,0 +1,53 @@
+# Benchmark of the overhead of the trajectory recorder: steps per second
+# without recorder, recording observations only (record_states=False) and
+# with the state Y vector, and the cost of reading the Y vector in bulk
+# (Vector.to_numpy) and element by element
+import shutil
+import tempfile
+import time
+import numpy as np
+from osim.env import L2RunEnv, ProstheticsEnv, Arm2DEnv
+from osim.env.recorder import TrajectoryRecorder
+
+nsteps = 500
+nreads = 2000
+
+def steps_per_second(env, actions):
+    env.reset()
+    start = time.time()
+    for action in actions:
+        observation, reward, done, info = env.step(action)
+        if done:
+            env.reset()
+    return len(actions) / (time.time() - start)
+
+for env_class in [L2RunEnv, ProstheticsEnv, Arm2DEnv]:
+    directory = tempfile.mkdtemp()
+    try:
+        results = []
+        for name, record_states in [("no recorder", None), ("record_states=False", False), ("record_states=True", True)]:
+            recorder = None
+            if record_states is not None:
+                recorder = TrajectoryRecorder(tempfile.mkdtemp(dir=directory), record_states=record_states)
+            env = env_class(visualize=False, recorder=recorder)
+            actions = np.random.RandomState(0).uniform(size=(nsteps, env.action_space.shape[0]))
+            results.append("%s %8.1f steps/s" % (name, steps_per_second(env, actions)))
+            env.close()
+        print("%-16s %s" % (env_class.__name__, ", ".join(results)))
+
+        model = env_class(visualize=False).osim_model
+        model.reset()
+        y = model.state.getY()
+        ny = y.size()
+        start = time.time()
+        for i in range(nreads):
+            model.get_y()
+        bulk = (time.time() - start) / nreads
+        start = time.time()
+        for i in range(nreads):
+            np.fromiter((y[i] for i in range(ny)), dtype=np.float64, count=ny)
+        elements = (time.time() - start) / nreads
+        print("%-16s get_y of %d values: %7.2f us (%s), element by element %7.2f us" %
+              (env_class.__name__, ny, bulk * 1e6, "to_numpy" if hasattr(y, "to_numpy") else "element by element", elements * 1e6))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,50 @@
+# Benchmark of the payload encodings of the redis protocol: bytes per
+# step (request and response) and encode/decode time. With a running
+# redis server (python tests/bench.redis.py 6379), also the round-trip
+# latency of a step through redis, with an echo service in a thread.
+import sys
+import threading
+import time
+import numpy as np
+from osim.redis import messages
+
+nsteps = 2000
+observation_size, action_size = 158, 19
+
+request = {"type": messages.OSIM_RL.ENV_STEP, "payload": {"action": np.random.uniform(size=action_size)},
+           "response_channel": "osim-rl::osim_rl_redis_service_id::response::0123456789abcdef", "session_id": "0123456789abcdef"}
+response = {"type": messages.OSIM_RL.ENV_STEP_RESPONSE, "payload": {"observation": np.random.normal(size=observation_size),
+            "reward": 8.7, "done": False, "info": {}}}
+
+def roundtrip(encoding):
+    # What both sides do for a step
+    _request = messages.decode(messages.encode(request, encoding))[0]
+    return messages.decode(messages.encode(response, encoding))[0]
+
+for encoding in messages.ENCODINGS:
+    size = len(messages.encode(request, encoding)) + len(messages.encode(response, encoding))
+    start = time.time()
+    for i in range(nsteps):
+        roundtrip(encoding)
+    print("%-9s %6d bytes per step, encode + decode %7.1f us per step" % (encoding, size, (time.time() - start) / nsteps * 1e6))
+
+if len(sys.argv) > 1:
+    import redis
+    _redis = redis.Redis(port=int(sys.argv[1]))
+    channel, response_channel = "osim-rl::bench::commands", request["response_channel"]
+
+    def echo(n):
+        connection = redis.Redis(port=int(sys.argv[1]))
+        for i in range(n):
+            command, encoding = messages.decode(connection.brpop(channel)[1])
+            connection.rpush(response_channel, messages.encode(response, encoding))
+
+    for encoding in messages.ENCODINGS:
+        thread = threading.Thread(target=echo, args=(nsteps,))
+        thread.start()
+        start = time.time()
+        for i in range(nsteps):
+            _redis.lpush(channel, messages.encode(request, encoding))
+            messages.decode(_redis.blpop(response_channel)[1])
+        thread.join()
+        print("%-9s round trip through redis %7.1f us per step" % (encoding, (time.time() - start) / nsteps * 1e6))
@@ -0,0 +1,26 @@
+# Benchmark of OsimModel.reset and of the time to the first observation,
+# with and without the cached initial state
+import time
+from osim.env import L2RunEnv, ProstheticsEnv, Arm2DEnv
+
+nresets = 50
+
+for env_class in [L2RunEnv, ProstheticsEnv, Arm2DEnv]:
+    start = time.time()
+    env = env_class(visualize=False)
+    construction = time.time() - start
+
+    start = time.time()
+    env.reset()
+    first_reset = time.time() - start
+
+    for cache in [False, True]:
+        env.osim_model.cache_initial_state = cache
+        env.memoize_reset_observation = cache and env_class.memoize_reset_observation
+        env.reset()
+
+        start = time.time()
+        for i in range(nresets):
+            env.reset()
+        print("%-16s cache=%-5s construction %7.1f ms, first reset %7.1f ms, reset to first observation %7.2f ms" %
+              (env_class.__name__, cache, construction * 1e3, first_reset * 1e3, (time.time() - start) / nresets * 1e3))
@@ -1,5 +1,6 @@
 from osim.env import L2RunEnv
 import numpy as np
+import opensim
 import unittest
 
 class ActivationsTest(unittest.TestCase):
@@ -44,6 +45,39 @@ class ActivationsTest(unittest.TestCase):
 
         self.assertFalse(dist < 1e-2,"Activations after 5 steps haven't changed (despite different initial conditions)")
 
-        
+    def controller_values(self, env):
+        # Read back through the model rather than the cached handles
+        model = env.osim_model.model
+        brain = opensim.PrescribedController.safeDownCast(model.getControllerSet().get(0))
+        functionSet = brain.get_ControlFunctions()
+        return [opensim.Constant.safeDownCast(functionSet.get(j)).get_value() for j in range(functionSet.getSize())]
+
+    def test_set_excitations(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+
+        excitations = np.linspace(0, 1, 18)
+        env.osim_model.set_excitations(excitations)
+        self.assertTrue(np.allclose(self.controller_values(env), excitations))
+
+        excitations[5] = np.nan
+        self.assertRaises(ValueError, env.osim_model.set_excitations, excitations)
+
+    def test_set_unchanged_excitations(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+
+        excitations = np.linspace(0, 1, 18)
+        env.osim_model.set_excitations(excitations)
+        env.osim_model.set_excitations(excitations.copy())
+        self.assertTrue(np.allclose(self.controller_values(env), excitations))
+        env.step(excitations)
+        self.assertTrue(np.allclose(self.controller_values(env), excitations))
+
+        changed = excitations.copy()
+        changed[[0, 7, 17]] = [0.25, 0.5, 0.75]
+        env.osim_model.set_excitations(changed)
+        self.assertTrue(np.allclose(self.controller_values(env), changed))
+
 if __name__ == '__main__':
     unittest.main()
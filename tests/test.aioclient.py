@@ -0,0 +1,132 @@
+from osim.redis import messages
+import asyncio
+import threading
+import unittest
+from unittest import mock
+import numpy as np
+
+try:
+    import fakeredis
+    import redis
+    from osim.redis.aioclient import AsyncClient as RedisAsyncClient
+except ImportError:
+    fakeredis = None
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from osim.http.aioclient import AsyncClient as HttpAsyncClient
+except ImportError:
+    web = None
+
+def reversed_service(port, channel, steps):
+    """
+    Answers the handshake, then `steps` ENV_STEP commands in the reverse
+    order (observation = action), with unsolicited responses around them.
+    """
+    _redis = redis.Redis(port=port)
+    def respond(command, encoding, response):
+        if 'sequence' in command:
+            response['sequence'] = command['sequence']
+        _redis.rpush(command['response_channel'], messages.encode(response, encoding))
+
+    command, encoding = messages.decode(_redis.brpop(channel)[1])
+    respond(command, encoding, {'type': messages.OSIM_RL.PONG, 'payload': {'encoding': command['payload']['encodings'][0]}})
+    commands = [messages.decode(_redis.brpop(channel)[1]) for i in range(steps)]
+    _redis.rpush(command['response_channel'], messages.encode({'type': messages.OSIM_RL.ERROR, 'payload': "stale", 'sequence': 10**6}))
+    for command, encoding in reversed(commands):
+        respond(command, encoding, {'type': messages.OSIM_RL.ENV_STEP_RESPONSE, 'payload': {
+            'observation': command['payload']['action'], 'reward': 1.0, 'done': False, 'info': {}}})
+    # Without sequence number, while no request waits
+    _redis.rpush(command['response_channel'], messages.encode({'type': messages.OSIM_RL.PONG, 'payload': {}}))
+
+@unittest.skipIf(fakeredis is None, "requires fakeredis and redis >= 4.2")
+class RedisAsyncClientTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+        self.port = self.server.server_address[1]
+        # The blpop of a cancelled reader stays blocked in the server
+        self.server.daemon_threads = True
+        self.server.block_on_close = False
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_concurrent_steps_out_of_order(self):
+        client = RedisAsyncClient(remote_port=self.port)
+        service = threading.Thread(target=reversed_service, args=(self.port, client.command_channel, 4))
+        service.daemon = True
+        service.start()
+        await client.connect()
+        self.assertEqual(client.encoding, messages.BINARY)
+
+        actions = [[float(i)] * 18 for i in range(4)]
+        results = await asyncio.gather(*[client.env_step(action, session_id=str(i)) for i, action in enumerate(actions)])
+        for action, (observation, reward, done, info) in zip(actions, results):
+            self.assertEqual(observation.tolist(), action)
+        self.assertEqual(client.futures, {})
+
+        # The response without sequence number is dropped, the reader goes on
+        await asyncio.sleep(0.3)
+        self.assertFalse(client.reader.done())
+        await client.close()
+        service.join(5)
+
+def fake_app():
+    # The routes of osim.http.server, a step takes longer for smaller actions
+    def respond(request, encoding, result):
+        if encoding == messages.JSON:
+            return web.Response(text=messages.encode(result), content_type="application/json")
+        return web.Response(body=messages.encode(result, encoding), content_type="application/x-osim-rl")
+
+    async def handle(request):
+        raw = await request.read()
+        data, encoding = messages.decode(raw) if raw else ({}, messages.JSON)
+        route = request.match_info.get("route", "")
+        if route == "":
+            return respond(request, encoding, {"instance_id": "fake"})
+        if route == "reset/":
+            return respond(request, encoding, {"observation": [0.0] * 18})
+        if route == "step/":
+            action = np.asarray(data["action"], dtype=np.float64)
+            await asyncio.sleep(0.05 * (4 - action[0]))
+            return respond(request, encoding, {"observation": action, "reward": 1.0, "done": False, "info": {}})
+        return respond(request, encoding, {})
+
+    app = web.Application()
+    app.router.add_post('/v1/envs/', handle)
+    app.router.add_post('/v1/envs/{instance_id}/{route:.*}', handle)
+    return app
+
+@unittest.skipIf(web is None, "requires aiohttp")
+class HttpAsyncClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = TestServer(fake_app())
+        await self.server.start_server()
+        patcher = mock.patch("osim.http.aioclient.pkg_resources.get_distribution")
+        patcher.start().return_value.version = "2.1.0"
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_concurrent_steps_out_of_order(self):
+        for encoding in [messages.JSON, messages.BINARY]:
+            clients = [HttpAsyncClient(str(self.server.make_url("/")), encoding=encoding) for i in range(4)]
+            await asyncio.gather(*[client.env_create("token") for client in clients])
+            actions = [[float(i)] * 18 for i in range(4)]
+            # The first step is answered last
+            results = await asyncio.gather(*[client.env_step(action) for client, action in zip(clients, actions)])
+            for action, (observation, reward, done, info) in zip(actions, results):
+                self.assertEqual(list(observation), action)
+                self.assertEqual(reward, 1.0)
+            if encoding != messages.JSON:
+                self.assertIsInstance(results[0][0], np.ndarray)
+            await asyncio.gather(*[client.env_close() for client in clients])
+
+if __name__ == '__main__':
+    unittest.main()
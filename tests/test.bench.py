@@ -0,0 +1,93 @@
+from osim import bench
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+def _results(steps_per_second, construction = 1.0, import_time = 1.0):
+    return {"meta": {}, "import_time": import_time, "results": [
+        {"case": "env:L2RunEnv", "accuracy": 5e-5, "construction": construction,
+         "first_reset": 0.1, "reset": 0.01, "steps_per_second": steps_per_second},
+        {"case": "env:Arm2DEnv", "accuracy": 5e-5, "error": "RuntimeError: failed"},
+    ]}
+
+class BenchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, results):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            json.dump(results, f)
+        return path
+
+    def _main(self, argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            code = bench.main(argv)
+        return code, output.getvalue()
+
+    def test_list(self):
+        code, output = self._main(["list"])
+        cases = output.split()
+        self.assertEqual(code, 0)
+        self.assertIn("env:L2RunEnv", cases)
+        self.assertIn("env:ProstheticsEnv-2D", cases)
+        self.assertIn("env:RunEnv", cases)
+        self.assertTrue(any(case.startswith("model:") and case.endswith(".osim") for case in cases))
+
+    def test_compare(self):
+        before = self._write("before.json", _results(1000.0))
+        same = self._write("same.json", _results(950.0, construction = 1.05))
+        slower = self._write("slower.json", _results(800.0))
+
+        code, output = self._main(["compare", before, same])
+        self.assertEqual(code, 0)
+        self.assertNotIn("REGRESSION", output)
+        self.assertNotIn("Arm2DEnv", output)
+
+        code, output = self._main(["compare", before, slower, "--threshold", "0.1"])
+        self.assertEqual(code, 1)
+        self.assertIn("steps_per_second", output)
+        self.assertIn("1 regression(s) above 10%", output)
+
+        code, output = self._main(["compare", before, slower, "--threshold", "0.5"])
+        self.assertEqual(code, 0)
+
+        slow_import = self._write("slow_import.json", _results(1000.0, import_time = 2.0))
+        code, output = self._main(["compare", before, slow_import])
+        self.assertEqual(code, 1)
+        self.assertIn("import_time", output)
+
+    def test_compare_errors(self):
+        before = _results(1000.0)
+
+        # A case which starts failing
+        after = _results(1000.0)
+        after["results"][0] = {"case": "env:L2RunEnv", "accuracy": 5e-5, "error": "RuntimeError: failed"}
+        regressions = bench.compare(before, after, verbose = False)
+        self.assertEqual(regressions, [("env:L2RunEnv", 5e-5, "error", None)])
+
+        # A case which disappears
+        after = _results(1000.0)
+        del after["results"][0]
+        regressions = bench.compare(before, after, verbose = False)
+        self.assertEqual(regressions, [("env:L2RunEnv", 5e-5, "missing", None)])
+
+        # A case which already failed before is not a regression
+        after = _results(1000.0)
+        self.assertEqual(bench.compare(before, after, verbose = False), [])
+
+    def test_prosthetics_variant(self):
+        env = bench.ENVS["ProstheticsEnv-2D"](1e-3)
+        self.assertEqual(env.get_model_key(), "2D")
+        self.assertEqual(env.model_path, env.model_paths["2D"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+from osim.env import ProstheticsEnv
+from osim.env.cache import ModelCache
+import unittest
+
+class ModelCacheTest(unittest.TestCase):
+    def test_lru(self):
+        cache = ModelCache(max_models=2)
+        created = []
+        def create(key):
+            created.append(key)
+            return key.upper()
+
+        for key in ["a", "b", "a", "c", "b"]:
+            self.assertEqual(cache.get(key, lambda: create(key)), key.upper())
+        self.assertEqual(created, ["a", "b", "c", "b"])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 4)
+        self.assertEqual(cache.stats()["evictions"], 2)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse("a" in cache)
+
+    def test_change_model(self):
+        env = ProstheticsEnv(visualize=False)
+        model_3d = env.osim_model
+        env.change_model(model='2D', prosthetic=False)
+        env.reset()
+        self.assertFalse(env.osim_model is model_3d)
+        env.change_model(model='3D', prosthetic=True)
+        self.assertTrue(env.osim_model is model_3d)
+        env.reset()
+        env.step([0.5] * env.osim_model.get_action_space_size())
+        self.assertEqual(env.model_cache.stats()["hits"], 1)
+
+        env = ProstheticsEnv(visualize=False, model_cache=0)
+        model_3d = env.osim_model
+        env.change_model(model='2D', prosthetic=False)
+        env.change_model(model='3D', prosthetic=True)
+        self.assertFalse(env.osim_model is model_3d)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,5 +20,103 @@ class SimulationTest(unittest.TestCase):
         v[1] = -0.5
         observation, reward, done, info = env.step(v)
 
+    def test_reset_same_observation(self):
+        env = L2RunEnv(visualize=False)
+        first = env.reset()
+        for i in range(5):
+            env.step(env.action_space.sample())
+        self.assertEqual(env.reset(), first)
+
+        env.osim_model.cache_initial_state = False
+        env.memoize_reset_observation = False
+        self.assertTrue(np.allclose(env.reset(), first))
+
+    def test_set_strength_between_resets(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+        state0 = env.osim_model.state0
+        memo = env.reset_observation
+
+        env.osim_model.set_strength(np.full(env.osim_model.noutput, 0.5))
+        self.assertIsNone(env.osim_model.state0)
+        env.reset()
+        # The initial state and the reset observation are computed again, for the weaker muscles
+        self.assertIsNotNone(env.osim_model.state0)
+        self.assertIsNot(env.osim_model.state0, state0)
+        self.assertIsNot(env.reset_observation, memo)
+        muscle = env.osim_model.muscleSet.get(0)
+        self.assertAlmostEqual(muscle.getMaxIsometricForce(), 0.5 * env.osim_model.maxforces[0])
+
+        state0 = env.osim_model.state0
+        env.reset()
+        self.assertIs(env.osim_model.state0, state0)
+
+    def test_frame_skip(self):
+        env = L2RunEnv(visualize=False, frame_skip=3)
+        env.reset()
+        env.spec.timestep_limit = 10
+        for i in range(3):
+            observation, reward, done, info = env.step([0.5] * 18)
+            self.assertEqual(env.osim_model.istep, 3 * (i + 1))
+        observation, reward, done, info = env.step([0.5] * 18)
+        self.assertEqual(env.osim_model.istep, 10)
+        self.assertTrue(done)
+
+    def test_step_budget(self):
+        env = L2RunEnv(visualize=False, slow_step_time=0)
+        env.reset()
+        observation, reward, done, info = env.step([0.5] * 18)
+        self.assertTrue(done)
+        self.assertEqual(info["budget_exceeded"], "wall_time")
+        self.assertEqual(env.osim_model.budget_counters["wall_time"], 1)
+
+        env.osim_model.set_step_budget(slow_step_time=10)
+        env.reset()
+        observation, reward, done, info = env.step([0.5] * 18)
+        self.assertFalse(done)
+        self.assertNotIn("budget_exceeded", info)
+        self.assertEqual(env.osim_model.budget_counters["steps"], 2)
+
+        env.osim_model.set_step_budget(max_internal_steps=1)
+        env.reset()
+        observation, reward, done, info = env.step([0.5] * 18)
+        self.assertTrue(done)
+        self.assertEqual(info["budget_exceeded"], "internal_steps")
+        self.assertEqual(env.osim_model.manager_internal_step_limit, 1)
+
+        # Removing the budget removes the limit from the current manager
+        env.osim_model.set_step_budget()
+        self.assertEqual(env.osim_model.manager_internal_step_limit, None)
+
+    def test_step_budget_restores_integrator_limit(self):
+        env = L2RunEnv(visualize=False, integrator_internal_step_limit=50, max_internal_steps=1)
+        env.reset()
+        env.step([0.5] * 18)
+        self.assertEqual(env.osim_model.manager_internal_step_limit, 1)
+        env.osim_model.set_step_budget()
+        self.assertEqual(env.osim_model.manager_internal_step_limit, 50)
+
+    def test_generous_budget_same_trajectory(self):
+        actions = np.random.RandomState(0).uniform(size=(20, 18))
+        trajectories = []
+        for budget in [{}, {"slow_step_time": 100, "max_internal_steps": 100000}]:
+            env = L2RunEnv(visualize=False, **budget)
+            env.reset()
+            trajectories.append([env.step(action)[:3] for action in actions])
+            self.assertEqual(env.osim_model.budget_counters["wall_time"] + env.osim_model.budget_counters["internal_steps"], 0)
+        for unbudgeted, budgeted in zip(*trajectories):
+            self.assertEqual(list(unbudgeted[0]), list(budgeted[0]))
+            self.assertEqual(unbudgeted[1:], budgeted[1:])
+
+    def test_integrator_stats(self):
+        env = L2RunEnv(visualize=False, integrator_stats=True)
+        env.reset()
+        observation, reward, done, info = env.step([0.5] * 18)
+        stats = info["integrator_stats"]
+        self.assertGreater(stats.steps, 0)
+        self.assertGreater(stats.step_size, 0)
+        self.assertGreaterEqual(stats.failed_steps, 0)
+        self.assertEqual((stats + stats).steps, 2 * stats.steps)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+from osim.env import L2RunEnv
+from osim.env.history import RingBuffer
+import numpy as np
+import unittest
+
+class HistoryTest(unittest.TestCase):
+    def test_ring_buffer(self):
+        buffer = RingBuffer(3, 2)
+        buffer.fill([0, 0])
+        for i in range(1, 5):
+            buffer.push([i, -i])
+        self.assertTrue(np.array_equal(buffer.last()[:, 0], [2, 3, 4]))
+        self.assertTrue(np.array_equal(buffer.last(2)[:, 0], [3, 4]))
+        self.assertEqual(buffer.get(0)[0], 4)
+        self.assertEqual(buffer.get(2)[0], 2)
+        self.assertRaises(IndexError, buffer.get, 3)
+        # No copy
+        self.assertTrue(buffer.last().base is buffer.data)
+
+    def test_frame_stack(self):
+        env = L2RunEnv(visualize=False, frame_stack=4)
+        size = env.get_observation_space_size()
+        self.assertEqual(env.observation_space.shape[0], 4 * size)
+
+        observation = env.reset()
+        self.assertEqual(len(observation), 4 * size)
+        self.assertTrue(np.array_equal(observation[:size], observation[-size:]))
+
+        first = observation[-size:].copy()
+        observation, reward, done, info = env.step([0.5] * 18)
+        self.assertTrue(np.array_equal(observation[-2 * size:-size], first))
+        self.assertTrue(np.allclose(observation[-size:], env.get_observation()))
+
+    def test_state_history(self):
+        self.assertRaises(ValueError, L2RunEnv, visualize=False, state_history_size=2)
+
+        env = L2RunEnv(visualize=False, flat_state=True, state_history_size=3)
+        env.reset()
+        for i in range(3):
+            env.step([0.5] * 18)
+        index = env.osim_model.state_index["joint_pos/ground_pelvis"]
+        self.assertTrue(np.array_equal(env.state_history.get(0)[index], env.get_state_desc()["joint_pos"]["ground_pelvis"]))
+        self.assertTrue(np.array_equal(env.state_history.get(1)[index], env.get_prev_state_desc()["joint_pos"]["ground_pelvis"]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+from osim.redis import messages
+import asyncio
+import os
+import signal
+import unittest
+import numpy as np
+
+try:
+    from aiohttp.test_utils import TestClient, TestServer
+    from osim.http.server import EnvServer
+except ImportError:
+    TestClient = None
+
+def encode(data, encoding):
+    if encoding == messages.JSON:
+        return messages.encode(data), "application/json"
+    return messages.encode(data, encoding), "application/x-osim-rl"
+
+@unittest.skipIf(TestClient is None, "requires aiohttp")
+class EnvServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = EnvServer(workers = 1)
+        self.client = TestClient(TestServer(self.server.app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def post(self, route, data, encoding = messages.JSON):
+        body, content_type = encode(data, encoding)
+        response = await self.client.post(route, data = body, headers = {"Content-Type": content_type})
+        result, _ = messages.decode(await response.read())
+        return response.status, result
+
+    async def test_episode(self):
+        for encoding in [messages.JSON, messages.BINARY]:
+            status, result = await self.post("/v1/envs/", {"env_id": "Run"}, encoding)
+            self.assertEqual(status, 200)
+            instance = "/v1/envs/{}/".format(result["instance_id"])
+
+            status, result = await self.post(instance + "reset/", {}, encoding)
+            self.assertEqual(len(result["observation"]), 41)
+            status, result = await self.post(instance + "step/", {"action": np.full(18, 0.5)}, encoding)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(result["observation"]), 41)
+            self.assertIsInstance(result["reward"], float)
+            if encoding != messages.JSON:
+                self.assertIsInstance(result["observation"], np.ndarray)
+
+            status, result = await self.post(instance + "close/", {}, encoding)
+            self.assertEqual(status, 200)
+            status, result = await self.post(instance + "step/", {"action": np.full(18, 0.5)}, encoding)
+            self.assertEqual(status, 400)
+            self.assertIn("unknown", result["message"])
+
+    async def test_error_message(self):
+        status, result = await self.post("/v1/envs/", {"env_id": "Run"})
+        instance = "/v1/envs/{}/".format(result["instance_id"])
+        status, result = await self.post(instance + "step/", {"action": "not an action"})
+        self.assertEqual(status, 400)
+        self.assertNotIn("Traceback", result["message"])
+
+    async def test_worker_exited(self):
+        status, result = await self.post("/v1/envs/", {"env_id": "Run"})
+        instance = "/v1/envs/{}/".format(result["instance_id"])
+        process = self.server.processes[0]
+        os.kill(process.pid, signal.SIGKILL)
+        for i in range(100):
+            if self.server.processes[0] is not process:
+                break
+            await asyncio.sleep(0.05)
+
+        status, result = await self.post(instance + "reset/", {})
+        self.assertEqual(status, 500)
+        self.assertIn("exited", result["message"])
+        status, result = await self.post(instance + "close/", {})
+        self.assertEqual(status, 200)
+
+        # Served by the new worker
+        status, result = await self.post("/v1/envs/", {"env_id": "Run"})
+        self.assertEqual(status, 200)
+        status, result = await self.post("/v1/envs/{}/reset/".format(result["instance_id"]), {})
+        self.assertEqual(len(result["observation"]), 41)
+
+if __name__ == '__main__':
+    unittest.main()
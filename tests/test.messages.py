@@ -0,0 +1,23 @@
+from osim.redis import messages
+import numpy as np
+import unittest
+
+class MessagesTest(unittest.TestCase):
+    def test_encodings(self):
+        message = {"type": messages.OSIM_RL.ENV_STEP_RESPONSE,
+                   "payload": {"observation": np.arange(5, dtype=np.float64) / 3, "reward": 1.5, "done": False,
+                               "info": {"x": [np.float64(2.0)]}}}
+        for encoding in messages.ENCODINGS:
+            decoded, decoded_encoding = messages.decode(messages.encode(message, encoding))
+            self.assertEqual(decoded_encoding, encoding)
+            self.assertEqual(decoded["payload"]["reward"], 1.5)
+            self.assertEqual(decoded["payload"]["info"], {"x": [2.0]})
+            self.assertTrue(np.allclose(decoded["payload"]["observation"], message["payload"]["observation"]))
+        self.assertEqual(messages.decode(messages.encode(message, messages.BINARY))[0]["payload"]["observation"].dtype, np.float64)
+
+    def test_negotiate(self):
+        self.assertEqual(messages.negotiate(["msgpack", messages.BINARY32, messages.JSON]), messages.BINARY32)
+        self.assertEqual(messages.negotiate(None), messages.JSON)
+
+if __name__ == '__main__':
+    unittest.main()
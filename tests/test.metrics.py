@@ -0,0 +1,42 @@
+from osim.redis import messages
+from osim.redis.metrics import ServiceMetrics, LatencyHistogram
+import pickle
+import unittest
+
+class MetricsTest(unittest.TestCase):
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        for seconds in [0.0002] * 98 + [0.3, 20]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.quantile(0.5), 0.00025)
+        self.assertEqual(histogram.quantile(0.99), 0.5)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+
+    def test_service_metrics(self):
+        step = {"type": messages.OSIM_RL.ENV_STEP}
+        metrics = ServiceMetrics()
+        metrics.observe(step, "simulate", 0.002)
+        metrics.observe(step, "encode", 0.0001)
+        metrics.observe({"type": "garbage"}, "decode", 0.0001)
+
+        # Sent by the workers to the dispatcher
+        worker = pickle.loads(pickle.dumps(metrics))
+        metrics.merge(worker)
+        metrics.update(queue_depth = 3, sessions = 2, worker_queue_depths = [1, 2])
+
+        values = metrics.as_dict()
+        self.assertEqual(values["steps"], 2)
+        self.assertEqual(values["queue_depth"], 3)
+        self.assertEqual(values["queue_depth.worker1"], 2)
+        self.assertEqual(values["ENV_STEP.simulate.count"], 2)
+        self.assertEqual(values["ENV_STEP.simulate.p99_ms"], 2.5)
+        self.assertEqual(values["UNKNOWN.decode.count"], 2)
+
+        text = metrics.prometheus()
+        self.assertIn('osim_rl_command_seconds_bucket{command="ENV_STEP",phase="simulate",le="+Inf"} 2', text)
+        self.assertIn('osim_rl_command_queue_depth 3', text)
+        self.assertIn('osim_rl_worker_queue_depth{worker="0"} 1', text)
+
+if __name__ == '__main__':
+    unittest.main()
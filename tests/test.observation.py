@@ -0,0 +1,52 @@
+from osim.env import L2RunEnv, ProstheticsEnv, Arm2DEnv
+import numpy as np
+import unittest
+
+class ObservationSpecTest(unittest.TestCase):
+    def check_same_observations(self, make_env):
+        envs = [make_env(flat_state=False), make_env(flat_state=True)]
+        observations = [env.reset() for env in envs]
+        self.assertTrue(np.allclose(observations[0], observations[1]))
+        for i in range(3):
+            action = np.random.uniform(size=envs[0].action_space.shape[0])
+            observations = [env.step(action)[0] for env in envs]
+            self.assertTrue(np.allclose(observations[0], observations[1]))
+            self.assertEqual(len(observations[1]), len(observations[0]))
+        self.assertEqual(len(envs[0].get_observation_names()), len(observations[0]))
+
+    def test_l2run(self):
+        self.check_same_observations(lambda **kwargs: L2RunEnv(visualize=False, **kwargs))
+
+    def test_prosthetics(self):
+        for model in ["3D", "2D"]:
+            for prosthetic in [True, False]:
+                def make_env(**kwargs):
+                    env = ProstheticsEnv(visualize=False, **kwargs)
+                    env.change_model(model=model, prosthetic=prosthetic)
+                    return env
+                self.check_same_observations(make_env)
+
+    def test_arm(self):
+        np.random.seed(0)
+        env = Arm2DEnv(visualize=False, flat_state=True)
+        env.reset()
+        observation = env.step([0.5] * 6)[0]
+        self.assertEqual(list(observation[:2]), [env.target_x, env.target_y])
+        self.assertEqual(env.get_observation_names()[2], "joint_pos/r_shoulder/0")
+
+    def test_observation_dtype(self):
+        env = ProstheticsEnv(visualize=False, observation_dtype="float32")
+        observation = env.reset()
+        self.assertEqual(observation.dtype, np.float32)
+        self.assertTrue(np.allclose(observation, env.get_observation()))
+        next_observation = env.step([0.5] * env.action_space.shape[0])[0]
+        self.assertTrue(next_observation is observation)
+
+        out = np.zeros((2, len(observation)), dtype=np.float32)
+        env.reset(out=out[0])
+        env.step([0.5] * env.action_space.shape[0], out=out[1])
+        self.assertTrue(np.allclose(out[1], env.get_observation()))
+        self.assertFalse(np.allclose(out[0], out[1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+from osim.env import L2RunEnv
+from osim.env.profiler import StepProfiler
+import json
+import os
+import tempfile
+import unittest
+
+class ProfilerTest(unittest.TestCase):
+    def test_timing(self):
+        env = L2RunEnv(visualize=False, profile=StepProfiler(trace=True))
+        env.reset()
+        for i in range(10):
+            observation, reward, done, info = env.step([0.5] * 18)
+
+        for phase in ["actuate", "integrate", "state_desc", "get_observation", "reward", "is_done", "step"]:
+            self.assertTrue(phase in info["timing"])
+        percentiles = env.profiler.percentiles()
+        self.assertEqual(percentiles["integrate"]["count"], 10)
+        self.assertTrue(percentiles["step"]["p50"] <= percentiles["step"]["p99"])
+
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        env.profiler.dump_chrome_trace(path)
+        with open(path) as f:
+            self.assertTrue(len(json.load(f)["traceEvents"]) > 0)
+
+    def test_no_trace(self):
+        env = L2RunEnv(visualize=False, profile=True)
+        env.reset()
+        env.step([0.5] * 18)
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        self.assertRaises(ValueError, env.profiler.dump_chrome_trace, path)
+        self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
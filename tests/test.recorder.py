@@ -0,0 +1,66 @@
+from osim.env import L2RunEnv
+from osim.env.recorder import TrajectoryRecorder, Trajectories
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_recorder(self):
+        recorder = TrajectoryRecorder(self.directory, chunk_size = 4, dtype = np.float64)
+        for episode in range(3):
+            recorder.reset([episode, 0.0])
+            for i in range(5 + episode):
+                recorder.record([i], [episode, i], 0.5 * i, i == 4 + episode, state = [1.0, 2.0, 3.0])
+        # An episode which is not over
+        recorder.reset([3, 0.0])
+        recorder.record([0], [3, 0], 0.0, False, state = [1.0, 2.0, 3.0])
+        recorder.flush()
+
+        trajectories = Trajectories(self.directory)
+        self.assertEqual(len(trajectories), 3)
+        self.assertEqual(len(trajectories.rewards), 19)
+        self.assertTrue(isinstance(trajectories.observations, np.memmap))
+        episode = trajectories.episode(2)
+        self.assertTrue(np.array_equal(episode["reset_observation"], [2, 0]))
+        self.assertTrue(np.array_equal(episode["observations"][:, 1], np.arange(7)))
+        self.assertTrue(np.array_equal(episode["dones"], [False] * 6 + [True]))
+        self.assertEqual(episode["states"].shape, (7, 3))
+
+        # Appending to existing trajectories, after the last episode
+        recorder.close()
+        recorder = TrajectoryRecorder(self.directory, dtype = np.float64)
+        recorder.reset([4, 0.0])
+        recorder.record([0], [4, 0], 1.0, True, state = [1.0, 2.0, 3.0])
+        recorder.close()
+        trajectories = Trajectories(self.directory)
+        self.assertEqual(len(trajectories), 5)
+        self.assertTrue(np.array_equal(trajectories.episodes[3:], [[18, 19], [19, 20]]))
+        self.assertTrue(np.array_equal(trajectories.reset_observations[4], [4, 0]))
+
+    def test_env(self):
+        directory = os.path.join(self.directory, "env")
+        env = L2RunEnv(visualize = False, recorder = directory)
+        observation = env.reset()
+        for i in range(3):
+            last, reward, done, info = env.step([0.5] * 18)
+        env.reset()
+        env.close()
+
+        trajectories = Trajectories(directory)
+        self.assertEqual(len(trajectories), 1)
+        episode = trajectories.episode(0)
+        self.assertTrue(np.allclose(episode["reset_observation"], observation, atol = 1e-6))
+        self.assertTrue(np.allclose(episode["observations"][-1], last, atol = 1e-6))
+        self.assertTrue(np.allclose(episode["actions"], 0.5))
+        self.assertEqual(trajectories.states.shape, (3, len(env.osim_model.get_y())))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+from osim.redis import messages
+from osim.redis import service
+from osim.redis.client import Client
+import json
+import multiprocessing
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+class FakeEnv(object):
+    """
+    Episodes of 3 steps. An action starting with -1 kills the worker.
+    """
+    def reset(self, seed = None, difficulty = None):
+        self.steps = 0
+        return [0.0] * 41
+
+    def step(self, action):
+        if action[0] == -1:
+            os._exit(1)
+        self.steps += 1
+        return [float(self.steps)] * 41, 1.0, self.steps == 3, {}
+
+    def close(self):
+        pass
+
+def episodes(client):
+    client.env_create()
+    while True:
+        observation, reward, done, info = client.env_step([0.5] * 18)
+        if done and not client.env_reset():
+            break
+    return client.submit()
+
+@unittest.skipIf(fakeredis is None, "requires fakeredis")
+class ServeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+        cls.port = cls.server.server_address[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.object(service.OsimRlSession, "create_env", lambda session: FakeEnv())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def serve(self, sessions, **kwargs):
+        kwargs.setdefault("metrics_interval", None)
+        grader = service.OsimRlRedisService(remote_port=self.port, seed_map="1,2", max_steps=10, **kwargs)
+        results = {}
+        thread = threading.Thread(target=lambda: results.update(grader.serve(sessions)))
+        thread.start()
+        # Clients start once the workers are forked, so that these don't
+        # inherit locks (e.g. of imports) held by the threads of the clients
+        while len(multiprocessing.active_children()) < grader.workers:
+            time.sleep(0.01)
+        return grader, thread, results
+
+    def client(self):
+        return Client(remote_port=self.port)
+
+    def test_concurrent_sessions(self):
+        grader, thread, results = self.serve(2, workers=2)
+        clients = [self.client(), self.client()]
+        submitted = [None, None]
+        def run(i):
+            submitted[i] = episodes(clients[i])
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        thread.join(30)
+
+        self.assertEqual([result["simulation_rewards"] for result in submitted], [[3.0, 3.0]] * 2)
+        self.assertEqual(sorted(results), sorted(client.session_id for client in clients))
+        self.assertTrue(all(result["type"] == messages.OSIM_RL.ENV_SUBMIT_RESPONSE for result in results.values()))
+
+    def test_queue_depth(self):
+        grader, thread, results = self.serve(1, workers=2, metrics_interval=0.1)
+        client = self.client()
+        client.env_create()
+        # Commands in flight are waiting in the worker of the session
+        sequences = [client.env_step_async([0.5] * 18) for i in range(2)]
+        [client.env_step_wait(sequence) for sequence in sequences]
+        client.env_reset()
+        client.submit()
+        thread.join(30)
+
+        metrics = grader.get_redis_connection().hgetall(grader.metrics_key)
+        self.assertEqual(int(metrics[b"queue_depth"]), 0)
+        self.assertEqual([int(metrics[b"queue_depth.worker0"]), int(metrics[b"queue_depth.worker1"])], [0, 0])
+        self.assertGreaterEqual(int(metrics[b"ENV_STEP.simulate.count"]), 2)
+
+    def test_queue_depth_session_over(self):
+        # A slow ENV_CREATE, so that the next commands are dispatched before
+        # the session is over: these are answered after it and still counted
+        reset = FakeEnv.reset
+        def slow_reset(env, seed = None, difficulty = None):
+            time.sleep(0.5)
+            return reset(env, seed, difficulty)
+        with mock.patch.object(FakeEnv, "reset", slow_reset):
+            grader, thread, results = self.serve(2, workers=2, metrics_interval=0.1)
+        client = self.client()
+        sequences = [client.send_request({"type": messages.OSIM_RL.ENV_CREATE, "payload": {}}) for i in range(2)]
+        sequences += [client.env_step_async([0.5] * 18) for i in range(2)]
+        client.get_response(sequences[0])
+        for sequence in sequences[1:]:
+            self.assertRaises(Exception, client.get_response, sequence)
+
+        self.assertEqual(episodes(self.client())["simulation_rewards"], [3.0, 3.0])
+        thread.join(30)
+        metrics = grader.get_redis_connection().hgetall(grader.metrics_key)
+        self.assertEqual(int(metrics[b"queue_depth"]), 0)
+
+    def test_malformed_command(self):
+        grader, thread, results = self.serve(1)
+        _redis = grader.get_redis_connection()
+        channel = "osim-rl::test::malformed"
+        _redis.lpush(grader.command_channel, b"not a command")
+        _redis.lpush(grader.command_channel, json.dumps({"payload": {}}))
+        _redis.lpush(grader.command_channel, json.dumps({"payload": {}, "response_channel": channel, "sequence": 7}))
+        response, encoding = messages.decode(_redis.blpop(channel, timeout=10)[1])
+        self.assertEqual(response["type"], messages.OSIM_RL.ERROR)
+        self.assertIn("type", response["payload"])
+        self.assertEqual(response["sequence"], 7)
+
+        # The service is still up
+        self.assertEqual(episodes(self.client())["simulation_rewards"], [3.0, 3.0])
+        thread.join(30)
+        self.assertEqual(len(results), 1)
+
+    def test_worker_killed(self):
+        grader, thread, results = self.serve(2)
+        client = self.client()
+        client.env_create()
+        client.env_step([0.5] * 18)
+        with self.assertRaises(Exception) as error:
+            client.env_step([-1] * 18)
+        self.assertIn("Worker exited", str(error.exception))
+
+        # The worker was restarted
+        self.assertEqual(episodes(self.client())["simulation_rewards"], [3.0, 3.0])
+        thread.join(30)
+        self.assertEqual(results[client.session_id]["type"], messages.OSIM_RL.ERROR)
+
+    def test_session_timeout(self):
+        grader, thread, results = self.serve(1, session_timeout=1)
+        client = self.client()
+        client.env_create()
+        thread.join(30)
+        self.assertIn("Timeout", results[client.session_id]["payload"])
+
+if __name__ == '__main__':
+    unittest.main()
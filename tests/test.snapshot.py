@@ -0,0 +1,27 @@
+from osim.env import L2RunEnv
+import numpy as np
+import unittest
+
+class SnapshotTest(unittest.TestCase):
+    def test_restore(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+        actions = [np.random.uniform(size=18) for i in range(10)]
+
+        for action in actions[:3]:
+            env.step(action)
+        snapshot = env.osim_model.snapshot()
+
+        for action in actions[3:]:
+            observation, reward, done, info = env.step(action)
+
+        for i in range(3):
+            env.osim_model.restore_snapshot(snapshot)
+            self.assertEqual(env.osim_model.istep, 3)
+            for action in actions[3:]:
+                restored_observation, restored_reward, done, info = env.step(action)
+            self.assertTrue(np.allclose(observation, restored_observation))
+            self.assertAlmostEqual(reward, restored_reward)
+
+if __name__ == '__main__':
+    unittest.main()
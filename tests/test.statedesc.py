@@ -0,0 +1,87 @@
+from osim.env import L2RunEnv
+import json
+import numpy as np
+import unittest
+
+class StateDescTest(unittest.TestCase):
+    def test_lazy_matches_eager(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+        for i in range(5):
+            env.step([0.5] * 18)
+
+        lazy = env.get_state_desc()
+        eager = env.osim_model.compute_state_desc()
+        for group in ["joint_pos", "joint_vel", "joint_acc", "body_pos", "body_vel", "body_acc"]:
+            for name in eager[group]:
+                self.assertTrue(np.allclose(lazy[group][name], eager[group][name]))
+        self.assertTrue(np.allclose(lazy["misc"]["mass_center_pos"], eager["misc"]["mass_center_pos"]))
+
+    def test_prev_state_desc_frozen(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+        env.step([0.5] * 18)
+        env.step([0.5] * 18)
+
+        # Only the fields declared by the environment are kept
+        prev_state_desc = env.get_prev_state_desc()
+        self.assertTrue("joint_pos" in prev_state_desc)
+        self.assertTrue("mass_center_pos" in prev_state_desc["misc"])
+        self.assertFalse("forces" in prev_state_desc)
+        self.assertRaises(KeyError, lambda: prev_state_desc["forces"])
+
+        # Subclasses reading more from the previous state widen the list
+        class AllFieldsEnv(L2RunEnv):
+            state_desc_fields = None
+        env = AllFieldsEnv(visualize=False)
+        env.reset()
+        env.step([0.5] * 18)
+        env.step([0.5] * 18)
+        prev_state_desc = env.get_prev_state_desc()
+        self.assertTrue("forces" in prev_state_desc)
+        self.assertTrue("markers" in prev_state_desc)
+
+    def test_compute_state_desc(self):
+        env = L2RunEnv(visualize=False, flat_state=True)
+        env.reset()
+        for i in range(3):
+            env.step([0.5] * 18)
+
+        prev_vector = env.get_prev_state_desc().vector.copy()
+        vector = env.get_state_desc().vector.copy()
+        state_desc = env.osim_model.compute_state_desc()
+        self.assertTrue(np.array_equal(env.get_prev_state_desc().vector, prev_vector, equal_nan=True))
+        self.assertTrue(np.array_equal(env.get_state_desc().vector, vector, equal_nan=True))
+        self.assertFalse(np.any(np.isnan(state_desc.vector)))
+        index = env.osim_model.state_index["body_pos/pelvis"]
+        self.assertTrue(np.allclose(state_desc.vector[index], env.get_state_desc()["body_pos"]["pelvis"]))
+
+    def test_iterate(self):
+        env = L2RunEnv(visualize=False)
+        env.reset()
+        env.step([0.5] * 18)
+        state_desc = env.get_state_desc()
+        groups = ["joint_pos", "joint_vel", "joint_acc", "body_pos", "body_vel", "body_acc",
+                  "body_pos_rot", "body_vel_rot", "body_acc_rot", "forces", "muscles", "markers", "misc"]
+        self.assertEqual(sorted(state_desc.keys()), sorted(groups))
+        self.assertEqual(sorted(dict(state_desc)), sorted(groups))
+        self.assertEqual(sorted(json.loads(json.dumps(state_desc))["misc"]), ["mass_center_acc", "mass_center_pos", "mass_center_vel"])
+
+    def test_flat_state(self):
+        env = L2RunEnv(visualize=False, flat_state=True)
+        env.reset()
+        for i in range(3):
+            env.step([0.5] * 18)
+
+        state_desc = env.get_state_desc().materialize()
+        vector = env.osim_model.get_state_vector()
+        index = env.osim_model.state_index
+        self.assertFalse(np.any(np.isnan(vector)))
+        self.assertTrue(np.allclose(vector[index["body_pos/pelvis"]], state_desc["body_pos"]["pelvis"]))
+        self.assertEqual(vector[index["misc/mass_center_pos"]].shape, (2,))
+
+        prev_vector = env.get_prev_state_desc().vector
+        self.assertFalse(prev_vector is vector)
+
+if __name__ == '__main__':
+    unittest.main()
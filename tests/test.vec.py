@@ -0,0 +1,85 @@
+from osim.env import L2RunEnv, VecOsimEnv, OsimForkServer
+from functools import partial
+import numpy as np
+import unittest
+
+class FailingEnv(L2RunEnv):
+    """
+    Raises in step when the first excitation is negative.
+    """
+    def step(self, action, **kwargs):
+        if action[0] < 0:
+            raise ValueError("negative excitation")
+        return super(FailingEnv, self).step(action, **kwargs)
+
+class VecOsimEnvTest(unittest.TestCase):
+    def test_step(self):
+        env = VecOsimEnv([partial(L2RunEnv, visualize=False)] * 2)
+        observations = env.reset()
+        self.assertEqual(observations.shape, (2, 41))
+
+        for i in range(5):
+            actions = np.random.uniform(size=(2, 18))
+            observations, rewards, dones, infos = env.step(actions)
+        self.assertEqual(observations.shape, (2, 41))
+        self.assertEqual(rewards.shape, (2,))
+        self.assertEqual(len(infos), 2)
+        self.assertEqual(env.get_attr("time_limit"), [1000, 1000])
+        env.close()
+
+    def test_error_in_worker(self):
+        env = VecOsimEnv([partial(FailingEnv, visualize=False)] * 3)
+        env.reset()
+        actions = np.full((3, 18), 0.5)
+        actions[1, 0] = -1
+        self.assertRaises(Exception, env.step, actions)
+
+        # The replies of the other workers were read, the pool is in sync
+        env.restart_worker(1)
+        observations = env.reset()
+        self.assertEqual(env.get_attr("time_limit"), [1000, 1000, 1000])
+        observations, rewards, dones, infos = env.step(np.full((3, 18), 0.5))
+        self.assertTrue(np.allclose(observations[0], observations[1]))
+        self.assertEqual(len(infos), 3)
+        env.close()
+
+    def test_same_as_single_env(self):
+        single = L2RunEnv(visualize=False)
+        single.reset()
+        env = VecOsimEnv([partial(L2RunEnv, visualize=False)])
+        env.reset()
+
+        action = [0.5] * 18
+        for i in range(3):
+            observation, reward, done, info = single.step(action)
+            observations, rewards, dones, infos = env.step([action])
+        self.assertTrue(np.allclose(observation, observations[0]))
+        self.assertAlmostEqual(reward, rewards[0])
+        env.close()
+
+    def test_fork_server(self):
+        server = OsimForkServer({"L2Run": partial(L2RunEnv, visualize=False)})
+        env = server.make_vec_env(["L2Run"] * 2)
+        observations = env.reset()
+        self.assertEqual(observations.shape, (2, 41))
+
+        env.restart_worker(1)
+        env.reset()
+        observations, rewards, dones, infos = env.step(np.random.uniform(size=(2, 18)))
+        self.assertEqual(observations.shape, (2, 41))
+        env.close()
+
+        # The template stays in the server, for the next pools
+        self.assertEqual(server.spaces["L2Run"][0].shape, (41,))
+        env = server.make_vec_env(["L2Run"])
+        single = L2RunEnv(visualize=False)
+        self.assertTrue(np.allclose(env.reset()[0], single.reset()))
+        action = [0.5] * 18
+        observations, rewards, dones, infos = env.step([action])
+        self.assertTrue(np.allclose(observations[0], single.step(action)[0]))
+        env.close()
+        server.close()
+        self.assertFalse(env.processes[0].is_alive())
+
+if __name__ == '__main__':
+    unittest.main()